@@ -15,11 +15,17 @@ from flask import Flask, request
 
 
 from .models import *
-from .extensions import ( db, admin, migrate, cors, login_manager )
+from .extensions import ( db, mail, admin, migrate, cors, login_manager )
 #from .utils.middleware import set_access_control_allows
+from .utils.middleware import CompressionMiddleware
 from .config import Config, configure_logging, config_by_name
 from .context_processors import my_context_Processor
+from .commands import register_commands
 from .utils.helpers.role_helpers import create_roles_and_super_admin
+from .utils.helpers.product_helpers import render_product_card
+from .utils.unit_of_work import db_batch
+from .utils.assets import init_assets
+from .utils.images import init_images
 
 def create_app(config_name=Config.ENV):
     """
@@ -39,9 +45,13 @@ def create_app(config_name=Config.ENV):
         PREFERRED_URL_SCHEME='http'
     )
     app.context_processor(my_context_Processor)
+    app.add_template_global(render_product_card)
+    init_assets(app) # hashed, precompressed static files from `flask assets build`
+    init_images(app) # responsive image variants, `flask images build`
 
     # Initialize Flask extensions here
     db.init_app(app)
+    mail.init_app(app)
     admin.init_app(app)
     migrate.init_app(app)
     cors.init_app(app) # Set up CORS. Allow '*' for origins.
@@ -52,11 +62,20 @@ def create_app(config_name=Config.ENV):
     
     @login_manager.user_loader
     def load_user(user_id):
-        return AppUser.query.get(int(user_id))
+        user = db.session.get(AppUser, int(user_id))
+        return user if user is not None and user.is_active else None # deactivated users are logged out
 
     
     add_admin_views()
     
+    app.wsgi_app = CompressionMiddleware(
+        app.wsgi_app,
+        min_size=app.config['COMPRESS_MIN_SIZE'],
+        mimetypes=app.config['COMPRESS_MIMETYPES'],
+        level=app.config['COMPRESS_LEVEL'],
+        brotli_quality=app.config['COMPRESS_BR_QUALITY'],
+    )
+    
     # Use the after_request decorator to set Access-Control-Allow
     #app.after_request(set_access_control_allows)
     
@@ -75,7 +94,10 @@ def create_app(config_name=Config.ENV):
     from .core.routes.cpanel import cpanel_bp
     app.register_blueprint(cpanel_bp)
     
-    with app.app_context():
+    # Register CLI commands
+    register_commands(app)
+    
+    with app.app_context(), db_batch():
         create_roles_and_super_admin()  # Create roles for BitnShop
         create_nav_items(True)
     
@@ -0,0 +1,30 @@
+"""
+This package contains the `flask` CLI commands for the BitnShop Flask application.
+
+Author: Emmanuel Olowu
+Link: https://github.com/zeddyemy
+Copyright: © 2024 Emmanuel Olowu <zeddyemy@gmail.com>
+License: MIT, see LICENSE for more details.
+Package: BitnShop
+"""
+
+from .products import products_cli
+from .catalog import recount_command
+from .assets import assets_cli
+from .images import images_cli
+from .mail import mail_cli
+from .broadcast import broadcast_cli
+from .otp import otp_cli
+from .worker import worker_command
+from .users import users_cli
+
+def register_commands(app) -> None:
+    app.cli.add_command(products_cli)
+    app.cli.add_command(recount_command)
+    app.cli.add_command(assets_cli)
+    app.cli.add_command(images_cli)
+    app.cli.add_command(mail_cli)
+    app.cli.add_command(broadcast_cli)
+    app.cli.add_command(otp_cli)
+    app.cli.add_command(worker_command)
+    app.cli.add_command(users_cli)
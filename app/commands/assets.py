@@ -0,0 +1,27 @@
+"""
+Static asset commands, e.g. `flask assets build`
+
+Author: Emmanuel Olowu
+Link: https://github.com/zeddyemy
+Copyright: © 2024 Emmanuel Olowu <zeddyemy@gmail.com>
+License: MIT, see LICENSE for more details.
+Package: BitnShop
+"""
+import click
+from flask import current_app
+from flask.cli import AppGroup
+
+from ..utils.assets import build_assets, brotli, BUILD_DIR
+
+
+assets_cli = AppGroup('assets', help='Build fingerprinted static assets.')
+
+
+@assets_cli.command('build')
+def build_command():
+    """Write content-hashed copies of the static files (plus .gz/.br) and their manifest."""
+    manifest = build_assets(current_app.static_folder)
+    click.echo(f'{len(manifest)} static files written to {BUILD_DIR}/.')
+    if brotli is None:
+        click.echo('brotli is not installed, only .gz variants were written.')
+    click.echo('Restart the app to serve the new build.')
@@ -0,0 +1,92 @@
+"""
+Broadcast commands, e.g. `flask broadcast create` and `flask broadcast send`
+
+Author: Emmanuel Olowu
+Link: https://github.com/zeddyemy
+Copyright: © 2024 Emmanuel Olowu <zeddyemy@gmail.com>
+License: MIT, see LICENSE for more details.
+Package: BitnShop
+"""
+import click
+from flask import current_app
+from flask.cli import AppGroup
+
+from ..extensions import db
+from ..models import Broadcast, BroadcastStatus
+from ..utils.broadcast import run_broadcast, count_segment, segment_filters
+from ..utils.mail_pool import SMTPConnection, smtp_settings
+
+
+broadcast_cli = AppGroup('broadcast', help='Email a segment of the users.')
+
+
+def _get_broadcast(broadcast_id) -> Broadcast:
+    broadcast = db.session.get(Broadcast, broadcast_id)
+    if broadcast is None:
+        raise click.ClickException(f'Broadcast {broadcast_id} does not exist.')
+    return broadcast
+
+
+@broadcast_cli.command('create')
+@click.option('--subject', required=True)
+@click.option('--message', required=True, help='Plain text, blank lines separate paragraphs.')
+@click.option('--role', 'roles', multiple=True, help='Role name, e.g. Customer. Repeat for several roles.')
+@click.option('--joined-after', help='ISO date, e.g. 2024-01-01.')
+@click.option('--joined-before', help='ISO date.')
+@click.option('--country', 'countries', multiple=True, help='Address country. Repeat for several countries.')
+def create_command(subject, message, roles, joined_after, joined_before, countries):
+    """Create a broadcast and print how many users it will be sent to."""
+    segment = {key: value for key, value in {
+        'roles': list(roles), 'joined_after': joined_after, 'joined_before': joined_before, 'countries': list(countries),
+    }.items() if value}
+    try:
+        segment_filters(segment)
+    except ValueError as e:
+        raise click.BadParameter(str(e))
+    
+    broadcast = Broadcast(subject=subject, message=message, segment=segment)
+    db.session.add(broadcast)
+    db.session.commit()
+    click.echo(f'Broadcast {broadcast.id} created for {count_segment(segment)} users. Send it with `flask broadcast send {broadcast.id}`.')
+
+
+@broadcast_cli.command('send')
+@click.argument('broadcast_id', type=int)
+@click.option('--rate', type=float, default=None, help='Emails per second, defaults to BROADCAST_RATE. 0 for unlimited.')
+@click.option('--batch-size', default=500, show_default=True, help='Recipients loaded and checkpointed together.')
+def send_command(broadcast_id, rate, batch_size):
+    """Send (or resume) a broadcast."""
+    broadcast = _get_broadcast(broadcast_id)
+    rate = current_app.config['BROADCAST_RATE'] if rate is None else rate
+    
+    def progress(sent, failed, total):
+        click.echo(f'\r{sent + failed}/{total} processed, {failed} failed', nl=False)
+    
+    connection = SMTPConnection(**smtp_settings(current_app.config))
+    try:
+        status = run_broadcast(broadcast, connection, batch_size=batch_size, rate=rate, on_progress=progress)
+    except OSError as e:
+        raise click.ClickException(f'\nStopped, the progress is saved: {e}. Run the command again to resume.')
+    finally:
+        connection.close()
+    click.echo(f'\nBroadcast {broadcast_id} {status}.')
+
+
+@broadcast_cli.command('pause')
+@click.argument('broadcast_id', type=int)
+def pause_command(broadcast_id):
+    """Stop a broadcast after its current batch, `send` resumes it."""
+    broadcast = _get_broadcast(broadcast_id)
+    if broadcast.status == BroadcastStatus.COMPLETED.value:
+        raise click.ClickException(f'Broadcast {broadcast_id} is already completed.')
+    broadcast.status = BroadcastStatus.PAUSED.value
+    db.session.commit()
+    click.echo(f'Broadcast {broadcast_id} paused.')
+
+
+@broadcast_cli.command('list')
+def list_command():
+    """Show the broadcasts and their progress."""
+    for broadcast in Broadcast.query.order_by(Broadcast.id.desc()).limit(20):
+        click.echo(f'{broadcast.id:>5}  {broadcast.status:<10} {broadcast.sent_count + broadcast.failed_count}/{broadcast.total or "?"}'
+                   f' sent, {broadcast.failed_count} failed  {broadcast.subject}')
@@ -0,0 +1,19 @@
+"""
+Catalog maintenance commands, e.g. `flask recount`
+
+Author: Emmanuel Olowu
+Link: https://github.com/zeddyemy
+Copyright: © 2024 Emmanuel Olowu <zeddyemy@gmail.com>
+License: MIT, see LICENSE for more details.
+Package: BitnShop
+"""
+import click
+
+from ..utils.helpers.category_helpers import recount_category_counters
+
+
+@click.command('recount')
+def recount_command():
+    """Recompute the per-category published product counters."""
+    recount_category_counters()
+    click.echo('Category product counters recomputed.')
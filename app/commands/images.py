@@ -0,0 +1,43 @@
+"""
+Image commands, e.g. `flask images build`
+
+Author: Emmanuel Olowu
+Link: https://github.com/zeddyemy
+Copyright: © 2024 Emmanuel Olowu <zeddyemy@gmail.com>
+License: MIT, see LICENSE for more details.
+Package: BitnShop
+"""
+import click
+from flask import current_app
+from flask.cli import AppGroup
+
+from ..models import Media
+from ..utils.images import build_static_images, create_media_variants, Image
+
+
+images_cli = AppGroup('images', help='Build responsive image variants.')
+
+
+@images_cli.command('build')
+@click.option('--media/--no-media', default=True, help='Also render the uploaded Media images that have no variants yet.')
+@click.option('--batch-size', default=50, show_default=True, help='Media rows rendered per pool run.')
+def build_command(media, batch_size):
+    """Render AVIF/WebP/JPEG variants of the static images (and uploaded media)."""
+    if Image is None:
+        raise click.ClickException('Pillow is not installed.')
+    
+    manifest = build_static_images(current_app.static_folder, current_app.config)
+    click.echo(f'{sum(len(variants) for variants in manifest.values())} variants of {len(manifest)} static images written.')
+    click.echo('Run `flask assets build` to fingerprint them and use them in the stylesheets.')
+    
+    if media:
+        total = 0
+        without_variants = Media.query.filter(~Media.variants.any()).order_by(Media.id)
+        last_id = 0
+        while True:
+            batch = without_variants.filter(Media.id > last_id).limit(batch_size).all()
+            if not batch:
+                break
+            total += create_media_variants(batch)
+            last_id = batch[-1].id
+        click.echo(f'{total} media variants written.')
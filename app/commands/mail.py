@@ -0,0 +1,43 @@
+"""
+Mail commands, e.g. `flask mail drain`
+
+Author: Emmanuel Olowu
+Link: https://github.com/zeddyemy
+Copyright: © 2024 Emmanuel Olowu <zeddyemy@gmail.com>
+License: MIT, see LICENSE for more details.
+Package: BitnShop
+"""
+import time
+import click
+from flask.cli import AppGroup
+
+from ..utils.mail_outbox import open_outbox_connection, drain_outbox_batch
+
+
+mail_cli = AppGroup('mail', help='Send the emails waiting in the outbox.')
+
+
+@mail_cli.command('drain')
+@click.option('--batch-size', type=int, default=None, help='Emails claimed per batch, defaults to MAIL_OUTBOX_BATCH_SIZE.')
+@click.option('--loop/--once', default=False, help='Keep polling the outbox instead of exiting once it is empty.')
+@click.option('--interval', default=5.0, show_default=True, help='Seconds to wait between polls of an empty outbox.')
+def drain_command(batch_size, loop, interval):
+    """Send the due outbox emails over one reused SMTP connection."""
+    connection = open_outbox_connection()
+    total_sent = total_failed = 0
+    try:
+        while True:
+            sent, failed = drain_outbox_batch(connection, batch_size)
+            total_sent += sent
+            total_failed += failed
+            if sent or failed:
+                continue
+            if not loop:
+                break
+            connection.close() # don't hold the server's connection slot while idle
+            time.sleep(interval)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        connection.close()
+    click.echo(f'{total_sent} emails sent, {total_failed} failed.')
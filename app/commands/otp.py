@@ -0,0 +1,22 @@
+"""
+One-time code commands, e.g. `flask otp purge`
+
+Author: Emmanuel Olowu
+Link: https://github.com/zeddyemy
+Copyright: © 2024 Emmanuel Olowu <zeddyemy@gmail.com>
+License: MIT, see LICENSE for more details.
+Package: BitnShop
+"""
+import click
+from flask.cli import AppGroup
+
+from ..utils.otp import purge_expired_codes
+
+
+otp_cli = AppGroup('otp', help='Manage the one-time codes.')
+
+
+@otp_cli.command('purge')
+def purge_command():
+    """Delete the expired one-time codes."""
+    click.echo(f'{purge_expired_codes()} expired codes deleted.')
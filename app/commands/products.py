@@ -0,0 +1,66 @@
+"""
+Bulk product lifecycle commands, e.g. `flask products publish --ids 1,2,3`
+
+Author: Emmanuel Olowu
+Link: https://github.com/zeddyemy
+Copyright: © 2024 Emmanuel Olowu <zeddyemy@gmail.com>
+License: MIT, see LICENSE for more details.
+Package: BitnShop
+"""
+import click
+from flask.cli import AppGroup
+
+from ..models import ProductStatus
+from ..utils.helpers.product_helpers import publish_products, unpublish_products, archive_products, bulk_delete_products, bulk_recategorize_products
+
+products_cli = AppGroup('products', help='Bulk product lifecycle operations.')
+
+
+def _id_list(value):
+    if not value:
+        return None
+    return [int(id) for id in value.split(',') if id.strip()]
+
+
+def filter_options(fn):
+    """Adds the options selecting which products a command applies to"""
+    fn = click.option('--status', 'pub_status', type=click.Choice([status.value for status in ProductStatus]), help='Only products with this status.')(fn)
+    fn = click.option('--category', 'category_id', type=int, help='Only products in this category.')(fn)
+    fn = click.option('--ids', 'product_ids', callback=lambda ctx, param, value: _id_list(value), help='Comma separated product IDs.')(fn)
+    return fn
+
+
+def _run(bulk_fn, done_msg, **filters):
+    try:
+        count = bulk_fn(**filters)
+    except ValueError as e:
+        raise click.UsageError(str(e))
+    click.echo(f'{count} product(s) {done_msg}.')
+
+
+@products_cli.command('publish')
+@filter_options
+def publish(**filters):
+    _run(publish_products, 'published', **filters)
+
+@products_cli.command('unpublish')
+@filter_options
+def unpublish(**filters):
+    _run(unpublish_products, 'unpublished', **filters)
+
+@products_cli.command('archive')
+@filter_options
+def archive(**filters):
+    _run(archive_products, 'archived', **filters)
+
+@products_cli.command('delete')
+@filter_options
+@click.confirmation_option(prompt='Delete the matching products?')
+def delete(**filters):
+    _run(bulk_delete_products, 'deleted', **filters)
+
+@products_cli.command('recategorize')
+@filter_options
+@click.option('--to', 'category_ids', required=True, callback=lambda ctx, param, value: _id_list(value), help='Comma separated category IDs to assign.')
+def recategorize(category_ids, **filters):
+    _run(bulk_recategorize_products, 'recategorized', category_ids=category_ids, **filters)
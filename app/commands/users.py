@@ -0,0 +1,38 @@
+"""
+User management commands, e.g. `flask users import customers.csv`
+
+Author: Emmanuel Olowu
+Link: https://github.com/zeddyemy
+Copyright: © 2024 Emmanuel Olowu <zeddyemy@gmail.com>
+License: MIT, see LICENSE for more details.
+Package: BitnShop
+"""
+import time
+import click
+from flask.cli import AppGroup
+
+from ..models import RoleNames
+from ..utils.user_import import import_users, import_format
+
+users_cli = AppGroup('users', help='Bulk user operations.')
+
+
+@users_cli.command('import')
+@click.argument('file', type=click.File('r', encoding='utf-8-sig'))
+@click.option('--format', 'fmt', type=click.Choice(['csv', 'jsonl']), help='Defaults to the file extension.')
+@click.option('--role', type=click.Choice([role.value for role in RoleNames]), default=RoleNames.CUSTOMER.value, show_default=True, help='Role of the rows without one.')
+@click.option('--notify', is_flag=True, help='Queue a welcome email for every imported user.')
+@click.option('--dry-run', is_flag=True, help='Validate and hash everything, but insert nothing.')
+@click.option('--workers', type=int, default=None, help='Password hashing processes, defaults to USER_IMPORT_WORKERS or one per core.')
+@click.option('--chunk-size', type=int, default=None, help='Rows inserted per transaction, defaults to USER_IMPORT_CHUNK_SIZE.')
+def import_command(file, fmt, role, notify, dry_run, workers, chunk_size):
+    """Import users from a CSV or JSON lines FILE ('-' for stdin)."""
+    start = time.perf_counter()
+    report = import_users(
+        file, fmt or import_format(file.name), default_role=RoleNames.get_member_by_value(role),
+        notify=notify, dry_run=dry_run, workers=workers, chunk_size=chunk_size,
+    )
+    for line, message in sorted(report.errors):
+        click.echo(f'line {line}: {message}', err=True)
+    verb = 'would be imported' if dry_run else 'imported'
+    click.echo(f'{report.created} user(s) {verb}, {report.skipped} row(s) skipped in {time.perf_counter() - start:.1f}s.')
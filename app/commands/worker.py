@@ -0,0 +1,50 @@
+"""
+The `flask worker` command, running the scheduled maintenance jobs
+
+Author: Emmanuel Olowu
+Link: https://github.com/zeddyemy
+Copyright: © 2024 Emmanuel Olowu <zeddyemy@gmail.com>
+License: MIT, see LICENSE for more details.
+Package: BitnShop
+"""
+import logging, signal
+import click
+from flask import current_app
+
+from ..utils.scheduler import scheduler
+from ..utils import maintenance # registers the jobs
+
+
+@click.command('worker')
+@click.option('--tick', type=float, default=None, help='Seconds between checks for due jobs, defaults to WORKER_TICK.')
+@click.option('--run', 'run_now', multiple=True, help='Run this job once now and exit (repeatable), e.g. --run purge-temp-users.')
+@click.option('--list', 'list_jobs', is_flag=True, help='List the registered jobs and exit.')
+def worker_command(tick, run_now, list_jobs):
+    """Run the scheduled maintenance jobs until stopped."""
+    if not logging.getLogger().handlers:
+        logging.basicConfig(level=logging.INFO, format='%(asctime)s %(levelname)s %(name)s: %(message)s')
+    logging.getLogger('app.utils.scheduler').setLevel(logging.INFO)
+    
+    if list_jobs:
+        for job in scheduler.jobs.values():
+            schedule = job.cron.expression if job.cron else f'every {job.every:g}s'
+            click.echo(f'{job.name:<28} {schedule}{" (and at start)" if job.run_at_start else ""}')
+        return
+    
+    if run_now:
+        unknown = set(run_now) - set(scheduler.jobs)
+        if unknown:
+            raise click.BadParameter(f'Unknown jobs: {", ".join(sorted(unknown))}')
+        for name in run_now:
+            click.echo(f'{name}: {scheduler.jobs[name].fn()}')
+        return
+    
+    stopping = []
+    def stop(signum, frame):
+        click.echo('Stopping after the current job...')
+        stopping.append(signum)
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+    
+    click.echo(f'Worker {scheduler.owner} running {len(scheduler.jobs)} jobs.')
+    scheduler.run_forever(tick or current_app.config['WORKER_TICK'], should_stop=lambda: bool(stopping))
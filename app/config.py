@@ -24,6 +24,10 @@ class Config:
     DEBUG = (ENV == 'development')  # Enable debug mode only in development
     STATIC_DIR = 'app/static'
     UPLOADS_DIR = 'app/static/uploads'
+    UPLOADS_URL = '/static/uploads'
+    MEDIA_STORAGE = os.environ.get('MEDIA_STORAGE') or 'local' # 'local' or 'cloudinary'
+    MAX_UPLOAD_SIZE = int(os.environ.get('MAX_UPLOAD_SIZE') or 20 * 1024 * 1024) # bytes
+    UPLOAD_CHUNK_SIZE = 64 * 1024 # bytes read from the request stream at a time
     EMERGENCY_MODE = os.environ.get('EMERGENCY_MODE') or False
     DOMAIN_NAME = os.environ.get('DOMAIN_NAME') or 'https://www.trendit3.com'
     API_DOMAIN_NAME = os.environ.get('API_DOMAIN_NAME') or 'https://api.trendit3.com'
@@ -34,6 +38,32 @@ class Config:
     TASKS_PER_PAGE = os.environ.get('TASKS_PER_PAGE') or 10
     ITEMS_PER_PAGE = os.environ.get('ITEMS_PER_PAGE') or 10
     PAYMENT_TYPES = ['task-creation', 'membership-fee', 'credit-wallet', 'item-upload']
+    PRICE_FACET_BUCKETS = [1000, 5000, 10000, 50000] # upper bounds of the price facet buckets
+    CATALOG_PER_PAGE = int(os.environ.get('CATALOG_PER_PAGE') or 24)
+    FRAGMENT_CACHE_SIZE = int(os.environ.get('FRAGMENT_CACHE_SIZE') or 2048) # max rendered fragments kept in memory
+    IDENTITY_CACHE_SIZE = int(os.environ.get('IDENTITY_CACHE_SIZE') or 4096) # users whose active flag and roles are kept in memory
+    IDENTITY_CACHE_TTL = int(os.environ.get('IDENTITY_CACHE_TTL') or 60) # seconds, bounds how long other processes see stale roles
+    ROLE_REGISTRY_TTL = int(os.environ.get('ROLE_REGISTRY_TTL') or 300) # seconds, bounds how long workers without a shared page cache keep stale role ids
+    NAV_TREE_TTL = int(os.environ.get('NAV_TREE_TTL') or 300) # seconds, the same for the navigation tree
+    
+    # responsive image derivatives, see utils.images
+    IMAGE_VARIANT_WIDTHS = [320, 640, 1024, 1600]
+    IMAGE_VARIANT_FORMATS = ['avif', 'webp', 'jpeg'] # best first, the last one is the <img> fallback
+    IMAGE_QUALITY = int(os.environ.get('IMAGE_QUALITY') or 75)
+    IMAGE_WORKERS = int(os.environ.get('IMAGE_WORKERS') or 0) or None # processes, defaults to the CPU count
+    
+    # on-the-fly response compression, see utils.middleware
+    COMPRESS_MIN_SIZE = int(os.environ.get('COMPRESS_MIN_SIZE') or 500) # bytes
+    COMPRESS_MIMETYPES = ['text/html', 'text/css', 'text/plain', 'text/javascript', 'application/javascript', 'application/json', 'image/svg+xml']
+    COMPRESS_LEVEL = 6 # gzip, 1-9
+    COMPRESS_BR_QUALITY = 4 # brotli, 0-11; higher levels cost too much CPU per request
+    
+    # full-page cache of anonymous storefront pages
+    PAGE_CACHE_BACKEND = os.environ.get('PAGE_CACHE_BACKEND') or 'memory' # 'memory' (per process, no ETag/Last-Modified validators) or 'sqlite' (shared by workers)
+    PAGE_CACHE_PATH = os.environ.get('PAGE_CACHE_PATH') or 'instance/page_cache.sqlite3'
+    PAGE_CACHE_SIZE = int(os.environ.get('PAGE_CACHE_SIZE') or 512)
+    PAGE_CACHE_TTL = int(os.environ.get('PAGE_CACHE_TTL') or 60) # seconds a page is served fresh
+    PAGE_CACHE_STALE_TTL = int(os.environ.get('PAGE_CACHE_STALE_TTL') or 300) # extra seconds it may be served while one request re-renders it
     
     # mail configurations
     MAIL_SERVER = 'smtp.gmail.com'
@@ -42,6 +72,33 @@ class Config:
     MAIL_USERNAME = os.environ.get('MAIL_USERNAME') or 'olowu2018@gmail.com'
     MAIL_PASSWORD = os.environ.get('MAIL_PASSWORD') or 'doyi bkzc mcpq cvcv'
     MAIL_DEFAULT_SENDER = ('BitnShop', 'olowu2018@gmail.com')
+    MAIL_WORKERS = int(os.environ.get('MAIL_WORKERS') or 4) # threads, each holding one SMTP connection
+    MAIL_QUEUE_SIZE = int(os.environ.get('MAIL_QUEUE_SIZE') or 1000)
+    MAIL_BATCH_SIZE = 20 # messages a worker takes off the queue at once
+    MAIL_IDLE_TIMEOUT = 30 # seconds before an idle worker closes its connection
+    MAIL_SUBMIT_TIMEOUT = 2 # seconds a sender waits for room in a full queue
+    MAIL_OUTBOX_BATCH_SIZE = int(os.environ.get('MAIL_OUTBOX_BATCH_SIZE') or 50) # outbox rows claimed per batch by `flask mail drain`
+    MAIL_OUTBOX_MAX_ATTEMPTS = 8
+    MAIL_OUTBOX_BACKOFF = 30 # seconds before the first retry, doubled after each failed attempt
+    MAIL_OUTBOX_CLAIM_TIMEOUT = 600 # seconds after which rows left 'sending' by a dead worker are claimed again
+    OTP_BACKEND = os.environ.get('OTP_BACKEND') or 'database' # 'database' (shared by workers) or 'memory' (single process)
+    OTP_TTL = int(os.environ.get('OTP_TTL') or 600) # seconds a code is valid
+    OTP_MAX_ATTEMPTS = 5 # wrong guesses before a code is cleared
+    OTP_RESEND_INTERVAL = int(os.environ.get('OTP_RESEND_INTERVAL') or 60) # seconds before another code can be sent to the same email
+    OTP_MAX_ISSUES = 5 # codes of one type per email per OTP_ISSUE_WINDOW
+    OTP_ISSUE_WINDOW = 3600 # seconds
+    OTP_DIGITS = 6
+    WORKER_TICK = 5 # seconds between two checks for due jobs by `flask worker`
+    MAINTENANCE_BATCH_SIZE = 1000 # rows deleted per transaction by the maintenance jobs
+    MAINTENANCE_MAX_BATCHES = 50 # per job run
+    TEMP_USER_TTL_DAYS = int(os.environ.get('TEMP_USER_TTL_DAYS') or 7)
+    MAIL_OUTBOX_RETENTION_DAYS = int(os.environ.get('MAIL_OUTBOX_RETENTION_DAYS') or 30) # sent/failed outbox rows are deleted after
+    WARM_CATEGORY_PAGES = 10 # busiest categories rendered by the warm-page-cache job
+    USER_IMPORT_CHUNK_SIZE = 1000 # rows validated, hashed and inserted together by `flask users import`
+    USER_IMPORT_WORKERS = int(os.environ.get('USER_IMPORT_WORKERS') or 0) # password hashing processes, 0 for one per core
+    USER_IMPORT_WEB_WORKERS = int(os.environ.get('USER_IMPORT_WEB_WORKERS') or 2) # password hashing threads of a cpanel import
+    USER_IMPORT_DIR = os.environ.get('USER_IMPORT_DIR') or 'instance/user_imports' # cpanel uploads being imported, and the reports
+    BROADCAST_RATE = float(os.environ.get('BROADCAST_RATE') or 10) # emails per second sent by `flask broadcast send`
     
     # Cloudinary configurations
     CLOUDINARY_CLOUD_NAME = os.environ.get('CLOUDINARY_CLOUD_NAME') or "dcozguaw3"
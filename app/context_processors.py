@@ -2,7 +2,7 @@ from flask_login import current_user
 
 from .utils.helpers.category_helpers import get_all_categories
 from .utils.helpers.user_helpers import get_app_user_info
-from .utils.helpers.nav_bar_helpers import get_all_nav_items
+from .utils.helpers.nav_bar_helpers import get_nav_tree
 from .extensions import db
 
 def my_context_Processor():
@@ -16,7 +16,7 @@ def my_context_Processor():
     user_info = get_app_user_info(user_id)
     all_categories = get_all_categories()
     all_categories = [cat.to_dict() for cat in all_categories]
-    nav_items = [nav_item.to_dict() for nav_item in get_all_nav_items()]
+    nav_items = get_nav_tree(user_info.get('roles'))
     
     db.session.close() # close the session
     
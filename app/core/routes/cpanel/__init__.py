@@ -10,4 +10,4 @@ from flask import Blueprint, render_template
 
 cpanel_bp: Blueprint = Blueprint('cpanel', __name__, url_prefix='/cpanel')
 
-from . import home, auth, users, products
\ No newline at end of file
+from . import home, auth, users, products, media
\ No newline at end of file
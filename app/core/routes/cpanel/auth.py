@@ -18,6 +18,8 @@ from . import cpanel_bp
 from ....extensions import db
 from ....models import AppUser, Profile, Address, Role, RoleNames
 from ....utils.helpers import get_app_user, log_exception, console_log, redirect_url
+from ....utils.helpers.mail_helpers import enqueue_email
+from ....utils.helpers.role_helpers import add_user_role
 from ....utils.forms import SignUpForm, LoginForm
 
 
@@ -47,11 +49,10 @@ def sign_up():
                 new_user_profile = Profile(firstname=firstname, lastname=lastname, app_user=new_user)
                 new_user_address = Address(app_user=new_user)
             
-                role = Role.query.filter_by(name=RoleNames.JUNIOR_ADMIN).first()
-                if role:
-                    new_user.roles.append(role)
-                    
                 db.session.add_all([new_user, new_user_profile, new_user_address])
+                db.session.flush()
+                add_user_role(new_user.id, RoleNames.JUNIOR_ADMIN)
+                enqueue_email(email, 'new_admin', username=username) # sent by `flask mail drain` once this commits
                 db.session.commit()
             except InvalidRequestError:
                 db.session.rollback()
@@ -126,6 +127,10 @@ def login():
                 flash("Password is incorrect", 'error')
                 return render_template('cpanel/auth/login.html', form=form, page='auth')
             
+            if not user.is_active:
+                flash("This account has been deactivated", 'error')
+                return render_template('cpanel/auth/login.html', form=form, page='auth')
+            
             login_user(user)
             flash("Welcome back " + user.username, 'success')
             return redirect(next)
@@ -6,13 +6,26 @@ License: MIT, see LICENSE for more details.
 Package: BitnShop
 """
 
-from flask import render_template
+from flask import render_template, jsonify
 from flask_login import login_required
-from ....decorators import cpanel_login_required
+from ....decorators import cpanel_login_required, conditional_get
+from ....utils.cache import fragment_cache
+from ....utils.page_cache import get_page_cache
 
 from . import cpanel_bp
 
 @cpanel_bp.route("/", methods=['GET'])
 @cpanel_login_required()
+@conditional_get()
 def index():
-    return render_template('cpanel/index.html')
\ No newline at end of file
+    return render_template('cpanel/index.html')
+
+
+@cpanel_bp.route("/metrics/cache", methods=['GET'])
+@cpanel_login_required()
+def cache_metrics():
+    # counters are per worker process
+    return jsonify({
+        'page_cache': get_page_cache().stats(),
+        'fragment_cache': fragment_cache.stats(),
+    })
@@ -0,0 +1,44 @@
+"""
+Author: Emmanuel Olowu
+Link: https://github.com/zeddyemy
+Copyright: © 2024 Emmanuel Olowu <zeddyemy@gmail.com>
+License: MIT, see LICENSE for more details.
+Package: BitnShop
+"""
+from flask import request, jsonify, current_app
+
+from . import cpanel_bp
+from ....decorators import cpanel_login_required, roles_required
+from ....utils.helpers import log_exception
+from ....utils.helpers.role_helpers import ADMIN_ROLE_NAMES
+from ....utils.helpers.media_helpers import save_uploaded_stream, UploadError
+
+
+@cpanel_bp.route("/media", methods=['POST'])
+@cpanel_login_required()
+@roles_required(*ADMIN_ROLE_NAMES)
+def upload_media():
+    """
+    Uploads a file, either as the raw request body (streamed, with the name in an
+    `X-Filename` header or `?filename=`) or as the `file` field of a multipart form.
+    """
+    if request.content_length and request.content_length > current_app.config['MAX_UPLOAD_SIZE']:
+        return jsonify({'status': 'failed', 'message': 'File is too large'}), 413
+    
+    if request.mimetype == 'multipart/form-data':
+        upload = request.files.get('file')
+        if not upload:
+            return jsonify({'status': 'failed', 'message': 'No file was sent'}), 400
+        stream, filename = upload.stream, upload.filename
+    else:
+        stream, filename = request.stream, request.headers.get('X-Filename') or request.args.get('filename', '')
+    
+    try:
+        media, created = save_uploaded_stream(stream, filename)
+    except UploadError as e:
+        return jsonify({'status': 'failed', 'message': str(e)}), e.status_code
+    except Exception as e:
+        log_exception('An exception occurred while uploading media', e)
+        return jsonify({'status': 'failed', 'message': 'An unexpected error occurred'}), 500
+    
+    return jsonify({'status': 'success', 'created': created, 'media': media.to_dict()}), 201 if created else 200
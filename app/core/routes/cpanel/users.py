@@ -7,7 +7,8 @@ Package: BitnShop
 """
 
 from slugify import slugify
-from flask import request, render_template, flash, redirect, url_for
+from flask import request, render_template, flash, redirect, url_for, abort
+from flask_login import current_user
 from sqlalchemy.exc import ( InvalidRequestError, IntegrityError, DataError, DatabaseError )
 from werkzeug.security import generate_password_hash
 
@@ -15,8 +16,12 @@ from . import cpanel_bp
 from ....models import AppUser, Profile, Address, Role, RoleNames
 from ....extensions import db
 from ....utils.helpers import console_log, log_exception, redirect_url
-from ....decorators import cpanel_login_required
-from ....utils.forms import AdminAddUserForm
+from ....utils.helpers.mail_helpers import enqueue_email
+from ....utils.helpers.role_helpers import add_user_role, user_manager_roles, can_grant_role
+from ....utils.helpers.user_helpers import get_user_identity
+from ....utils import user_import
+from ....decorators import cpanel_login_required, roles_required
+from ....utils.forms import AdminAddUserForm, AdminImportUsersForm
 
 @cpanel_bp.route("/users", methods=['GET'])
 @cpanel_login_required()
@@ -51,12 +56,11 @@ def add_new_User():
                 new_user_profile = Profile(firstname=firstname, lastname=lastname, app_user=new_user)
                 new_user_address = Address(app_user=new_user)
                 
-                # get role from db where the name is same as form role
-                user_role = Role.query.filter(Role.name == RoleNames.get_member_by_value(role)).first()
-                if user_role:
-                    new_user.roles.append(user_role)
-            
                 db.session.add_all([new_user, new_user_profile, new_user_address])
+                db.session.flush()
+                add_user_role(new_user.id, RoleNames.get_member_by_value(role) or RoleNames.CUSTOMER)
+                email_type = 'welcome' if role == RoleNames.CUSTOMER.value else 'new_admin'
+                enqueue_email(email, email_type, username=username) # sent by `flask mail drain` once this commits
                 db.session.commit()
                 
                 # on successful db insert, flash success
@@ -96,3 +100,41 @@ def add_new_User():
                             break
     
     return render_template('cpanel/users/new_user.html', form=form)
+
+
+@cpanel_bp.route("/users/import", methods=['GET', 'POST'])
+@cpanel_login_required()
+@roles_required(*user_manager_roles())
+def import_users():
+    form = AdminImportUsersForm()
+    
+    if form.validate_on_submit():
+        importer_roles = get_user_identity(current_user.id).roles
+        default_role = RoleNames.get_member_by_value(form.role.data) or RoleNames.CUSTOMER
+        if not can_grant_role(importer_roles, default_role):
+            flash(f"You can't import users with the {default_role.value} role.", 'error')
+        else:
+            upload = form.file.data
+            try:
+                import_id = user_import.start_import(
+                    upload, user_import.import_format(upload.filename),
+                    default_role=default_role, notify=form.notify.data, importer_roles=importer_roles,
+                )
+                flash("The import has started, this page shows its report once it is done.", 'success')
+                return redirect(url_for('cpanel.import_users_status', import_id=import_id))
+            except Exception as e:
+                log_exception('An exception occurred while starting a user import', e)
+                flash("An unexpected error occurred!", 'error')
+    
+    return render_template('cpanel/users/import_users.html', form=form, report=None)
+
+
+@cpanel_bp.route("/users/import/<import_id>", methods=['GET'])
+@cpanel_login_required()
+@roles_required(*user_manager_roles())
+def import_users_status(import_id):
+    report = user_import.import_status(import_id)
+    if report is None:
+        abort(404)
+    
+    return render_template('cpanel/users/import_users.html', form=AdminImportUsersForm(), report=report)
@@ -10,4 +10,4 @@ from flask import Blueprint, render_template
 
 front_bp: Blueprint = Blueprint('front', __name__, url_prefix='/')
 
-from . import home, auth
\ No newline at end of file
+from . import home, auth, products, otp
\ No newline at end of file
@@ -10,12 +10,16 @@ from . import front_bp
 from ....extensions import db
 from ....models import AppUser, Profile, Address, Role, RoleNames
 from ....utils.helpers import get_app_user, log_exception, console_log, redirect_url
+from ....utils.helpers.mail_helpers import enqueue_email
+from ....utils.helpers.user_helpers import credit_referral
+from ....utils.helpers.role_helpers import add_user_role
 from ....utils.forms import SignUpForm, LoginForm
 
 
 ## Route to sign up user
 @front_bp.route("/signup", methods=['GET', 'POST'])
-def sign_up():
+@front_bp.route("/signup/<referral_code>", methods=['GET', 'POST'])
+def sign_up(referral_code=None):
     error = False
     form = SignUpForm()
     
@@ -39,11 +43,13 @@ def sign_up():
                 new_user_profile = Profile(firstname=firstname, lastname=lastname, app_user=new_user)
                 new_user_address = Address(app_user=new_user)
             
-                role = Role.query.filter_by(name=RoleNames.CUSTOMER).first()
-                if role:
-                    new_user.roles.append(role)
-                    
+                if referral_code:
+                    credit_referral(new_user_profile, referral_code)
+                
                 db.session.add_all([new_user, new_user_profile, new_user_address])
+                db.session.flush()
+                add_user_role(new_user.id, RoleNames.CUSTOMER)
+                enqueue_email(email, 'welcome', username=username) # sent by `flask mail drain` once this commits
                 db.session.commit()
             except InvalidRequestError:
                 db.session.rollback()
@@ -84,7 +90,7 @@ def sign_up():
                             console_log(data=err)
                             break
                         
-    return render_template('front/auth/register.html', form=form, page='auth')
+    return render_template('front/auth/register.html', form=form, page='auth', referral_code=referral_code)
 
 ## Route to Login
 @front_bp.route("/login", methods=['GET', 'POST'])
@@ -118,6 +124,10 @@ def login():
                 flash("Password is incorrect", 'error')
                 return render_template('front/auth/login.html', form=form, page='auth')
             
+            if not user.is_active:
+                flash("This account has been deactivated", 'error')
+                return render_template('front/auth/login.html', form=form, page='auth')
+            
             login_user(user)
             flash("Welcome back " + user.username, 'success')
             return redirect(next)
@@ -10,8 +10,10 @@ from flask import render_template
 from flask_login import login_required
 
 from . import front_bp
+from ....decorators import conditional_get
 
 @front_bp.route("/", methods=['GET'])
 @login_required
+@conditional_get()
 def index():
     return render_template('front/index.html')
\ No newline at end of file
@@ -0,0 +1,122 @@
+"""
+Author: Emmanuel Olowu
+Link: https://github.com/zeddyemy
+Copyright: © 2024 Emmanuel Olowu <zeddyemy@gmail.com>
+License: MIT, see LICENSE for more details.
+Package: BitnShop
+"""
+import math
+from flask import request, jsonify
+from flask_login import current_user
+from werkzeug.security import generate_password_hash
+
+from . import front_bp
+from ....extensions import db
+from ....models import AppUser
+from ....utils.helpers import log_exception
+from ....utils.helpers.mail_helpers import send_code_to_email
+from ....utils.otp import OTP_PURPOSES, OTPResult, OTPRateLimited, issue_code, verify_code
+
+
+def _get_email() -> str:
+    data = request.get_json(silent=True) or request.form
+    email = (data.get('email') or '').strip()
+    if not email and current_user.is_authenticated:
+        email = current_user.email
+    return email
+
+
+_FAILURES = {
+    OTPResult.INVALID: ('The code is incorrect', 400),
+    OTPResult.EXPIRED: ('The code has expired, request a new one', 400),
+    OTPResult.TOO_MANY_ATTEMPTS: ('Too many incorrect attempts, request a new code', 429),
+    OTPResult.NOT_FOUND: ('No pending code, request a new one', 400),
+}
+
+def _failure_response(result: OTPResult):
+    message, status_code = _FAILURES[result]
+    return jsonify({'status': 'failed', 'reason': result.value, 'message': message}), status_code
+
+
+## Route to send a one-time code
+@front_bp.route("/otp/<purpose>/send", methods=['POST'])
+def send_otp(purpose):
+    if purpose not in OTP_PURPOSES:
+        return jsonify({'status': 'failed', 'message': 'Unknown code type'}), 404
+    
+    email = _get_email()
+    if not email:
+        return jsonify({'status': 'failed', 'message': 'An email address is required'}), 400
+    
+    try:
+        user = AppUser.query.filter(AppUser.email == email).first()
+        # password resets and 2FA codes only go to registered, active users, but a code is issued
+        # (and rate limited) either way, so the response doesn't tell which emails are registered
+        code = issue_code(purpose, email)
+        if (user and user.is_active) or purpose == 'verify_email':
+            if not send_code_to_email(email, code, purpose, username=user.username if user else ''):
+                return jsonify({'status': 'failed', 'message': 'The code could not be sent, please try again later'}), 503
+    except OTPRateLimited as e:
+        retry_after = math.ceil(e.retry_after)
+        response = jsonify({'status': 'failed', 'message': f'Please wait {retry_after} seconds before requesting another code'})
+        return response, 429, {'Retry-After': str(retry_after)}
+    except Exception as e:
+        log_exception(f'An exception occurred while sending a {purpose} code', e)
+        return jsonify({'status': 'failed', 'message': 'An unexpected error occurred'}), 500
+    
+    return jsonify({'status': 'success', 'message': f'If {email} can receive it, a code has been sent to it'})
+
+
+## Route to verify a one-time code
+@front_bp.route("/otp/<purpose>/verify", methods=['POST'])
+def verify_otp(purpose):
+    if purpose not in OTP_PURPOSES:
+        return jsonify({'status': 'failed', 'message': 'Unknown code type'}), 404
+    if purpose == 'pwd_reset': # verifying uses the code up, it is checked by reset_password with the new password
+        return jsonify({'status': 'failed', 'message': 'Send the code with the new password to /password/reset'}), 400
+    
+    email = _get_email()
+    code = ((request.get_json(silent=True) or request.form).get('code') or '').strip()
+    if not email or not code:
+        return jsonify({'status': 'failed', 'message': 'An email address and a code are required'}), 400
+    
+    try:
+        result = verify_code(purpose, email, code)
+    except Exception as e:
+        log_exception(f'An exception occurred while verifying a {purpose} code', e)
+        return jsonify({'status': 'failed', 'message': 'An unexpected error occurred'}), 500
+    
+    if result is OTPResult.VALID:
+        return jsonify({'status': 'success', 'message': 'The code is valid'})
+    return _failure_response(result)
+
+
+## Route to set a new password with a pwd_reset code
+@front_bp.route("/password/reset", methods=['POST'])
+def reset_password():
+    data = request.get_json(silent=True) or request.form
+    email = _get_email()
+    code = (data.get('code') or '').strip()
+    password = data.get('password') or ''
+    if not email or not code or not password:
+        return jsonify({'status': 'failed', 'message': 'An email address, a code and a password are required'}), 400
+    if not 4 <= len(password) <= 72: # as on sign up
+        return jsonify({'status': 'failed', 'message': 'The password must be 4 to 72 characters long'}), 400
+    
+    try:
+        # the store uses the code up atomically, so a request can't be replayed to reset the password again
+        result = verify_code('pwd_reset', email, code)
+        if result is not OTPResult.VALID:
+            return _failure_response(result)
+        
+        user = AppUser.query.filter(AppUser.email == email, AppUser.is_active.is_(True)).first()
+        if user is None: # a code issued for an unregistered or deactivated email, never sent
+            return _failure_response(OTPResult.NOT_FOUND)
+        user.thePassword = generate_password_hash(password, "pbkdf2:sha256")
+        db.session.commit()
+    except Exception as e:
+        db.session.rollback()
+        log_exception('An exception occurred while resetting a password', e)
+        return jsonify({'status': 'failed', 'message': 'An unexpected error occurred'}), 500
+    
+    return jsonify({'status': 'success', 'message': 'Your password has been reset, you can now log in'})
@@ -0,0 +1,51 @@
+"""
+Author: Emmanuel Olowu
+Link: https://github.com/zeddyemy
+Copyright: © 2024 Emmanuel Olowu <zeddyemy@gmail.com>
+License: MIT, see LICENSE for more details.
+Package: BitnShop
+"""
+
+from flask import render_template, request
+
+from . import front_bp
+from ....extensions import db
+from ....models import Category, Product, ProductStatus
+from ....decorators import cache_page, conditional_get
+from ....utils.helpers.basic_helpers import get_or_404
+from ....utils.helpers.category_helpers import get_products_in_category_tree
+from ....utils.helpers.product_helpers import get_catalog_page, latest_product_update, product_last_modified, CATALOG_SORTS
+
+
+@front_bp.route("/p/<string:product_uuid>", methods=['GET'])
+@conditional_get(lambda: product_last_modified(request.view_args['product_uuid']))
+@cache_page
+def product_by_uuid(product_uuid):
+    product = get_or_404(Product.query.options(db.selectinload(Product.categories), db.selectinload(Product.media)).filter(
+        Product.uuid == product_uuid.lower(),
+        Product.pub_status == ProductStatus.PUBLISHED.value
+    ))
+    
+    return render_template('front/products/product.html', product=product)
+
+
+@front_bp.route("/shop", methods=['GET'])
+@conditional_get(latest_product_update)
+@cache_page
+def shop():
+    sort = request.args.get('sort', 'newest')
+    products, next_cursor = get_catalog_page(sort=sort, after=request.args.get('after'))
+    
+    return render_template('front/products/shop.html', products=products, next_cursor=next_cursor, sort=sort, sorts=CATALOG_SORTS, page_title='Shop')
+
+
+@front_bp.route("/category/<string:slug>", methods=['GET'])
+@conditional_get(latest_product_update)
+@cache_page
+def category(slug):
+    category = get_or_404(Category.query.filter(Category.slug == slug))
+    
+    sort = request.args.get('sort', 'newest')
+    products, next_cursor = get_catalog_page(get_products_in_category_tree(category), sort=sort, after=request.args.get('after'))
+    
+    return render_template('front/products/shop.html', products=products, next_cursor=next_cursor, sort=sort, sorts=CATALOG_SORTS, page_title=category.name)
@@ -7,4 +7,6 @@ Copyright: © 2024 Emmanuel Olowu <zeddyemy@gmail.com>
 License: MIT, see LICENSE for more details.
 Package: BitnShop
 """
-from .auth import roles_required, cpanel_login_required
\ No newline at end of file
+from .auth import roles_required, cpanel_login_required
+from .cache import cache_page
+from .conditional import conditional_get
\ No newline at end of file
@@ -12,9 +12,9 @@ Package: BitnShop
 """
 from functools import wraps
 from flask_login import LoginManager, login_required, current_user
-from flask import current_app, request, redirect, flash, url_for, render_template
+from flask import current_app, request, redirect, flash, url_for, render_template, abort
 
-from ..models import AppUser
+from ..utils.helpers.user_helpers import get_user_identity
 
 def roles_required(*required_roles):
     """
@@ -34,15 +34,14 @@ def roles_required(*required_roles):
     """
     def decorator(fn):
         @wraps(fn)
-        @login_required()
+        @login_required
         def wrapper(*args, **kwargs):
-            current_user_id = current_user.id
-            user = AppUser.query.get(current_user_id)
+            identity = get_user_identity(current_user.id) # cached, no roles query per request
             
-            if user and any(role.name.value in required_roles for role in user.roles):
+            if identity and identity.is_active and identity.roles.intersection(required_roles):
                 return fn(*args, **kwargs)
             else:
-                return render_template('rs-admin/errors/permission.jinja-html', msg="Access denied: You do not have the required roles to access this resource")
+                abort(403, "Access denied: You do not have the required roles to access this resource")
         return wrapper
     return decorator
 
@@ -0,0 +1,71 @@
+"""
+This module defines the `cache_page` decorator for the BitnShop Flask application.
+
+It serves anonymous GET requests of storefront pages from the page cache
+(see `utils.page_cache`), with stale-while-revalidate: once a page is older than
+PAGE_CACHE_TTL, one request re-renders it while the others keep getting the
+stale copy for up to PAGE_CACHE_STALE_TTL more seconds.
+
+Author: Emmanuel Olowu
+Link: https://github.com/zeddyemy
+Copyright: © 2024 Emmanuel Olowu <zeddyemy@gmail.com>
+License: MIT, see LICENSE for more details.
+Package: BitnShop
+"""
+import time
+from functools import wraps
+from flask import current_app, request, session, make_response, Response
+from flask_login import current_user
+
+from ..models import nav_version
+from ..utils.page_cache import get_page_cache, CachedPage
+
+
+def _is_cacheable_request() -> bool:
+    # pages of logged in users, or with flash messages waiting to be shown, are never shared
+    return request.method == 'GET' and not current_user.is_authenticated and '_flashes' not in session
+
+
+def cache_page(fn):
+    """
+    Decorator caching the rendered page of anonymous GET requests.
+
+    The key is made of the catalog version, the nav version and the full path (with the
+    query string), so editing a product, category or nav item makes every cached page miss.
+    Only 200 responses that don't set cookies are stored.
+    """
+    @wraps(fn)
+    def wrapper(*args, **kwargs):
+        cache = get_page_cache()
+        if not _is_cacheable_request():
+            cache.record('bypass')
+            return fn(*args, **kwargs)
+
+        ttl = current_app.config['PAGE_CACHE_TTL']
+        stale_ttl = current_app.config['PAGE_CACHE_STALE_TTL']
+        key = f'page:{cache.version()}:{nav_version()}:{request.full_path}'
+
+        page = cache.get(key)
+        if page:
+            age = time.time() - page.stored_at
+            if age < ttl:
+                cache.record('hit')
+                return _cached_response(page, 'HIT')
+            if age < ttl + stale_ttl and not cache.claim_refresh(key, lease=ttl):
+                # another request is already re-rendering it
+                cache.record('stale')
+                return _cached_response(page, 'STALE')
+
+        cache.record('miss')
+        response = make_response(fn(*args, **kwargs))
+        if response.status_code == 200 and not response.direct_passthrough and 'Set-Cookie' not in response.headers:
+            cache.set(key, CachedPage(response.get_data(), response.content_type, time.time()))
+        response.headers['X-Cache'] = 'MISS'
+        return response
+    return wrapper
+
+
+def _cached_response(page: CachedPage, status: str) -> Response:
+    response = Response(page.body, content_type=page.content_type)
+    response.headers['X-Cache'] = status
+    return response
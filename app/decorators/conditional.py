@@ -0,0 +1,84 @@
+"""
+This module defines the `conditional_get` decorator for the BitnShop Flask application.
+
+It adds ETag and Last-Modified validators to GET responses and answers
+`304 Not Modified` when the client's copy is still current, before the view
+(and so the template) runs.
+
+Author: Emmanuel Olowu
+Link: https://github.com/zeddyemy
+Copyright: © 2024 Emmanuel Olowu <zeddyemy@gmail.com>
+License: MIT, see LICENSE for more details.
+Package: BitnShop
+"""
+import hashlib
+from datetime import timezone
+from functools import wraps
+from flask import request, session, make_response, Response
+from flask_login import current_user
+
+from ..models import nav_version
+from ..utils.page_cache import get_page_cache
+from ..utils.helpers.category_helpers import latest_category_update
+
+
+def conditional_get(*version_fns):
+    """
+    Decorator adding ETag/Last-Modified validators to a GET view.
+
+    The validators are computed from cheap version lookups instead of the response body:
+    the latest Category update (the sidebar is on every page), the catalog version
+    (bumped on deletes too), the nav version, the current user and whatever the view
+    depends on, given as `version_fns`. Last-Modified is the latest of those updates and
+    of the last catalog and nav version bumps, and responses vary on the session cookie,
+    so clients validating with If-Modified-Since alone don't miss any of them either.
+
+    Don't use it on views handling forms. Responses are not validated while flash
+    messages are waiting to be shown, nor with a page cache backend that isn't shared
+    by the workers (the default 'memory' one): its versions are bumped only in the
+    worker that committed the change, so the others would keep answering 304.
+
+    Args:
+        *version_fns (callable): Functions taking no arguments and returning the
+            `updated_at` datetime (or None) of what the view renders,
+            e.g. `latest_product_update`.
+
+    Returns:
+        function: The decorated function.
+    """
+    def decorator(fn):
+        @wraps(fn)
+        def wrapper(*args, **kwargs):
+            cache = get_page_cache()
+            if request.method not in ('GET', 'HEAD') or '_flashes' in session or not cache.shared:
+                return fn(*args, **kwargs)
+
+            versions = [latest_category_update()] + [version_fn() for version_fn in version_fns]
+            changes = versions + [cache.changed_at('catalog'), cache.changed_at('nav')]
+            last_modified = max((change for change in changes if change), default=None)
+            if last_modified:
+                last_modified = last_modified.replace(tzinfo=timezone.utc, microsecond=0)
+
+            user_id = current_user.get_id() if current_user.is_authenticated else None
+            validators = (versions, cache.version(), nav_version(), user_id, request.full_path)
+            etag = hashlib.sha1(repr(validators).encode()).hexdigest()
+
+            if request.if_none_match:
+                not_modified = request.if_none_match.contains_weak(etag) # the etag is weakened when the body gets compressed
+            else:
+                not_modified = bool(last_modified and request.if_modified_since and last_modified <= request.if_modified_since)
+
+            if not_modified:
+                response = Response(status=304)
+            else:
+                response = make_response(fn(*args, **kwargs))
+                if response.status_code != 200:
+                    return response
+
+            response.set_etag(etag)
+            response.last_modified = last_modified
+            response.headers['Cache-Control'] = 'private, no-cache' if user_id else 'no-cache'
+            response.vary.add('Cookie') # a copy validated by date alone must be the same user's
+            return response
+        return wrapper
+    return decorator
@@ -10,10 +10,13 @@ License: MIT, see LICENSE for more details.
 Package: BitnShop
 """
 
-from .media import Media
-from .role import Role, RoleNames, user_roles
+from .media import Media, MediaVariant
+from .role import Role, RoleNames, user_roles, role_registry, mark_roles_changed
 from .user import AppUser, Profile, Address, TempUser
-from .model_views import add_admin_views
-from .category import Category
-from .product import Product, Tag, product_category, product_tag, productVariations
-from .nav import NavigationBarItem, create_nav_items
\ No newline at end of file
+from .category import Category, adjust_category_counters, recount_subtree_counts
+from .product import Product, ProductStatus, Tag, product_category, product_tag, productVariations, ProductAttribute, AttributeValue, variation_attribute_value
+from .nav import NavigationBarItem, create_nav_items, nav_version
+from .mail import EmailOutbox, OutboxStatus, Broadcast, BroadcastStatus
+from .otp import OneTimeCode
+from .job import JobLease
+from .model_views import add_admin_views
\ No newline at end of file
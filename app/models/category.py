@@ -6,12 +6,17 @@ License: MIT, see LICENSE for more details.
 Package: BitnShop
 """
 
+from itertools import chain
+from sqlalchemy import event, select, update, func, literal, bindparam
 from sqlalchemy.orm import backref
+from sqlalchemy.orm.attributes import set_committed_value
 from datetime import datetime
 
 from ..extensions import db
+from ..utils.unit_of_work import commit_session
+from ..utils.page_cache import mark_catalog_changed, mark_changed
 from .media import Media
-from .product import Product, product_category
+from .product import Product, ProductStatus, product_category
 
 class Category(db.Model):
     __tablename__ = 'category'
@@ -21,28 +26,47 @@ class Category(db.Model):
     description  = db.Column(db.String(200))
     slug = db.Column(db.String(), nullable=False, unique=True)
     date_created = db.Column(db.DateTime, default=datetime.utcnow)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow, index=True) # see decorators.conditional_get
     
     media_id = db.Column(db.Integer, db.ForeignKey('media.id'), nullable=True)
     parent_id = db.Column(db.Integer, db.ForeignKey('category.id'), nullable=True)
     children = db.relationship('Category', backref=backref('parent', remote_side=[id]), lazy=True)
     
-
-        
+    # Materialized path of ancestor IDs, e.g. '/1/5/12/' for category 12 under 5 under 1.
+    # Kept in sync by the mapper events below; lets subtree and breadcrumb lookups
+    # run as a single indexed query instead of one query per level.
+    path = db.Column(db.String(255), nullable=True)
+    depth = db.Column(db.Integer, nullable=False, default=0)
+    
+    # Denormalized counts of published products, maintained on write (see the events
+    # below and the bulk helpers in product_helpers). `flask recount` repairs them.
+    product_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    subtree_product_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    
+    __table_args__ = (
+        db.Index('ix_category_path', 'path', postgresql_ops={'path': 'varchar_pattern_ops'}),
+    )
+    
+    @property
+    def ancestor_ids(self) -> list[int]:
+        """IDs of this category's ancestors, from the root down (excluding itself)"""
+        return [int(id) for id in (self.path or '').strip('/').split('/') if id][:-1]
+    
     def __repr__(self):
         return f'<Cat ID: {self.id}, name: {self.name}, parent: {self.parent_id}>'
     
     def insert(self):
         db.session.add(self)
-        db.session.commit()
+        commit_session()
 
     def update(self, **kwargs):
         for key, value in kwargs.items():
             setattr(self, key, value)
-        db.session.commit()
+        commit_session()
 
     def delete(self):
         db.session.delete(self)
-        db.session.commit()
+        commit_session()
     
     def to_dict(self):
         return {
@@ -50,5 +74,231 @@ class Category(db.Model):
             'name': self.name,
             'description': self.description,
             'slug': self.slug,
+            'parent_id': self.parent_id,
+            'depth': self.depth,
+            'product_count': self.product_count,
+            'subtree_product_count': self.subtree_product_count,
             }
 
+
+def _path_ids(path) -> list[int]:
+    """IDs in a materialized path, from the root down to the category itself"""
+    return [int(id) for id in (path or '').strip('/').split('/') if id]
+
+
+def adjust_category_counters(connection, direct_deltas: dict, subtree_deltas: dict) -> None:
+    """
+    Applies changes in the number of published products of categories.
+
+    `product_count` counts the products linked to the category itself, and
+    `subtree_product_count` the distinct products linked to it or any of its
+    descendants: a product linked to a category and to one of its subcategories
+    counts once in their ancestors. Callers work the subtree deltas out from
+    each product's categories (see `category_count_deltas`), or with one grouped
+    query for bulk changes. Costs one statement however many categories are affected.
+
+    Args:
+        connection: The connection of the current transaction.
+        direct_deltas (dict): Maps a category ID to the change in its published product links.
+        subtree_deltas (dict): Maps a category ID to the change in the distinct published
+            products of its subtree.
+    """
+    category_ids = {cat_id for cat_id, delta in chain(direct_deltas.items(), subtree_deltas.items()) if delta}
+    if not category_ids:
+        return
+    
+    table = Category.__table__
+    connection.execute(
+        update(table)
+        .where(table.c.id == bindparam('cat_id'))
+        .values(
+            product_count=table.c.product_count + bindparam('direct_delta'),
+            subtree_product_count=table.c.subtree_product_count + bindparam('subtree_delta'),
+            updated_at=datetime.utcnow(), # the counts are on every page's sidebar, see decorators.conditional_get
+        ),
+        [{'cat_id': cat_id, 'direct_delta': direct_deltas.get(cat_id, 0), 'subtree_delta': subtree_deltas.get(cat_id, 0)} for cat_id in category_ids]
+    )
+
+
+def category_count_deltas(connection, changes) -> tuple:
+    """
+    Works out the counter deltas of products whose published categories changed.
+
+    Args:
+        connection: The connection of the current transaction.
+        changes (iterable): (old category IDs, new category IDs) sets of each product,
+            counting only the categories while the product is published.
+
+    Returns:
+        tuple: (direct deltas, subtree deltas) for `adjust_category_counters`.
+    """
+    changes = list(changes)
+    category_ids = set().union(*(old | new for old, new in changes))
+    table = Category.__table__
+    paths = dict(connection.execute(select(table.c.id, table.c.path).where(table.c.id.in_(category_ids))).all()) if category_ids else {}
+    
+    def subtrees(cat_ids):
+        # the categories whose subtree holds any of `cat_ids`: they and all their ancestors
+        return set(chain.from_iterable(_path_ids(paths.get(cat_id)) or [cat_id] for cat_id in cat_ids))
+    
+    direct, subtree = {}, {}
+    for old, new in changes:
+        for deltas, old_ids, new_ids in ((direct, old, new), (subtree, subtrees(old), subtrees(new))):
+            for cat_id in new_ids - old_ids:
+                deltas[cat_id] = deltas.get(cat_id, 0) + 1
+            for cat_id in old_ids - new_ids:
+                deltas[cat_id] = deltas.get(cat_id, 0) - 1
+    return direct, subtree
+
+
+def recount_subtree_counts(connection, category_ids=None) -> None:
+    """
+    Recomputes `subtree_product_count` from scratch with one UPDATE, for the given
+    categories (every category when None): a distinct count of the published
+    products linked to the subtree, which the path index narrows down.
+    """
+    if category_ids is not None and not category_ids:
+        return
+    
+    table = Category.__table__
+    linked = table.alias('linked')
+    distinct_products = select(func.count(func.distinct(product_category.c.product_id))) \
+        .select_from(
+            product_category
+            .join(linked, linked.c.id == product_category.c.category_id)
+            .join(Product.__table__, Product.__table__.c.id == product_category.c.product_id)
+        ) \
+        .where(linked.c.path.like(table.c.path + '%'), Product.__table__.c.pub_status == ProductStatus.PUBLISHED.value) \
+        .scalar_subquery()
+    
+    stmt = update(table).values(subtree_product_count=distinct_products, updated_at=datetime.utcnow())
+    if category_ids is not None:
+        stmt = stmt.where(table.c.id.in_(category_ids))
+    connection.execute(stmt)
+
+
+def _parent_path(connection, parent_id):
+    if parent_id is None:
+        return '/', -1
+    
+    table = Category.__table__
+    row = connection.execute(select(table.c.path, table.c.depth).where(table.c.id == parent_id)).first()
+    if row is None:
+        raise ValueError(f"The parent category {parent_id} doesn't exist")
+    return row.path, row.depth
+
+
+@event.listens_for(Category, 'after_insert')
+def set_category_path(mapper, connection, target):
+    parent_path, parent_depth = _parent_path(connection, target.parent_id)
+    path, depth = f'{parent_path}{target.id}/', parent_depth + 1
+    
+    table = Category.__table__
+    connection.execute(update(table).where(table.c.id == target.id).values(path=path, depth=depth))
+    set_committed_value(target, 'path', path)
+    set_committed_value(target, 'depth', depth)
+
+
+@event.listens_for(Category, 'before_update')
+def move_category_subtree(mapper, connection, target):
+    """Rewrites the path of a moved category and its whole subtree in one UPDATE"""
+    if not db.inspect(target).attrs.parent_id.history.has_changes():
+        return
+    
+    old_path, old_depth = target.path, target.depth
+    parent_path, parent_depth = _parent_path(connection, target.parent_id)
+    if parent_path.startswith(old_path):
+        raise ValueError("A category cannot be moved under itself or one of its subcategories")
+    
+    new_path, new_depth = f'{parent_path}{target.id}/', parent_depth + 1
+    depth_delta = new_depth - old_depth
+    
+    # the branch's products may also be linked elsewhere under the old or new ancestors,
+    # so those are recounted once the flush has written the new paths
+    _recount_after_flush(db.inspect(target).session, _path_ids(old_path)[:-1] + _path_ids(new_path)[:-1])
+    
+    table = Category.__table__
+    connection.execute(
+        update(table)
+        .where(table.c.path.like(f'{old_path}%'), table.c.id != target.id)
+        .values(
+            path=literal(new_path) + func.substr(table.c.path, len(old_path) + 1),
+            depth=table.c.depth + depth_delta
+        )
+    )
+    target.path, target.depth = new_path, new_depth
+    
+    # keep descendants already loaded in the session consistent with the database
+    session = db.inspect(target).session
+    for obj in list(session.identity_map.values()) if session else []:
+        if isinstance(obj, Category) and obj is not target and obj.path and obj.path.startswith(old_path):
+            set_committed_value(obj, 'path', new_path + obj.path[len(old_path):])
+            set_committed_value(obj, 'depth', obj.depth + depth_delta)
+
+
+
+@event.listens_for(Category, 'before_delete')
+def remove_category_from_ancestor_counts(mapper, connection, target):
+    # its products may be linked elsewhere in the ancestors' subtrees too
+    _recount_after_flush(db.inspect(target).session, _path_ids(target.path)[:-1])
+
+
+@event.listens_for(Category, 'after_insert')
+@event.listens_for(Category, 'after_update')
+@event.listens_for(Category, 'after_delete')
+def invalidate_cached_pages(mapper, connection, target):
+    session = db.inspect(target).session
+    mark_catalog_changed(session)
+    mark_changed(session, 'categories') # names and slugs, see product_helpers.render_product_card
+
+
+_COUNT_CHANGES = 'category_count_changes'
+_RECOUNT = 'category_subtree_recount'
+
+def _recount_after_flush(session, category_ids) -> None:
+    if session is not None and category_ids:
+        session.info.setdefault(_RECOUNT, set()).update(category_ids)
+
+@event.listens_for(db.session, 'before_flush')
+def collect_category_count_deltas(session, flush_context, instances):
+    """Collects the published categories of each flushed Product before and after the flush"""
+    changes = session.info[_COUNT_CHANGES] = []
+    
+    for obj in chain(session.new, session.dirty, session.deleted):
+        if not isinstance(obj, Product):
+            continue
+        
+        state = db.inspect(obj)
+        is_new = obj in session.new
+        is_deleted = obj in session.deleted
+        status = state.attrs.pub_status.history
+        if not (is_deleted or status.has_changes() or state.attrs.categories.history.has_changes()):
+            continue
+        
+        old_status = (status.deleted or status.unchanged or [None])[0]
+        new_status = (status.added or status.unchanged or [None])[0]
+        was_published = not is_new and old_status == ProductStatus.PUBLISHED.value
+        is_published = not is_deleted and new_status == ProductStatus.PUBLISHED.value
+        if not (was_published or is_published):
+            continue
+        
+        obj.categories # make sure the collection is loaded so its history is complete
+        categories = state.attrs.categories.history
+        old_categories = set(categories.unchanged) | set(categories.deleted) if was_published else set()
+        new_categories = set(categories.unchanged) | set(categories.added) if is_published else set()
+        if old_categories != new_categories:
+            changes.append((old_categories, new_categories))
+
+
+@event.listens_for(db.session, 'after_flush')
+def apply_category_count_deltas(session, flush_context):
+    changes = session.info.pop(_COUNT_CHANGES, None)
+    recount = session.info.pop(_RECOUNT, None)
+    if changes:
+        # instances above, as new categories only get their IDs during the flush
+        connection = session.connection()
+        adjust_category_counters(connection, *category_count_deltas(connection, (
+            ({cat.id for cat in old}, {cat.id for cat in new}) for old, new in changes
+        )))
+    if recount:
+        recount_subtree_counts(session.connection(), recount)
@@ -0,0 +1,43 @@
+"""
+This module defines the JobLease model for the database.
+
+One row per scheduled job (see utils.scheduler): when it runs next, which
+worker holds it and until when, and how its last run went.
+
+Author: Emmanuel Olowu
+Link: https://github.com/zeddyemy
+Copyright: © 2024 Emmanuel Olowu <zeddyemy@gmail.com>
+License: MIT, see LICENSE for more details.
+Package: BitnShop
+"""
+from ..extensions import db
+
+
+class JobLease(db.Model):
+    __tablename__ = 'job_lease'
+    
+    name = db.Column(db.String(100), primary_key=True)
+    next_run_at = db.Column(db.DateTime, nullable=False)
+    owner = db.Column(db.String(255), nullable=True) # 'hostname:pid' of the worker running it
+    locked_until = db.Column(db.DateTime, nullable=True)
+    last_started_at = db.Column(db.DateTime, nullable=True)
+    last_finished_at = db.Column(db.DateTime, nullable=True)
+    last_duration = db.Column(db.Float, nullable=True) # seconds
+    last_status = db.Column(db.String(20), nullable=True) # 'ok' or 'failed'
+    last_error = db.Column(db.Text, nullable=True)
+    
+    def __repr__(self):
+        return f'<JobLease {self.name}, next run at {self.next_run_at}>'
+    
+    def to_dict(self):
+        return {
+            'name': self.name,
+            'next_run_at': self.next_run_at,
+            'owner': self.owner,
+            'locked_until': self.locked_until,
+            'last_started_at': self.last_started_at,
+            'last_finished_at': self.last_finished_at,
+            'last_duration': self.last_duration,
+            'last_status': self.last_status,
+            'last_error': self.last_error,
+        }
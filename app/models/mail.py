@@ -0,0 +1,113 @@
+"""
+This module defines the EmailOutbox and Broadcast models for the database.
+
+Transactional emails are written to the outbox in the same transaction as the
+change that triggers them (a signup, a new admin) and sent later by
+`flask mail drain`, so an email is never lost to a restart or sent for a
+change that was rolled back.
+
+Author: Emmanuel Olowu
+Link: https://github.com/zeddyemy
+Copyright: © 2024 Emmanuel Olowu <zeddyemy@gmail.com>
+License: MIT, see LICENSE for more details.
+Package: BitnShop
+"""
+from enum import Enum
+from datetime import datetime
+
+from ..extensions import db
+
+
+class OutboxStatus(Enum):
+    """ENUMS for the values stored in EmailOutbox.status"""
+    PENDING = 'pending'
+    SENDING = 'sending' # claimed by a drain worker
+    SENT = 'sent'
+    FAILED = 'failed' # gave up after MAIL_OUTBOX_MAX_ATTEMPTS
+
+
+class EmailOutbox(db.Model):
+    __tablename__ = 'email_outbox'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    email_type = db.Column(db.String(50), nullable=False) # see utils.helpers.mail_helpers.build_email
+    recipient = db.Column(db.String(255), nullable=False)
+    context = db.Column(db.JSON, nullable=False, default=dict) # template variables, rendered when sent
+    status = db.Column(db.String(20), nullable=False, default=OutboxStatus.PENDING.value)
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    next_attempt_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    claimed_at = db.Column(db.DateTime, nullable=True)
+    last_error = db.Column(db.Text, nullable=True)
+    created_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    sent_at = db.Column(db.DateTime, nullable=True)
+    
+    __table_args__ = (
+        db.Index('ix_email_outbox_status_next_attempt_at', 'status', 'next_attempt_at'),
+    )
+    
+    def __repr__(self):
+        return f'<EmailOutbox {self.id}, {self.email_type} to {self.recipient}: {self.status}>'
+    
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'email_type': self.email_type,
+            'recipient': self.recipient,
+            'status': self.status,
+            'attempts': self.attempts,
+            'next_attempt_at': self.next_attempt_at,
+            'last_error': self.last_error,
+            'created_at': self.created_at,
+            'sent_at': self.sent_at,
+        }
+
+
+class BroadcastStatus(Enum):
+    """ENUMS for the values stored in Broadcast.status"""
+    PENDING = 'pending'
+    SENDING = 'sending'
+    PAUSED = 'paused'
+    COMPLETED = 'completed'
+
+
+class Broadcast(db.Model):
+    """
+    An email sent to every user of a segment by `flask broadcast send`.
+    
+    Recipients are sent to in AppUser.id order and `last_user_id` is the
+    checkpoint, so an interrupted or paused broadcast resumes where it stopped.
+    """
+    __tablename__ = 'broadcast'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    subject = db.Column(db.String(200), nullable=False)
+    message = db.Column(db.Text, nullable=False)
+    email_type = db.Column(db.String(50), nullable=False, default='broadcast') # see utils.helpers.mail_helpers.EMAIL_SPECS
+    segment = db.Column(db.JSON, nullable=False, default=dict) # see utils.broadcast.segment_filters
+    status = db.Column(db.String(20), nullable=False, default=BroadcastStatus.PENDING.value)
+    total = db.Column(db.Integer, nullable=True) # recipients counted when sending started
+    sent_count = db.Column(db.Integer, nullable=False, default=0)
+    failed_count = db.Column(db.Integer, nullable=False, default=0)
+    last_user_id = db.Column(db.Integer, nullable=False, default=0)
+    created_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    started_at = db.Column(db.DateTime, nullable=True)
+    finished_at = db.Column(db.DateTime, nullable=True)
+    
+    def __repr__(self):
+        return f'<Broadcast {self.id}, {self.subject}: {self.status}>'
+    
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'subject': self.subject,
+            'email_type': self.email_type,
+            'segment': self.segment,
+            'status': self.status,
+            'total': self.total,
+            'sent_count': self.sent_count,
+            'failed_count': self.failed_count,
+            'last_user_id': self.last_user_id,
+            'created_at': self.created_at,
+            'started_at': self.started_at,
+            'finished_at': self.finished_at,
+        }
@@ -9,6 +9,16 @@ class Media(db.Model):
     filename = db.Column(db.String(128), nullable=False)
     media_path = db.Column(db.String(256), nullable=True) # False
     created_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    
+    # set for files uploaded through utils.helpers.media_helpers; identical files share one row
+    sha256 = db.Column(db.String(64), unique=True, nullable=True)
+    size = db.Column(db.BigInteger, nullable=True) # bytes
+    mime_type = db.Column(db.String(100), nullable=True)
+    width = db.Column(db.Integer, nullable=True)
+    height = db.Column(db.Integer, nullable=True)
+    
+    # resized/re-encoded copies, see utils.images
+    variants = db.relationship('MediaVariant', backref='media', lazy='selectin', cascade='all, delete-orphan', passive_deletes=True, order_by='MediaVariant.width')
 
     def __repr__(self):
         return f"<Media {self.id}, Filename: {self.filename}>"
@@ -21,5 +31,41 @@ class Media(db.Model):
             'id': self.id,
             'filename': self.filename,
             'media_path': self.media_path,
+            'sha256': self.sha256,
+            'size': self.size,
+            'mime_type': self.mime_type,
+            'width': self.width,
+            'height': self.height,
             'created_at': self.created_at,
         }
+
+
+class MediaVariant(db.Model):
+    """ A width-bounded WebP/AVIF/JPEG derivative of a Media image """
+    __tablename__ = 'media_variant'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    media_id = db.Column(db.Integer, db.ForeignKey('media.id', ondelete='CASCADE'), nullable=False)
+    format = db.Column(db.String(10), nullable=False) # 'avif', 'webp' or 'jpeg'
+    width = db.Column(db.Integer, nullable=False)
+    height = db.Column(db.Integer, nullable=False)
+    size = db.Column(db.Integer, nullable=False) # bytes
+    path = db.Column(db.String(256), nullable=False) # relative to the static folder
+    created_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    
+    __table_args__ = (
+        db.UniqueConstraint('media_id', 'format', 'width', name='uq_media_variant_media_format_width'),
+    )
+
+    def __repr__(self):
+        return f"<MediaVariant {self.id}, media: {self.media_id}, {self.format} {self.width}w>"
+
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'format': self.format,
+            'width': self.width,
+            'height': self.height,
+            'size': self.size,
+            'path': self.path,
+        }
@@ -5,18 +5,66 @@ Copyright: © 2024 Emmanuel Olowu <zeddyemy@gmail.com>
 License: MIT, see LICENSE for more details.
 Package: BitnShop
 """
+from flask import flash, abort, redirect, request, url_for, Response, stream_with_context
+from flask_login import current_user
+from flask_admin.actions import action
 from flask_admin.contrib.sqla import ModelView
+from flask_admin.contrib.sqla.filters import BaseSQLAFilter
 from flask_admin.form import rules
+from sqlalchemy import exists, select
 from wtforms import Form
-from wtforms import StringField
+from wtforms import StringField, ValidationError
 
 from ..extensions import db, admin
 from ..config import Config
 from .user import AppUser, Profile
+from .role import Role, RoleNames, user_roles, role_registry
 from .category import Category
-from ..utils.helpers.basic_helpers import console_log
+from .product import Product
+from ..utils.helpers.basic_helpers import log_exception
+from ..utils.unit_of_work import db_batch
+from ..utils.helpers.user_helpers import (
+    get_user_identity, bulk_assign_role, bulk_remove_role, bulk_deactivate_users, bulk_delete_users, export_users_csv, invalidate_user_identities,
+)
+from ..utils.helpers.role_helpers import admin_roles, user_manager_roles, can_grant_role
+from ..utils.helpers.product_helpers import publish_products, unpublish_products, archive_products, bulk_delete_products
 
-class AppUserModelView(ModelView):
+def _current_roles() -> frozenset:
+    # the active current user's role names, empty for anonymous or deactivated users
+    if not current_user.is_authenticated:
+        return frozenset()
+    identity = get_user_identity(current_user.id)
+    return identity.roles if identity and identity.is_active else frozenset()
+
+
+class AdminAccessMixin:
+    ''' Restricts a Flask-Admin view (its pages and actions) to users with an admin role '''
+    
+    def is_accessible(self):
+        return bool(_current_roles().intersection(admin_roles()))
+    
+    def inaccessible_callback(self, name, **kwargs):
+        if current_user.is_authenticated:
+            abort(403)
+        flash("You need to login first", 'error')
+        return redirect(url_for('cpanel.login', next=request.full_path))
+
+
+def _profile_field(view, context, model, name):
+    return getattr(model.profile, name) if model.profile is not None else ''
+
+
+class FilterUserRole(BaseSQLAFilter):
+    # EXISTS on user_roles rather than a join, so users with several roles aren't listed twice
+    def apply(self, query, value, alias=None):
+        role_id = role_registry.id(RoleNames(value))
+        return query.filter(exists().where(user_roles.c.user_id == AppUser.id, user_roles.c.role_id == role_id))
+    
+    def operation(self):
+        return 'is'
+
+
+class AppUserModelView(AdminAccessMixin, ModelView):
     # Define form rules for create and edit forms
     form_rules = [
         rules.FieldSet(('username', 'email', 'date_joined'), 'AppUser'),
@@ -30,10 +78,45 @@ class AppUserModelView(ModelView):
         'phone': StringField('Phone')
     }
     
-    # Define columns for the list view
-    column_list = ('username', 'email', 'date_joined', 'firstname', 'lastname', 'gender', 'phone')
+    # Define columns for the list view, the profile ones are read off the eager-loaded profile
+    column_list = ('username', 'email', 'date_joined', 'is_active', 'roles', 'firstname', 'lastname', 'gender', 'phone')
+    column_formatters = {
+        'firstname': _profile_field,
+        'lastname': _profile_field,
+        'gender': _profile_field,
+        'phone': _profile_field,
+        'roles': lambda view, context, model, name: ', '.join(model.role_names),
+    }
+    
+    # sorting and filtering only on indexed app_user columns
+    column_sortable_list = ('username', 'email', 'date_joined')
+    column_default_sort = [('date_joined', True), ('id', True)]
+    column_searchable_list = ('email', 'username')
+    column_filters = (
+        'date_joined',
+        'is_active',
+        FilterUserRole(AppUser.id, 'Role', options=[(role.value, role.value) for role in RoleNames]),
+    )
+    
+    column_auto_select_related = False # the relationships are loaded by get_query
+    
+    role_actions = {} # action name: the RoleNames member it adds or removes, filled below
+    
+    def is_accessible(self):
+        if not super().is_accessible():
+            return False
+        # the view is shared by every admin, so its create/edit/delete switches are set for the current one on each request
+        is_user_manager = bool(_current_roles().intersection(user_manager_roles()))
+        self.can_create = self.can_edit = self.can_delete = is_user_manager
+        return True
+    
+    def get_query(self):
+        # profile is one-to-one, joined in the page query; roles take one more IN query per page
+        return super().get_query().options(db.joinedload(AppUser.profile), db.selectinload(AppUser.roles))
     
     def on_model_change(self, form, model, is_created):
+        if not is_created and not self._manageable([model.id]):
+            raise ValidationError("You can't edit a user with a role above your own.")
         # Update the related Profile instance
         if model.profile is not None:
             model.profile.firstname = form.firstname.data
@@ -41,22 +124,76 @@ class AppUserModelView(ModelView):
             model.profile.gender = form.gender.data
             model.profile.phone = form.phone.data
 
+    def after_model_change(self, form, model, is_created):
+        invalidate_user_identities([model.id])
+    
+    def delete_model(self, model):
+        # through bulk_delete_users, which deletes the user_roles rows but never the roles themselves
+        # (the ORM delete cascades AppUser.roles to the role table)
+        if not self._manageable([model.id]):
+            flash("You can't delete yourself or a user with a role above your own.", 'error')
+            return False
+        try:
+            with db_batch():
+                bulk_delete_users([model.id])
+        except Exception as e:
+            db.session.rollback()
+            log_exception('An exception occurred deleting a user', e)
+            flash("Failed to delete the user.", 'error')
+            return False
+        return True
+    
+    def _run_bulk_action(self, bulk_fn, user_ids, done_msg, *args):
+        # Apply the action to the whole selection with a few set-based statements
+        try:
+            with db_batch():
+                count = bulk_fn(user_ids, *args)
+            flash(f"{count} user(s) {done_msg}.", 'success')
+        except Exception as e:
+            db.session.rollback()
+            log_exception('An exception occurred running a bulk user action', e)
+            flash("Failed to update the selected users.", 'error')
+    
+    def is_action_allowed(self, name):
+        # exporting, deactivating, deleting and role changes are for user managers, who can't hand out a role above their own
+        roles = _current_roles()
+        if name in ('export', 'deactivate', 'delete') or name in self.role_actions:
+            if not roles.intersection(user_manager_roles()):
+                return False
+            if name in self.role_actions and not can_grant_role(roles, self.role_actions[name]):
+                return False
+        return super().is_action_allowed(name)
+    
+    def _manageable(self, ids) -> list:
+        # admins can't deactivate, delete or edit themselves or users with a role above their own
+        user_ids = [int(id) for id in ids if str(id) != current_user.get_id()]
+        roles = _current_roles()
+        target_roles = db.session.execute(
+            select(user_roles.c.user_id, Role.name).join(Role, Role.id == user_roles.c.role_id).where(user_roles.c.user_id.in_(user_ids))
+        ).all()
+        outranking = {user_id for user_id, role in target_roles if not can_grant_role(roles, role)}
+        if outranking:
+            flash(f"{len(outranking)} user(s) with a role above your own skipped.", 'warning')
+        return [user_id for user_id in user_ids if user_id not in outranking]
+    
+    @action('deactivate', 'Deactivate', 'Deactivate the selected users? They will not be able to log in.')
+    def action_deactivate(self, ids):
+        self._run_bulk_action(bulk_deactivate_users, self._manageable(ids), 'deactivated')
+    
+    @action('delete', 'Delete', 'Are you sure you want to delete the selected users?')
+    def action_delete(self, ids):
+        self._run_bulk_action(bulk_delete_users, self._manageable(ids), 'deleted')
+    
+    @action('export', 'Export CSV')
+    def action_export(self, ids):
+        return Response(
+            stream_with_context(export_users_csv([int(id) for id in ids])),
+            mimetype='text/csv',
+            headers={'Content-Disposition': 'attachment; filename=users.csv'},
+        )
     
-    def get_list(self, *args, **kwargs):
-        # Override to include fields from Profile in the list view
-        count, data = super().get_list(*args, **kwargs)
-        console_log('count, data', f"{count} \n\n {data}")
-        for item in data:
-            console_log('item', f"{item}")
-            if item.profile is not None:
-                item.firstname = item.profile.firstname
-                item.lastname = item.profile.lastname
-                item.gender = item.profile.gender
-                item.phone = item.profile.phone
-        return count, data
-
     def get_one(self, id):
-        # Override to include fields from Profile in the details view
+        # Override to include fields from Profile in the edit form
         item = super().get_one(id)
         if item.profile is not None:
             item.firstname = item.profile.firstname
@@ -66,9 +203,24 @@ class AppUserModelView(ModelView):
         return item
 
 
+def _role_action(role: RoleNames, assign: bool):
+    verb = 'add' if assign else 'remove'
+    
+    @action(f'{verb}_role_{role.name.lower()}', f"{'Add' if assign else 'Remove'} role: {role.value}")
+    def handler(self, ids):
+        if assign:
+            self._run_bulk_action(bulk_assign_role, [int(id) for id in ids], f'given the {role.value} role', role)
+        else:
+            self._run_bulk_action(bulk_remove_role, [int(id) for id in ids], f'removed from the {role.value} role', role)
+    return handler
+
+for _role in RoleNames:
+    for _verb, _assign in (('add', True), ('remove', False)):
+        setattr(AppUserModelView, f'action_{_verb}_role_{_role.name.lower()}', _role_action(_role, _assign))
+        AppUserModelView.role_actions[f'{_verb}_role_{_role.name.lower()}'] = _role
 
 
-class AppUserView(ModelView):
+class AppUserView(AdminAccessMixin, ModelView):
     can_create = True  # Allow creating new Profile records within AppUser view
     can_edit = True  # Allow editing existing Profile records
     can_delete = True  # Allow deleting Profile records
@@ -82,9 +234,49 @@ class AppUserView(ModelView):
     form_excluded_columns = ['app_user']  # Exclude the foreign key field
 
 
-class CategoryModelView(ModelView):
-    pass
+class CategoryModelView(AdminAccessMixin, ModelView):
+    column_list = ('name', 'slug', 'parent', 'product_count', 'subtree_product_count', 'date_created')
+    form_excluded_columns = ('path', 'depth', 'children', 'products', 'product_count', 'subtree_product_count') # maintained by the Category events
+    
+    def get_query(self):
+        # the counters live on the category row itself, so listing needs no COUNT(*) per category
+        return super().get_query().options(db.joinedload(Category.parent))
+
+
+class ProductModelView(AdminAccessMixin, ModelView):
+    column_list = ('name', 'pub_status', 'selling_price', 'actual_price', 'date_created')
+    column_filters = ('pub_status',)
+    column_searchable_list = ('name',)
+    
+    def _run_bulk_action(self, bulk_fn, ids, done_msg):
+        # Apply the action to the whole selection in one statement instead of per object
+        try:
+            with db_batch():
+                count = bulk_fn(product_ids=[int(id) for id in ids])
+            flash(f"{count} product(s) {done_msg}.", 'success')
+        except Exception as e:
+            db.session.rollback()
+            log_exception('An exception occurred running a bulk product action', e)
+            flash("Failed to update the selected products.", 'error')
+    
+    @action('publish', 'Publish', 'Publish the selected products?')
+    def action_publish(self, ids):
+        self._run_bulk_action(publish_products, ids, 'published')
+    
+    @action('unpublish', 'Unpublish', 'Move the selected products back to draft?')
+    def action_unpublish(self, ids):
+        self._run_bulk_action(unpublish_products, ids, 'unpublished')
+    
+    @action('archive', 'Archive', 'Archive the selected products?')
+    def action_archive(self, ids):
+        self._run_bulk_action(archive_products, ids, 'archived')
+    
+    @action('delete', 'Delete', 'Are you sure you want to delete the selected products?')
+    def action_delete(self, ids):
+        self._run_bulk_action(bulk_delete_products, ids, 'deleted')
+
 
 def add_admin_views() -> None:
     admin.add_view(AppUserModelView(AppUser, db.session))
-    admin.add_view(CategoryModelView(Category, db.session))
\ No newline at end of file
+    admin.add_view(CategoryModelView(Category, db.session))
+    admin.add_view(ProductModelView(Product, db.session))
\ No newline at end of file
@@ -1,9 +1,11 @@
-from sqlalchemy import inspect
-from sqlalchemy.orm import backref
+from sqlalchemy import inspect, event
+from sqlalchemy.orm import backref, object_session
 from datetime import datetime
 from flask import url_for
 
 from ..extensions import db
+from ..utils.unit_of_work import commit_session
+from ..utils.page_cache import get_page_cache, mark_changed
 from .media import Media
 
 class NavigationBarItem(db.Model):
@@ -15,24 +17,30 @@ class NavigationBarItem(db.Model):
     icon_class = db.Column(db.String(100), nullable=True, default='bx-pie-chart')  # For icon libraries
     icon_path = db.Column(db.String(500), nullable=True)  # For custom images
     parent_id = db.Column(db.Integer, db.ForeignKey('navigation_bar_item.id'))
+    visible_to = db.Column(db.String(255), nullable=True) # comma separated RoleNames values, None means everyone
     submenus = db.relationship('NavigationBarItem')
     
+    @property
+    def role_names(self) -> frozenset:
+        """The role names allowed to see this item (empty means everyone)"""
+        return frozenset(name.strip() for name in (self.visible_to or '').split(',') if name.strip())
+    
     
     def __repr__(self):
         return f'<Nav ID: {self.id}, name: {self.name}, visible: {self.visible}>'
     
     def insert(self):
         db.session.add(self)
-        db.session.commit()
+        commit_session()
 
     def update(self, **kwargs):
         for key, value in kwargs.items():
             setattr(self, key, value)
-        db.session.commit()
+        commit_session()
 
     def delete(self):
         db.session.delete(self)
-        db.session.commit()
+        commit_session()
     
     def to_dict(self):
         return {
@@ -44,9 +52,26 @@ class NavigationBarItem(db.Model):
             "icon_class": self.icon_class,
             "icon_path": self.icon_path,
             "parent_id": self.parent_id,
+            "visible_to": sorted(self.role_names),
         }
 
 
+# Bumped after every commit that changed the navigation items, so the prebuilt
+# navigation tree (see nav_bar_helpers.get_nav_tree) knows when to rebuild.
+# Kept by the page cache backend, which the workers share with PAGE_CACHE_BACKEND = 'sqlite'.
+def nav_version() -> int:
+    return get_page_cache().version('nav')
+
+def bump_nav_version() -> None:
+    get_page_cache().bump_version('nav')
+
+@event.listens_for(NavigationBarItem, 'after_insert')
+@event.listens_for(NavigationBarItem, 'after_update')
+@event.listens_for(NavigationBarItem, 'after_delete')
+def _nav_item_changed(mapper, connection, target):
+    mark_changed(object_session(target), 'nav')
+
+
 
 
 def create_nav_items(clear: bool = False) -> None:
@@ -80,7 +105,7 @@ def create_nav_items(clear: bool = False) -> None:
     if inspect(db.engine).has_table('navigation_bar_item'):
         if clear:
             NavigationBarItem.query.delete()
-            db.session.commit()
+            commit_session()
         
         new_items = []
         for nav_item in default_items:
@@ -90,5 +115,7 @@ def create_nav_items(clear: bool = False) -> None:
         
         if new_items:
             db.session.bulk_save_objects(new_items)
-            db.session.commit()
+            commit_session()
+        
+        bump_nav_version() # bulk operations skip the mapper events
     
\ No newline at end of file
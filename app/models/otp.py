@@ -0,0 +1,37 @@
+"""
+This module defines the OneTimeCode model for the database.
+
+It backs the 'database' OTP store (see utils.otp): one row per purpose and
+identifier, holding an HMAC of the pending code instead of the code, and the
+count of codes issued in the current rate limit window.
+
+Author: Emmanuel Olowu
+Link: https://github.com/zeddyemy
+Copyright: © 2024 Emmanuel Olowu <zeddyemy@gmail.com>
+License: MIT, see LICENSE for more details.
+Package: BitnShop
+"""
+from datetime import datetime
+
+from ..extensions import db
+
+
+class OneTimeCode(db.Model):
+    __tablename__ = 'one_time_code'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    purpose = db.Column(db.String(20), nullable=False) # 'verify_email', 'pwd_reset' or '2FA'
+    identifier = db.Column(db.String(255), nullable=False) # usually the email address
+    code_hash = db.Column(db.String(64), nullable=False) # '' once the code is used or expired
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    expires_at = db.Column(db.DateTime, nullable=False, index=True)
+    created_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow) # when the current code was issued
+    issue_count = db.Column(db.Integer, nullable=False, default=1, server_default='1') # codes issued since window_started_at
+    window_started_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    
+    __table_args__ = (
+        db.UniqueConstraint('purpose', 'identifier', name='uq_one_time_code_purpose_identifier'),
+    )
+    
+    def __repr__(self):
+        return f'<OneTimeCode {self.id}, {self.purpose} for {self.identifier}>'
@@ -1,29 +1,41 @@
-import uuid
+from enum import Enum
 from flask import request
-from sqlalchemy.orm import backref
+from sqlalchemy import event, func
+from sqlalchemy.orm import backref, object_session
 from datetime import datetime
 
 from app.extensions import db
+from ..utils.unit_of_work import commit_session
+from ..utils.page_cache import mark_catalog_changed, mark_changed
+from ..utils.ids import generate_uuid7
 from .media import Media
 
 
+class ProductStatus(Enum):
+    """ENUMS for the values stored in Product.pub_status"""
+    DRAFT = 'draft'
+    PUBLISHED = 'published'
+    ARCHIVED = 'archived'
+
+
 # association table for the many-to-many relationship between products and categories
 product_category = db.Table('product_category',
-    db.Column('product_id', db.Integer, db.ForeignKey('product.id'), primary_key=True),
-    db.Column('category_id', db.Integer, db.ForeignKey('category.id'), primary_key=True)
+    db.Column('product_id', db.Integer, db.ForeignKey('product.id', ondelete='CASCADE'), primary_key=True),
+    db.Column('category_id', db.Integer, db.ForeignKey('category.id', ondelete='CASCADE'), primary_key=True),
+    db.Index('ix_product_category_category_id', 'category_id', 'product_id')
 )
 
 # association table for the many-to-many relationship between products and tags
 product_tag = db.Table('product_tag',
-    db.Column('product_id', db.Integer, db.ForeignKey('product.id'), primary_key=True),
-    db.Column('tag_id', db.Integer, db.ForeignKey('tag.id'), primary_key=True)
+    db.Column('product_id', db.Integer, db.ForeignKey('product.id', ondelete='CASCADE'), primary_key=True),
+    db.Column('tag_id', db.Integer, db.ForeignKey('tag.id', ondelete='CASCADE'), primary_key=True)
 )
 
 class Product(db.Model):
     __tablename__ = 'product'
 
     id = db.Column(db.Integer, primary_key=True)
-    uuid = db.Column(db.String(36), unique=True, nullable=False, default=str(uuid.uuid4()))
+    uuid = db.Column(db.String(36), unique=True, nullable=False, default=generate_uuid7)
     name = db.Column(db.String(50), nullable=False)
     description  = db.Column(db.String(300), nullable=True)
     selling_price = db.Column(db.Integer, nullable=True)
@@ -33,15 +45,22 @@ class Product(db.Model):
     slug = db.Column(db.String(), nullable=False, unique=True)
     pub_status = db.Column(db.String(), nullable=False, default='draft')
     date_created = db.Column(db.DateTime, default=datetime.utcnow)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow, index=True) # version of the cached product card and page validators
     
     media_id = db.Column(db.Integer, db.ForeignKey('media.id'), nullable=True)
     category_id = db.Column(db.Integer, db.ForeignKey('category.id', ondelete='CASCADE'), nullable=True,)
     user_id = db.Column(db.Integer, db.ForeignKey('app_user.id'))
     
     app_user = db.relationship('AppUser', backref=db.backref('products', lazy='dynamic'))
-    tags = db.relationship('Tag', secondary=product_tag, backref=db.backref('products', lazy='dynamic'))
-    categories = db.relationship('Category', secondary=product_category, backref=db.backref('products', lazy='dynamic'))
+    media = db.relationship('Media', lazy=True)
+    variations = db.relationship('productVariations', backref='product', lazy=True, cascade='all, delete-orphan', passive_deletes=True)
+    tags = db.relationship('Tag', secondary=product_tag, backref=db.backref('products', lazy='dynamic'), passive_deletes=True)
+    categories = db.relationship('Category', secondary=product_category, backref=db.backref('products', lazy='dynamic'), passive_deletes=True)
     
+    __table_args__ = (
+        db.Index('ix_product_pub_status_selling_price', 'pub_status', 'selling_price'),
+        db.Index('ix_product_pub_status_id', 'pub_status', 'id'),
+    )
     
 
     def __repr__(self):
@@ -49,32 +68,28 @@ class Product(db.Model):
     
     def insert(self):
         db.session.add(self)
-        db.session.commit()
+        commit_session()
 
     def update(self, **kwargs):
         for key, value in kwargs.items():
             setattr(self, key, value)
-        db.session.commit()
+        commit_session()
 
     def delete(self):
-        db.session.query(product_category).filter_by(product_id=self.id).delete()
-        db.session.query(product_tag).filter_by(product_id=self.id).delete()
+        # product_category, product_tag and variation rows are removed by ON DELETE CASCADE
         db.session.delete(self)
-        db.session.commit()
+        commit_session()
     
     def get_media(self):
-        if self.media_id:
-            the_media = Media.query.get(self.media_id)
-            if the_media:
-                return the_media.get_path()
-            else:
-                return None
+        if self.media:
+            return self.media.get_path()
         else:
             return None
     
     def to_dict(self):
         return {
             'id': self.id,
+            'uuid': self.uuid,
             'name': self.name,
             'description': self.description,
             'sellingPrice': self.selling_price,
@@ -85,6 +100,29 @@ class Product(db.Model):
             'category_id': self.category_id
         }
 
+# keyset pagination index for the price sorted catalog pages (products without a price sort as 0)
+db.Index('ix_product_catalog_price', Product.pub_status, func.coalesce(Product.selling_price, 0), Product.id)
+
+
+@event.listens_for(db.session, 'before_flush')
+def touch_modified_products(session, flush_context, instances):
+    ''' Bumps `updated_at` when only a product's categories or tags changed
+    
+    Column changes already bump it through `onupdate`, but collection changes
+    don't touch the product row, and the cached product card would go stale.
+    '''
+    for obj in session.dirty:
+        if isinstance(obj, Product) and session.is_modified(obj):
+            obj.updated_at = datetime.utcnow()
+
+
+@event.listens_for(Product, 'after_insert')
+@event.listens_for(Product, 'after_update')
+@event.listens_for(Product, 'after_delete')
+def invalidate_cached_pages(mapper, connection, target):
+    mark_catalog_changed(object_session(target))
+
+
 class Tag(db.Model):
     __tablename__ = 'tag'
     id = db.Column(db.Integer, primary_key=True)
@@ -99,10 +137,85 @@ class Tag(db.Model):
         }
 
 
+@event.listens_for(Tag, 'after_insert')
+@event.listens_for(Tag, 'after_update') # also for changes to `Tag.products` alone
+@event.listens_for(Tag, 'after_delete')
+def invalidate_tagged_cards(mapper, connection, target):
+    # the cards show the tag names, and a deleted tag's product_tag rows go by ON DELETE CASCADE
+    mark_changed(object_session(target), 'tags') # see product_helpers.render_product_card
+
+
 class productVariations(db.Model):
     id = db.Column(db.Integer, primary_key=True)
-    product_id = db.Column(db.Integer, db.ForeignKey('product.id'))
+    product_id = db.Column(db.Integer, db.ForeignKey('product.id', ondelete='CASCADE'), index=True)
     name = db.Column(db.String(100), nullable=False)
     selling_price = db.Column(db.Integer, nullable=True)
+    stock = db.Column(db.Integer, nullable=True) # None means stock is not tracked
     img_url = db.Column(db.String(), nullable=True)
+    
+    attribute_values = db.relationship('AttributeValue', secondary='variation_attribute_value', lazy='selectin', passive_deletes=True)
+    
+    def __repr__(self):
+        return f'<Variation ID: {self.id}, name: {self.name}, product Id: {self.product_id}>'
+    
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'name': self.name,
+            'sellingPrice': self.selling_price,
+            'stock': self.stock,
+            'img_url': self.img_url,
+            'attributes': {value.attribute.slug: value.value for value in self.attribute_values},
+        }
+
 
+# association table linking a variation to the attribute values (size, color, ...) that describe it
+variation_attribute_value = db.Table('variation_attribute_value',
+    db.Column('variation_id', db.Integer, db.ForeignKey('product_variations.id', ondelete='CASCADE'), primary_key=True),
+    db.Column('attribute_value_id', db.Integer, db.ForeignKey('attribute_value.id', ondelete='CASCADE'), primary_key=True),
+    db.Index('ix_variation_attribute_value_value_id', 'attribute_value_id', 'variation_id')
+)
+
+class ProductAttribute(db.Model):
+    """A kind of variant attribute, e.g. Size or Color"""
+    __tablename__ = 'product_attribute'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    name = db.Column(db.String(50), unique=True, nullable=False)
+    slug = db.Column(db.String(50), unique=True, nullable=False)
+    
+    values = db.relationship('AttributeValue', backref=db.backref('attribute', lazy='joined'), lazy=True)
+    
+    def __repr__(self):
+        return f'<Attribute ID: {self.id}, name: {self.name}>'
+    
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'name': self.name,
+            'slug': self.slug,
+        }
+
+class AttributeValue(db.Model):
+    """A single value of a ProductAttribute, e.g. M or Red"""
+    __tablename__ = 'attribute_value'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    attribute_id = db.Column(db.Integer, db.ForeignKey('product_attribute.id'), nullable=False)
+    value = db.Column(db.String(100), nullable=False)
+    slug = db.Column(db.String(100), nullable=False)
+    
+    __table_args__ = (
+        db.UniqueConstraint('attribute_id', 'slug', name='uq_attribute_value_attribute_id_slug'),
+    )
+    
+    def __repr__(self):
+        return f'<AttributeValue ID: {self.id}, value: {self.value}, attribute Id: {self.attribute_id}>'
+    
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'value': self.value,
+            'slug': self.slug,
+            'attribute_id': self.attribute_id,
+        }
@@ -1,6 +1,13 @@
+import time
 from enum import Enum
+from collections import namedtuple
+from threading import Lock
+from flask import current_app
+from sqlalchemy import event, select
+from sqlalchemy.orm import object_session
 
 from ..extensions import db
+from ..utils.page_cache import get_page_cache, mark_changed
 
 class RoleNames(Enum):
     """ENUMS for the name filed in Role Model"""
@@ -17,7 +24,8 @@ class RoleNames(Enum):
 # Association table for the many-to-many relationship
 user_roles = db.Table('user_roles',
     db.Column('user_id', db.Integer, db.ForeignKey('app_user.id')),
-    db.Column('role_id', db.Integer, db.ForeignKey('role.id'))
+    db.Column('role_id', db.Integer, db.ForeignKey('role.id')),
+    db.Index('ix_user_roles_user_id_role_id', 'user_id', 'role_id'),
 )
 
 # Role data model
@@ -26,3 +34,65 @@ class Role(db.Model):
     name = db.Column(db.Enum(RoleNames), unique=True, nullable=False)
     slug = db.Column(db.String(100), unique=True, nullable=False)
     description = db.Column(db.String(100), nullable=True)
+
+
+RoleEntry = namedtuple('RoleEntry', ['id', 'name', 'slug'])
+
+class RoleRegistry:
+    """
+    The role table, kept in memory: there is one row per RoleNames member and
+    they practically never change, so looking a role up shouldn't cost a query.
+    
+    Reloaded on first use after a commit that inserted, updated or deleted a
+    Role bumps the shared 'roles' version (see the events below and
+    utils.page_cache), and at least every ROLE_REGISTRY_TTL seconds, for the
+    workers which don't share the page cache backend.
+    """
+    
+    def __init__(self):
+        self._roles = None # (version, loaded at, {RoleNames: RoleEntry}, {id: RoleEntry})
+        self._lock = Lock()
+    
+    def _get(self) -> tuple:
+        version = get_page_cache().version('roles')
+        roles = self._roles
+        if roles is None or roles[0] != version or time.monotonic() - roles[1] > current_app.config['ROLE_REGISTRY_TTL']:
+            with self._lock:
+                if self._roles is roles:
+                    rows = db.session.execute(select(Role.id, Role.name, Role.slug).order_by(Role.id)).all()
+                    entries = [RoleEntry(row.id, row.name, row.slug) for row in rows]
+                    self._roles = (version, time.monotonic(), {entry.name: entry for entry in entries}, {entry.id: entry for entry in entries})
+                roles = self._roles
+        return roles[2:]
+    
+    def get(self, name: RoleNames):
+        return self._get()[0].get(name)
+    
+    def id(self, name: RoleNames):
+        entry = self._get()[0].get(name)
+        return entry.id if entry else None
+    
+    def name(self, role_id: int):
+        entry = self._get()[1].get(role_id)
+        return entry.name if entry else None
+    
+    def names(self) -> list:
+        return list(self._get()[0])
+    
+    def invalidate(self) -> None:
+        ''' Reloads this process's copy on next use, see `mark_roles_changed` for the other workers '''
+        self._roles = None
+
+
+role_registry = RoleRegistry()
+
+
+def mark_roles_changed(session) -> None:
+    ''' Makes every worker reload its role registry once the session's transaction commits '''
+    mark_changed(session, 'roles')
+
+@event.listens_for(Role, 'after_insert')
+@event.listens_for(Role, 'after_update')
+@event.listens_for(Role, 'after_delete')
+def _role_changed(mapper, connection, target):
+    mark_roles_changed(object_session(target))
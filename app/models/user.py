@@ -16,7 +16,9 @@ from werkzeug.security import generate_password_hash, check_password_hash
 from flask_login import UserMixin
 
 from ..extensions import db
+from ..utils.unit_of_work import commit_session
 from ..models import Media
+from ..utils.ids import referral_code_default
 from ..config import Config
 
 
@@ -43,10 +45,11 @@ class AppUser(db.Model, UserMixin):
     email = db.Column(db.String(255), nullable=False, unique=True)
     username = db.Column(db.String(50), nullable=True, unique=True)
     thePassword = db.Column(db.String(255), nullable=True)
-    date_joined = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    date_joined = db.Column(db.DateTime, nullable=False, default=datetime.utcnow, index=True)
+    is_active = db.Column(db.Boolean, nullable=False, default=True, server_default=db.true()) # deactivated users can't log in, read by flask_login
 
     # Relationships
-    profile = db.relationship('Profile', back_populates="app_user", uselist=False, cascade="all, delete-orphan")
+    profile = db.relationship('Profile', back_populates="app_user", uselist=False, cascade="all, delete-orphan", foreign_keys='Profile.user_id')
     address = db.relationship('Address', back_populates="app_user", uselist=False, cascade="all, delete-orphan")
     #wallet = db.relationship('Wallet', back_populates="app_user", uselist=False, cascade="all, delete-orphan")
     roles = db.relationship('Role', secondary='user_roles', backref=db.backref('users', lazy='dynamic'), cascade="all, delete-orphan", single_parent=True)
@@ -64,6 +67,8 @@ class AppUser(db.Model, UserMixin):
         '''
         #This returns True if the password is same as hashed password in the database.
         '''
+        if not self.thePassword: # e.g. imported without a password, has to reset it
+            return False
         return check_password_hash(self.thePassword, password)
     
     @property
@@ -86,16 +91,16 @@ class AppUser(db.Model, UserMixin):
     
     def insert(self):
         db.session.add(self)
-        db.session.commit()
+        commit_session()
 
     def update(self, **kwargs):
         for key, value in kwargs.items():
             setattr(self, key, value)
-        db.session.commit()
+        commit_session()
 
     def delete(self):
         db.session.delete(self)
-        db.session.commit()
+        commit_session()
     
     def to_dict(self) -> dict:
         
@@ -115,6 +120,7 @@ class AppUser(db.Model, UserMixin):
                 'phone': self.profile.phone,
                 'profile_picture': self.profile.profile_pic,
                 'referral_link': self.profile.referral_link,
+                'referral_count': self.profile.referral_count,
             })
         
         '''
@@ -131,6 +137,7 @@ class AppUser(db.Model, UserMixin):
             'username': self.username,
             'email': self.email,
             'date_joined': self.date_joined,
+            'is_active': self.is_active,
             #'wallet': wallet_info,
             'roles': self.role_names,
             **address_info,  # Merge address information into the output dictionary
@@ -149,19 +156,24 @@ class Profile(db.Model):
     profile_picture_id = db.Column(db.Integer(), db.ForeignKey('media.id'), nullable=True)
     
     user_id = db.Column(db.Integer, db.ForeignKey('app_user.id', ondelete='CASCADE'), nullable=False,)
-    app_user = db.relationship('AppUser', back_populates="profile")
+    app_user = db.relationship('AppUser', back_populates="profile", foreign_keys=[user_id])
+    
+    # derived from user_id on insert, see utils.ids.referral_code
+    referral_code = db.Column(db.String(12), unique=True, index=True, nullable=False, default=referral_code_default)
+    referrer_id = db.Column(db.Integer, db.ForeignKey('app_user.id', ondelete='SET NULL'), nullable=True, index=True)
+    referral_count = db.Column(db.Integer, nullable=False, default=0, server_default='0') # users who signed up with referral_code
     
     def __repr__(self):
         return f'<profile ID: {self.id}, name: {self.firstname}>'
     
     @property
     def referral_link(self):
-        return f'{Config.DOMAIN_NAME}/signup/{self.app_user.username}'
+        return f'{Config.DOMAIN_NAME}/signup/{self.referral_code}'
     
     def update(self, **kwargs):
         for key, value in kwargs.items():
             setattr(self, key, value)
-        db.session.commit()
+        commit_session()
     
     @property
     def profile_pic(self):
@@ -182,7 +194,9 @@ class Profile(db.Model):
             'gender': self.gender,
             'phone': self.phone,
             'profile_picture': self.profile_pic,
+            'referral_code': self.referral_code,
             'referral_link': f'{self.referral_link}',
+            'referral_count': self.referral_count,
         }
 
 
@@ -193,7 +207,7 @@ class Address(db.Model):
     country = db.Column(db.String(50), nullable=True)
     state = db.Column(db.String(50), nullable=True)
     
-    user_id = db.Column(db.Integer, db.ForeignKey('app_user.id', ondelete='CASCADE'), nullable=False,)
+    user_id = db.Column(db.Integer, db.ForeignKey('app_user.id', ondelete='CASCADE'), nullable=False, index=True)
     app_user = db.relationship('AppUser', back_populates="address")
     
     def __repr__(self):
@@ -202,7 +216,7 @@ class Address(db.Model):
     def update(self, **kwargs):
         for key, value in kwargs.items():
             setattr(self, key, value)
-        db.session.commit()
+        commit_session()
     
     def to_dict(self):
         return {
@@ -0,0 +1,215 @@
+"""
+Fingerprinted and precompressed static assets for the BitnShop Flask application.
+
+`flask assets build` copies every static file to `static/build/` under a content
+hashed name (e.g. `dist/css/output.3f9c2a7d1b.css`), writes `.gz`/`.br` siblings
+of the text assets and a `manifest.json`. The relative `url()`s of stylesheets are
+rewritten to the hashed names of what they reference before the stylesheets are
+hashed, so a changed image or font also changes the URL of the CSS using it, and
+background images with variants from `flask images build` get an `image-set()`
+of their AVIF/WebP/JPEG copies. At runtime `url_for('static', ...)`
+emits the hashed URL and the static view serves the best precompressed variant
+with a far-future immutable Cache-Control. Without a build, static files are
+served as before.
+
+Author: Emmanuel Olowu
+Link: https://github.com/zeddyemy
+Copyright: © 2024 Emmanuel Olowu <zeddyemy@gmail.com>
+License: MIT, see LICENSE for more details.
+Package: BitnShop
+"""
+import os, re, gzip, json, hashlib, mimetypes, posixpath
+from flask import request, send_from_directory
+
+try:
+    import brotli
+except ImportError: # .br files are skipped without the `brotli` package
+    brotli = None
+
+
+BUILD_DIR = 'build'
+MANIFEST_NAME = 'manifest.json'
+STATIC_VARIANTS_DIR = 'variants' # written by `flask images build`, fingerprinted like the other files
+IMAGE_MANIFEST_NAME = 'images.json'
+SKIP_DIRS = (BUILD_DIR, 'uploads', 'src') # generated, user content, and un-built sources
+COMPRESSIBLE = ('.css', '.js', '.svg', '.json', '.txt', '.html', '.xml', '.map', '.ico')
+IMMUTABLE_CACHE_CONTROL = 'public, max-age=31536000, immutable'
+
+_CSS_URL_RE = re.compile(r'''url\(\s*(['"]?)([^'"()]+?)\1\s*\)''')
+_CSS_BACKGROUND_RE = re.compile(r'''(background-image\s*:\s*)url\(\s*(['"]?)([^'"()]+?)\2\s*\)\s*(;|(?=\}))''')
+_IMAGE_SET_TYPES = (('avif', 'image/avif'), ('webp', 'image/webp'), ('jpeg', 'image/jpeg')) # best first
+
+
+def _hashed_name(path: str, content: bytes) -> str:
+    root, ext = os.path.splitext(path)
+    return f'{root}.{hashlib.sha256(content).hexdigest()[:10]}{ext}'
+
+
+def load_image_manifest(static_folder: str) -> dict:
+    ''' The variants of the static images written by `flask images build`, by image path '''
+    try:
+        with open(os.path.join(static_folder, STATIC_VARIANTS_DIR, IMAGE_MANIFEST_NAME)) as file:
+            return json.load(file)
+    except (OSError, ValueError):
+        return {}
+
+
+def _add_image_sets(css: str, source: str, image_manifest: dict) -> str:
+    """
+    Follows each `background-image: url(...)` of a static image that has variants with
+    an `image-set()` of its largest AVIF/WebP/JPEG copies. Browsers without image-set()
+    type() support drop that declaration and keep the original url().
+    """
+    css_dir = posixpath.dirname(source)
+
+    def replace(match):
+        prefix, quote, ref, end = match.groups()
+        variants = image_manifest.get(posixpath.normpath(posixpath.join(css_dir, re.match(r'[^?#]*', ref).group(0))))
+        candidates = []
+        for fmt, mimetype in _IMAGE_SET_TYPES:
+            largest = max((variant for variant in variants or () if variant['format'] == fmt), key=lambda variant: variant['width'], default=None)
+            if largest:
+                candidates.append(f'url("{posixpath.relpath(largest["path"], css_dir)}") type("{mimetype}")')
+        if not candidates:
+            return match.group(0)
+        return f'{prefix}url({quote}{ref}{quote});\n    {prefix}image-set({", ".join(candidates)}){end}'
+
+    return _CSS_BACKGROUND_RE.sub(replace, css)
+
+
+def _rewrite_css_urls(css: str, source: str, build_file) -> str:
+    """
+    Points the relative `url()`s of a stylesheet at the hashed files, as seen from the
+    stylesheet's own hashed location (the same directory under `build/`).
+
+    Args:
+        css (str): The stylesheet.
+        source (str): Its path relative to the static folder.
+        build_file (callable): Builds a source path and returns its hashed path, or None
+            when there's no such static file.
+    """
+    css_dir = posixpath.dirname(source)
+
+    def replace(match):
+        quote, ref = match.groups()
+        if ref.startswith(('data:', '#', '/')) or '://' in ref:
+            return match.group(0)
+        path, suffix = re.match(r'([^?#]*)(.*)', ref).groups() # e.g. font.eot?#iefix
+        hashed = build_file(posixpath.normpath(posixpath.join(css_dir, path)))
+        if hashed is None:
+            return match.group(0)
+        new_ref = posixpath.relpath(hashed, posixpath.join(BUILD_DIR, css_dir))
+        return f'url({quote}{new_ref}{suffix}{quote})'
+
+    return _CSS_URL_RE.sub(replace, css)
+
+
+def build_assets(static_folder: str) -> dict:
+    """
+    Writes the fingerprinted copies, their compressed siblings and the manifest.
+
+    Stylesheets are built after the files their `url()`s reference, see `_add_image_sets`
+    and `_rewrite_css_urls`.
+
+    Args:
+        static_folder (str): The app's static folder.
+
+    Returns:
+        dict: The manifest, mapping each source path (relative to the static folder)
+            to its hashed path.
+    """
+    build_root = os.path.join(static_folder, BUILD_DIR)
+    manifest = {}
+    image_manifest = load_image_manifest(static_folder)
+
+    sources = {}
+    for dirpath, dirnames, filenames in os.walk(static_folder):
+        rel_dir = os.path.relpath(dirpath, static_folder)
+        if rel_dir == '.':
+            dirnames[:] = [name for name in dirnames if name not in SKIP_DIRS]
+        for filename in filenames:
+            source = os.path.normpath(os.path.join(rel_dir, filename)).replace(os.sep, '/')
+            sources[source] = os.path.join(dirpath, filename)
+
+    def build_file(source):
+        if source in manifest or source not in sources:
+            return manifest.get(source)
+        manifest[source] = None # a stylesheet referencing itself (or a cycle) keeps its url as is
+
+        with open(sources[source], 'rb') as file:
+            content = file.read()
+        if source.endswith('.css'):
+            css = _add_image_sets(content.decode('utf-8'), source, image_manifest)
+            content = _rewrite_css_urls(css, source, build_file).encode('utf-8')
+
+        hashed = manifest[source] = f'{BUILD_DIR}/{_hashed_name(source, content)}'
+        target = os.path.join(static_folder, hashed)
+        if os.path.exists(target):
+            return hashed # same content already built
+
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        with open(target, 'wb') as file:
+            file.write(content)
+
+        if source.endswith(COMPRESSIBLE):
+            with open(f'{target}.gz', 'wb') as file:
+                file.write(gzip.compress(content, compresslevel=9, mtime=0))
+            if brotli is not None:
+                with open(f'{target}.br', 'wb') as file:
+                    file.write(brotli.compress(content, quality=11))
+        return hashed
+
+    # everything else first, so stylesheets find what they reference already hashed
+    for source in sorted(sources, key=lambda source: source.endswith('.css')):
+        build_file(source)
+
+    os.makedirs(build_root, exist_ok=True)
+    with open(os.path.join(build_root, MANIFEST_NAME), 'w') as file:
+        json.dump(manifest, file, indent=2, sort_keys=True)
+
+    return manifest
+
+
+def load_manifest(static_folder: str) -> dict:
+    try:
+        with open(os.path.join(static_folder, BUILD_DIR, MANIFEST_NAME)) as file:
+            return json.load(file)
+    except (OSError, ValueError):
+        return {}
+
+
+def init_assets(app) -> None:
+    """
+    Makes `url_for('static', ...)` emit the hashed URLs of the last `flask assets build`
+    and serves them precompressed. Does nothing when no build exists.
+    """
+    manifest = load_manifest(app.static_folder)
+    app.extensions['asset_manifest'] = manifest
+    if not manifest:
+        return
+
+    @app.url_defaults
+    def hashed_static_url(endpoint, values):
+        if endpoint == 'static' and values.get('filename') in manifest:
+            values['filename'] = manifest[values['filename']]
+
+    serve_static = app.view_functions['static']
+
+    def static(filename):
+        if not filename.startswith(f'{BUILD_DIR}/'):
+            return serve_static(filename=filename)
+
+        mimetype = mimetypes.guess_type(filename)[0] or 'application/octet-stream'
+        for encoding, suffix in (('br', '.br'), ('gzip', '.gz')):
+            if request.accept_encodings.quality(encoding) > 0 and os.path.isfile(os.path.join(app.static_folder, filename + suffix)):
+                response = send_from_directory(app.static_folder, filename + suffix, mimetype=mimetype)
+                response.headers['Content-Encoding'] = encoding
+                break
+        else:
+            response = send_from_directory(app.static_folder, filename, mimetype=mimetype)
+
+        response.headers['Cache-Control'] = IMMUTABLE_CACHE_CONTROL
+        response.vary.add('Accept-Encoding')
+        return response
+
+    app.view_functions['static'] = static
@@ -0,0 +1,187 @@
+"""
+Sends a Broadcast (see models.mail) to every user of a segment.
+
+Recipients are selected in AppUser.id order, one short keyset query per batch
+(`id > last id LIMIT batch_size`), and only their id, email and username are
+loaded, so memory stays the same whether the segment has a thousand users or a
+million. Each batch is rendered through the email type's render plan, sent over
+one reused SMTP connection at no more than `rate` emails per second, and then
+checkpointed: the broadcast's counters and `last_user_id` are updated in one
+UPDATE and committed. A stopped, failed or paused broadcast resumes after the
+last checkpoint, so at most one batch is sent twice after a crash.
+
+Deactivated users are never in a segment. A segment is a dict with any of:
+    roles (list): RoleNames values, e.g. ['Customer'].
+    joined_after, joined_before (str): ISO dates, on AppUser.date_joined.
+    countries (list): Address.country values, case-insensitive.
+
+Author: Emmanuel Olowu
+Link: https://github.com/zeddyemy
+Copyright: © 2024 Emmanuel Olowu <zeddyemy@gmail.com>
+License: MIT, see LICENSE for more details.
+Package: BitnShop
+"""
+import logging, smtplib, time
+from datetime import datetime
+from sqlalchemy import select, update, func
+
+from ..extensions import db
+from ..models import AppUser, Address, Role, RoleNames, Broadcast, BroadcastStatus
+from .mail_pool import SMTPConnection
+from .helpers.mail_helpers import build_emails, build_message
+
+
+logger = logging.getLogger(__name__)
+
+# errors about one recipient or message, the connection is fine for the next ones
+_RECIPIENT_ERRORS = (smtplib.SMTPRecipientsRefused, smtplib.SMTPDataError)
+
+
+def segment_filters(segment: dict) -> list:
+    """
+    The AppUser filters of a segment, raises ValueError for unknown roles or bad dates.
+    """
+    filters = [AppUser.is_active.is_(True)]
+    if segment.get('roles'):
+        roles = [RoleNames.get_member_by_value(value) for value in segment['roles']]
+        if None in roles:
+            raise ValueError(f"Unknown role in {segment['roles']}, expected some of {[role.value for role in RoleNames]}")
+        filters.append(AppUser.roles.any(Role.name.in_(roles)))
+    if segment.get('joined_after'):
+        filters.append(AppUser.date_joined >= datetime.fromisoformat(segment['joined_after']))
+    if segment.get('joined_before'):
+        filters.append(AppUser.date_joined < datetime.fromisoformat(segment['joined_before']))
+    if segment.get('countries'):
+        countries = [country.lower() for country in segment['countries']]
+        filters.append(AppUser.address.has(func.lower(Address.country).in_(countries)))
+    return filters
+
+
+def count_segment(segment: dict) -> int:
+    return db.session.scalar(select(func.count(AppUser.id)).where(*segment_filters(segment)))
+
+
+def iter_recipient_batches(segment: dict, after_id: int = 0, batch_size: int = 1000):
+    """
+    Yields the segment's users as lists of (id, email, username) rows, in id order.
+
+    Each batch is its own query, no cursor stays open while the batch is sent.
+    """
+    filters = segment_filters(segment)
+    while True:
+        rows = db.session.execute(
+            select(AppUser.id, AppUser.email, AppUser.username)
+            .where(AppUser.id > after_id, *filters)
+            .order_by(AppUser.id)
+            .limit(batch_size)
+        ).all()
+        if not rows:
+            return
+        yield rows
+        after_id = rows[-1].id
+
+
+class RateLimiter:
+    """
+    A token bucket allowing `rate` acquisitions per second on average and bursts
+    of up to `burst`. A `rate` of 0 or None doesn't limit.
+    """
+
+    def __init__(self, rate: float, burst: int = None):
+        self.rate = rate
+        self.burst = burst or max(1, int(rate or 1))
+        self.tokens = self.burst
+        self.updated = time.monotonic()
+
+    def acquire(self) -> None:
+        if not self.rate:
+            return
+        now = time.monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if self.tokens < 1:
+            time.sleep((1 - self.tokens) / self.rate)
+            self.tokens, self.updated = 0, time.monotonic()
+        else:
+            self.tokens -= 1
+
+
+def _checkpoint(broadcast_id: int, last_user_id: int, sent: int, failed: int) -> str:
+    ''' Saves the progress of a batch and returns the broadcast's status, which an admin may have paused '''
+    try:
+        db.session.execute(
+            update(Broadcast).where(Broadcast.id == broadcast_id).values(
+                sent_count=Broadcast.sent_count + sent,
+                failed_count=Broadcast.failed_count + failed,
+                last_user_id=last_user_id,
+            )
+        )
+        status = db.session.scalar(select(Broadcast.status).where(Broadcast.id == broadcast_id))
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        raise
+    return status
+
+
+def run_broadcast(broadcast: Broadcast, connection: SMTPConnection, batch_size: int = 500, rate: float = None, on_progress=None) -> str:
+    """
+    Sends a broadcast from its last checkpoint until it completes or is paused.
+
+    Args:
+        broadcast (Broadcast): A pending, sending or paused broadcast.
+        connection (SMTPConnection): The connection every email is sent over.
+        batch_size (int): Recipients loaded, rendered and checkpointed together.
+        rate (float, optional): Emails per second, unlimited when falsy.
+        on_progress (callable, optional): Called after each batch with the broadcast's
+            (sent_count, failed_count, total).
+
+    Returns:
+        str: The broadcast's status when it stopped, 'completed' or 'paused'.
+
+    Raises:
+        OSError: When the SMTP server can't be reached, after saving the progress so far.
+    """
+    if broadcast.status == BroadcastStatus.COMPLETED.value:
+        return broadcast.status
+
+    if broadcast.total is None:
+        broadcast.total = count_segment(broadcast.segment)
+    broadcast.status = BroadcastStatus.SENDING.value
+    broadcast.started_at = broadcast.started_at or datetime.utcnow()
+    # snapshot before commit() expires the instance
+    broadcast_id, email_type, subject, segment = broadcast.id, broadcast.email_type, broadcast.subject, broadcast.segment
+    shared = {'subject': broadcast.subject, 'message': broadcast.message}
+    sent_total, failed_total, total, after_id = broadcast.sent_count, broadcast.failed_count, broadcast.total, broadcast.last_user_id
+    db.session.commit()
+
+    limiter = RateLimiter(rate)
+    for rows in iter_recipient_batches(segment, after_id, batch_size):
+        recipients = ({'id': row.id, 'user_email': row.email, 'username': row.username} for row in rows)
+        sent = failed = 0
+        last_user_id = after_id
+        for recipient, _, html in build_emails(email_type, recipients, **shared):
+            limiter.acquire()
+            try:
+                connection.send(build_message(subject, [recipient['user_email']], html))
+                sent += 1
+            except _RECIPIENT_ERRORS as e:
+                logger.warning(f"Broadcast {broadcast_id} to {recipient['user_email']} failed: {e}")
+                failed += 1
+            except OSError:
+                _checkpoint(broadcast_id, last_user_id, sent, failed)
+                raise
+            last_user_id = recipient['id']
+
+        status = _checkpoint(broadcast_id, last_user_id, sent, failed)
+        after_id = last_user_id
+        sent_total, failed_total = sent_total + sent, failed_total + failed
+        if on_progress:
+            on_progress(sent_total, failed_total, total)
+        if status == BroadcastStatus.PAUSED.value:
+            return status
+
+    db.session.execute(update(Broadcast).where(Broadcast.id == broadcast_id)
+                       .values(status=BroadcastStatus.COMPLETED.value, finished_at=datetime.utcnow()))
+    db.session.commit()
+    return BroadcastStatus.COMPLETED.value
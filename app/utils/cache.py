@@ -0,0 +1,68 @@
+"""
+In-process caches used by BitnShop to avoid re-rendering or re-querying
+things that rarely change (e.g. product cards on the catalog pages).
+
+Author: Emmanuel Olowu
+Link: https://github.com/zeddyemy
+Copyright: © 2024 Emmanuel Olowu <zeddyemy@gmail.com>
+License: MIT, see LICENSE for more details.
+Package: BitnShop
+"""
+from collections import OrderedDict
+from threading import Lock
+
+from ..config import Config
+
+
+class LRUCache:
+    ''' A small thread-safe least-recently-used cache
+
+    Keys should embed a version (e.g. `product-card:12:1714222683.0`) so stale
+    entries are never read again and simply fall off the end of the cache.
+    '''
+
+    def __init__(self, maxsize: int = 1024):
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._data = OrderedDict()
+        self._lock = Lock()
+
+    def get(self, key, default=None):
+        with self._lock:
+            try:
+                value = self._data.pop(key)
+            except KeyError:
+                self.misses += 1
+                return default
+            self._data[key] = value
+            self.hits += 1
+            return value
+
+    def set(self, key, value) -> None:
+        with self._lock:
+            self._data.pop(key, None)
+            self._data[key] = value
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def delete(self, key) -> None:
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+    def stats(self) -> dict:
+        return {'size': len(self._data), 'maxsize': self.maxsize, 'hits': self.hits, 'misses': self.misses}
+
+
+# rendered HTML fragments, e.g. product cards
+fragment_cache = LRUCache(Config.FRAGMENT_CACHE_SIZE)
+
+# user id -> (expires at, UserIdentity), see user_helpers.get_user_identity
+identity_cache = LRUCache(Config.IDENTITY_CACHE_SIZE)
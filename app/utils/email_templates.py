@@ -0,0 +1,87 @@
+"""
+Precompiled render plans for the email templates of the BitnShop Flask application.
+
+An email template is rendered through Jinja once, with a placeholder in place of
+each per-recipient field (username, amount, ...). The output is split into its
+static parts and the names of the fields between them, and every message after
+that is a join of those parts with the escaped field values, without going
+through Jinja again:
+
+    values = {'username': 'jane', 'user_email': 'jane@example.com', ...}
+    html = get_render_plan('email/welcome.html', fields=present_fields(values)).render(values)
+
+A plan only has placeholders for the per-recipient fields a message actually has
+(non-empty), the others are undefined while Jinja renders it, so templates may
+test them for truthiness (`{% if amount %}`): there is one plan per set of fields
+given. Anything else the templates branch on (comparisons, filters, other
+variables) must be passed as `shared` context, which is rendered by Jinja and is
+part of the plan's cache key.
+
+Author: Emmanuel Olowu
+Link: https://github.com/zeddyemy
+Copyright: © 2024 Emmanuel Olowu <zeddyemy@gmail.com>
+License: MIT, see LICENSE for more details.
+Package: BitnShop
+"""
+from flask import current_app
+from markupsafe import escape
+
+from .cache import LRUCache
+
+
+PERSONAL_FIELDS = ('user_email', 'username', 'verification_code', 'amount', 'redirect_link')
+
+_MARK = '\x00' # can't appear in rendered html, and isn't escaped by autoescape
+
+
+class RenderPlan:
+    """
+    A template rendered once with placeholders for some of the PERSONAL_FIELDS.
+
+    Args:
+        template (jinja2.Template): The compiled template.
+        shared (dict): Context that is the same for every message of this plan.
+        fields (frozenset): The personal fields the messages of this plan have.
+    """
+
+    def __init__(self, template, shared: dict, fields: frozenset = frozenset(PERSONAL_FIELDS)):
+        self.template = template
+        placeholders = {field: f'{_MARK}{field}{_MARK}' for field in fields}
+        parts = template.render(**shared, **placeholders).split(_MARK)
+        self.static = parts[0::2]
+        self.fields = parts[1::2]
+
+    def render(self, values: dict) -> str:
+        ''' The html of one message, missing values render as empty strings '''
+        out = [self.static[0]]
+        for field, static in zip(self.fields, self.static[1:]):
+            value = values.get(field)
+            out.append(escape(value) if value is not None else '')
+            out.append(static)
+        return ''.join(out)
+
+    def is_up_to_date(self) -> bool:
+        return self.template.is_up_to_date
+
+
+def present_fields(values: dict) -> frozenset:
+    ''' The personal fields a message has, the `fields` of its plan '''
+    return frozenset(field for field in PERSONAL_FIELDS if values.get(field))
+
+
+_plans = LRUCache(256)
+
+def get_render_plan(template_name: str, fields: frozenset = frozenset(PERSONAL_FIELDS), **shared) -> RenderPlan:
+    """
+    The render plan of a template for the given personal fields and shared context, built on first use.
+
+    The plans are cached per template, fields and shared context, and rebuilt when
+    the template file changes if the app reloads templates (debug mode).
+    """
+    jinja_env = current_app.jinja_env
+    key = (id(jinja_env), template_name, fields, tuple(sorted(shared.items())))
+    plan = _plans.get(key)
+    if plan is None or (jinja_env.auto_reload and not plan.is_up_to_date()):
+        plan = RenderPlan(jinja_env.get_template(template_name), shared, fields)
+        _plans.set(key, plan)
+    return plan
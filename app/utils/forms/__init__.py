@@ -7,4 +7,4 @@ Package: BitnShop
 """
 
 from .auth import SignUpForm, LoginForm
-from .cpanel import AdminAddUserForm
\ No newline at end of file
+from .cpanel import AdminAddUserForm, AdminImportUsersForm
\ No newline at end of file
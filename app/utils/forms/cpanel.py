@@ -7,7 +7,8 @@ Package: BitnShop
 """
 from wsgiref.validate import validator
 from flask_wtf import FlaskForm
-from wtforms import (StringField, EmailField, PasswordField, SelectField, HiddenField, ValidationError)
+from flask_wtf.file import FileField, FileRequired, FileAllowed
+from wtforms import (StringField, EmailField, PasswordField, SelectField, HiddenField, BooleanField, ValidationError)
 from wtforms.validators import DataRequired, EqualTo, Length, Email, Regexp
 
 from ...models import AppUser
@@ -64,3 +65,16 @@ class AdminAddUserForm(FlaskForm):
     def validate_username(self, username):
         if AppUser.query.filter_by(username=username.data).first():
             raise ValidationError("Username already taken!")
+
+
+class AdminImportUsersForm(FlaskForm):
+    """form for the admin to import users from a CSV or JSON lines file"""
+    file = FileField(
+        'File', validators=[FileRequired(), FileAllowed(['csv', 'jsonl', 'ndjson'], 'Upload a .csv or .jsonl file')]
+    )
+    role = SelectField(
+        'Default role',
+        choices=get_role_names,
+        validate_choice=False
+    )
+    notify = BooleanField('Send a welcome email to every imported user')
@@ -8,11 +8,13 @@ Package: BitnShop
 
 import sys
 from flask import request, jsonify, current_app
-from sqlalchemy import desc
+from sqlalchemy import desc, select, update, func
 
 from ...extensions import db
-from ...models import Category
+from ...models import Category, Product, ProductStatus, product_category, recount_subtree_counts
 from ...config import Config
+from ..unit_of_work import commit_session
+from ..page_cache import mark_catalog_changed
 from .basic_helpers import int_or_none, generate_slug, console_log
 
 
@@ -53,4 +55,104 @@ def get_all_categories(cat_id: int=None, page_num: int=None, paginate: bool = Fa
         
         return pagination
     
-    return all_categories
\ No newline at end of file
+    return all_categories
+
+
+def get_subtree_categories(category: Category, include_self: bool = True, max_depth: int = None):
+    ''' Gets every descendant of a Category in one indexed query
+    
+    :param category: The root of the subtree.
+    :param include_self: Include the root category itself.
+    :param max_depth: Only go this many levels below the root (None for the whole subtree).
+    '''
+    query = Category.query.filter(Category.path.like(f'{category.path}%'))
+    
+    if not include_self:
+        query = query.filter(Category.id != category.id)
+    if max_depth is not None:
+        query = query.filter(Category.depth <= category.depth + max_depth)
+    
+    return query.order_by(Category.path)
+
+
+def get_category_breadcrumbs(category: Category) -> list:
+    ''' Gets the ancestors of a Category, from the root down to the category itself
+    
+    The ancestor IDs are read off the materialized path, so this is a single primary key lookup.
+    '''
+    ids = category.ancestor_ids + [category.id]
+    return Category.query.filter(Category.id.in_(ids)).order_by(Category.depth).all()
+
+
+def get_category_menu(max_depth: int = 1) -> list:
+    ''' Gets the category tree down to `max_depth` levels as nested dicts, in one query
+    
+    Each dict is `Category.to_dict()` with an extra `children` list.
+    '''
+    categories = Category.query.filter(Category.depth <= max_depth).order_by(Category.path).all()
+    
+    nodes = {}
+    menu = []
+    for cat in categories: # ordering by path guarantees parents come before their children
+        node = {**cat.to_dict(), 'children': []}
+        nodes[cat.id] = node
+        parent = nodes.get(cat.parent_id)
+        if parent is not None:
+            parent['children'].append(node)
+        else:
+            menu.append(node)
+    
+    return menu
+
+
+def get_products_in_category_tree(category: Category, published_only: bool = True):
+    ''' Gets the products linked to a Category or any of its subcategories, in one query
+    
+    e.g. all products under Electronics, including Phones and Phones > Android
+    '''
+    in_subtree = db.session.query(product_category.c.product_id) \
+        .join(Category, Category.id == product_category.c.category_id) \
+        .filter(Category.path.like(f'{category.path}%'))
+    
+    query = Product.query.filter(Product.id.in_(in_subtree))
+    if published_only:
+        query = query.filter(Product.pub_status == ProductStatus.PUBLISHED.value)
+    
+    return query
+
+
+def latest_category_update():
+    ''' The most recent `updated_at` of any category (an index lookup)
+    
+    Every page renders the category sidebar (with product counts), so this is part
+    of every page's validators, see `decorators.conditional_get`.
+    '''
+    return db.session.scalar(select(func.max(Category.updated_at)))
+
+
+def move_category(category: Category, new_parent_id: int = None) -> None:
+    ''' Moves a Category (and its whole subtree) under a new parent
+    
+    The subtree's paths are rewritten by a single bulk UPDATE in the Category
+    `before_update` event. Raises ValueError when moving a category under itself.
+    '''
+    category.update(parent_id=new_parent_id)
+
+
+def recount_category_counters() -> None:
+    ''' Recomputes every Category's published product counters from scratch
+    
+    Repairs any drift in the denormalized `product_count` / `subtree_product_count`
+    columns with two set-based UPDATE statements.
+    '''
+    published_links = select(func.count()) \
+        .select_from(product_category.join(Product, Product.id == product_category.c.product_id)) \
+        .where(product_category.c.category_id == Category.id, Product.pub_status == ProductStatus.PUBLISHED.value) \
+        .scalar_subquery()
+    db.session.execute(update(Category).values(product_count=published_links).execution_options(synchronize_session=False))
+    
+    # distinct products, as one product may be linked to several categories of a subtree
+    recount_subtree_counts(db.session.connection())
+    
+    mark_catalog_changed(db.session)
+    commit_session()
@@ -6,14 +6,21 @@ License: MIT, see LICENSE for more details.
 Package: BitnShop
 """
 
-from threading import Thread
-from flask import render_template, current_app
-from flask_mail import Message
+from flask import current_app
+from flask_mail import sanitize_address
+from email.header import Header
+from email.mime.text import MIMEText
+from email.charset import Charset, BASE64
+from email.utils import formatdate, make_msgid, parseaddr
 from enum import Enum
+from collections import namedtuple
 
 from ...config import Config
+from ...extensions import db
 from ...models.user import AppUser
-from ...extensions import mail
+from ...models.mail import EmailOutbox
+from ..mail_pool import get_mail_pool, OutgoingMail
+from ..email_templates import get_render_plan, present_fields
 from .basic_helpers import console_log, log_exception
 
 class EmailType(Enum):
@@ -21,136 +28,220 @@ class EmailType(Enum):
     PWD_RESET = 'pwd_reset'
     TWO_FA = '2FA'
     WELCOME = 'welcome'
+    MEMBERSHIP = 'membership'
     TASK_APPROVED = 'task_approved'
     TASK_REJECTED = 'task_rejected'
     CREDIT = 'credit'
     DEBIT = 'debit'
+    NEW_ADMIN = 'new_admin'
+    ADMIN_LOGIN = 'admin_login'
+    BROADCAST = 'broadcast'
+    
+    @classmethod
+    def lookup(cls, value, default=None):
+        """ The member for an EmailType or its value, `default` for unknown values """
+        if isinstance(value, cls):
+            return value
+        return next((member for member in cls if member.value == value), default)
 
-# SEND VERIFICATION CODE TO USER'S EMAIL
-def send_code_async_email(app, user_email, six_digit_code, code_type):
+
+EmailSpec = namedtuple('EmailSpec', ['subject', 'template', 'redirect_link'])
+
+EMAIL_SPECS = {
+    EmailType.VERIFY_EMAIL: EmailSpec('Verify Your Email', 'email/verify_email2.html', None),
+    EmailType.PWD_RESET: EmailSpec('Reset your password', 'email/pwd_reset2.html', None),
+    EmailType.TWO_FA: EmailSpec('One Time Password', 'email/otp.html', None),
+    EmailType.MEMBERSHIP: EmailSpec('membership', 'email/membership_paid2.html', 'https://app.trendit3.com/'),
+    EmailType.WELCOME: EmailSpec('Welcome', 'email/welcome.html', 'https://app.trendit3.com/'),
+    EmailType.TASK_APPROVED: EmailSpec('Task Approved', 'email/task_approved.html', 'https://app.trendit3.com/'),
+    EmailType.TASK_REJECTED: EmailSpec('Task Rejected', 'email/task_declined.html', 'https://app.trendit3.com/'),
+    EmailType.CREDIT: EmailSpec('Account Credited', 'email/credit_alert.html', 'https://app.trendit3.com/'),
+    EmailType.DEBIT: EmailSpec('Account Debited', 'email/debit_alert.html', 'https://app.trendit3.com/'),
+    EmailType.NEW_ADMIN: EmailSpec('Admin Approved', 'email/new_admin.html', 'https://admin.trendit3.com/'),
+    EmailType.ADMIN_LOGIN: EmailSpec('Admin Login', 'email/admin_login.html', 'https://admin.trendit3.com/verify-login?token={admin_login_code}'),
+    EmailType.BROADCAST: EmailSpec('BitnShop', 'email/broadcast.html', 'https://app.trendit3.com/'), # shared: subject, message
+}
+
+CODE_EMAIL_TYPES = (EmailType.VERIFY_EMAIL, EmailType.PWD_RESET, EmailType.TWO_FA)
+
+
+def render_email(template_name: str, **context) -> str:
+    """ Renders an email template without running the app's context processors (they query and close the db session) """
+    return current_app.jinja_env.get_template(template_name).render(**context)
+
+
+_UTF8_BASE64 = Charset('utf-8')
+_UTF8_BASE64.body_encoding = BASE64 # html lines may be longer than SMTP allows unencoded
+
+def build_message(subject: str, recipients: list, html: str, sender=None) -> OutgoingMail:
     """
-    Sends an email asynchronously.
+    Serializes an html email for the mail worker pool or an SMTPConnection.
 
-    This function runs in a separate thread and sends an email to the user. 
-    It uses the Flask application context to ensure the mail object works correctly.
+    Builds a single-part MIMEText with the compat32 policy: Flask-Mail's Message
+    is multipart and re-parses every header when serialized, about 50 times slower.
+    """
+    sender = sanitize_address(sender or Config.MAIL_USERNAME)
+    recipients = [sanitize_address(addr) for addr in recipients]
+    msg = MIMEText(html, 'html', _UTF8_BASE64)
+    msg['Subject'] = subject if subject.isascii() else Header(subject, 'utf-8')
+    msg['From'] = sender
+    msg['To'] = ', '.join(recipients)
+    msg['Date'] = formatdate(localtime=True)
+    msg['Message-ID'] = make_msgid(domain=parseaddr(sender)[1].rpartition('@')[2] or 'localhost') # without a domain it resolves the hostname every time
+    return OutgoingMail(sender, recipients, msg.as_bytes())
+
+
+def queue_email(subject: str, recipients: list, html: str, sender=None) -> None:
+    """
+    Builds a message and hands it to the mail worker pool (see utils.mail_pool).
+
+    Blocks for up to MAIL_SUBMIT_TIMEOUT seconds when the pool's queue is full,
+    then raises MailQueueFull.
+    """
+    get_mail_pool(current_app._get_current_object()).submit(build_message(subject, recipients, html, sender))
+
+
+def _get_username(user_email: str) -> str:
+    user = AppUser.query.filter(AppUser.email == user_email).first()
+    return user.username if user else ''
+
+
+def _personal_values(spec: EmailSpec, user_email: str, username: str, context: dict) -> dict:
+    values = dict(context, user_email=user_email, username=username or 'there')
+    if spec.redirect_link:
+        values['redirect_link'] = spec.redirect_link.format(admin_login_code=context.get('admin_login_code') or '')
+    return values
+
+
+def _email_spec(email_type) -> EmailSpec:
+    member = EmailType.lookup(email_type)
+    if member is None:
+        raise ValueError(f'Unknown email type {email_type!r}')
+    return EMAIL_SPECS[member]
+
+
+def build_email(email_type, user_email: str, username=None, **context) -> tuple:
+    """
+    Renders an email through its type's precompiled render plan (see utils.email_templates).
 
     Args:
-        app (Flask): The Flask application instance.
-        user_email (str): The email address of the user.
-        six_digit_code (str): The six-digit code to include in the email.
-        code_type (str): The type of the code ('verify_email', 'pwd_reset', '2FA').
+        email_type (EmailType | str): One of EMAIL_SPECS.
+        user_email (str): The recipient.
+        username (str, optional): Looked up when not given.
+        **context: The other PERSONAL_FIELDS of the template, e.g. verification_code, amount.
 
     Returns:
-        None
+        tuple: The (subject, html) of the email.
+
+    Raises:
+        ValueError: For an unknown email type.
+    """
+    spec = _email_spec(email_type)
+    username = _get_username(user_email) if username is None else username
+    values = _personal_values(spec, user_email, username, context)
+    html = get_render_plan(spec.template, fields=present_fields(values)).render(values)
+    return spec.subject, html
+
+
+def build_emails(email_type, recipients, **shared):
+    """
+    Renders one email type for many recipients, e.g. a campaign.
+
+    The template goes through Jinja once, each message is then a join of the
+    plan's static parts with the recipient's escaped values.
+
+    Args:
+        email_type (EmailType | str): One of EMAIL_SPECS, ValueError for unknown types.
+        recipients (iterable): Dicts with a 'user_email' and the recipient's other
+            PERSONAL_FIELDS ('username', 'amount', ...). Usernames are not looked up.
+        **shared: Context that is the same for every message, it may be used in
+            `{% if %}` blocks of the template.
+
+    Yields:
+        tuple: (recipient, subject, html) for each recipient.
+    """
+    spec = _email_spec(email_type)
+    plans = {} # by the set of fields the recipients have, e.g. with and without an amount
+    for recipient in recipients:
+        context = dict(recipient)
+        user_email, username = context.pop('user_email'), context.pop('username', None)
+        values = _personal_values(spec, user_email, username, context)
+        fields = present_fields(values)
+        plan = plans.get(fields)
+        if plan is None:
+            plan = plans[fields] = get_render_plan(spec.template, fields=fields, **shared)
+        yield recipient, spec.subject, plan.render(values)
+
+
+def enqueue_email(user_email: str, email_type: str, **context) -> EmailOutbox:
     """
-    with app.app_context():
-        subject = 'Verify Your Email'
-        template = render_template("email/verify_email2.html", verification_code=six_digit_code)
-        msg = Message(subject, sender=Config.MAIL_USERNAME, recipients=[user_email], html=template)
-        
-        user = AppUser.query.filter(AppUser.email == user_email).first()
-        username = user.username if user else ''
-        
-        if code_type == 'pwd_reset':
-            subject = 'Reset your password'
-            template = render_template("email/pwd_reset2.html", verification_code=six_digit_code, user_email=user_email, username=username)
-            msg = Message(subject, sender=Config.MAIL_USERNAME, recipients=[user_email], html=template)
-
-        elif code_type == '2FA':
-            subject = 'One Time Password'
-            template = render_template("email/otp.html", verification_code=six_digit_code, user_email=user_email)
-            msg = Message(subject, sender=Config.MAIL_USERNAME, recipients=[user_email], html=template)
-        try:
-            mail.send(msg)
-        except Exception as e:
-            console_log('EXCEPTION SENDING MAIL', f'An error occurred while sending the {code_type} code: {str(e)}')
-
-
-def send_code_to_email(user_email, six_digit_code, code_type='verify_email'):
+    Adds an email to the outbox in the current transaction, without committing.
+
+    The email is only sent (by `flask mail drain`) if the caller's transaction
+    commits, and it is rendered at send time from `context`, which must be JSON
+    serializable.
+
+    Args:
+        user_email (str): The recipient.
+        email_type (EmailType | str): The type of the email, see EMAIL_SPECS.
+        **context: Template variables, e.g. username, amount.
+
+    Returns:
+        EmailOutbox: The pending outbox row.
+
+    Raises:
+        ValueError: For an unknown email type.
     """
-    Sends a code to the user's email address in a new thread.
+    _email_spec(email_type) # raises ValueError for unknown types
+    email = EmailOutbox(email_type=EmailType.lookup(email_type).value, recipient=user_email, context=context)
+    db.session.add(email)
+    return email
 
-    This function creates a new thread and calls the send_code_async_email function in it. 
-    This allows the rest of the application to continue running while the email is being sent.
+
+# SEND VERIFICATION CODE TO USER'S EMAIL
+def send_code_to_email(user_email, six_digit_code, code_type='verify_email', username=None) -> bool:
+    """
+    Renders a code email and queues it for the mail worker pool.
 
     Args:
         user_email (str): The email address of the user.
         six_digit_code (str): The six-digit code to include in the email.
-        code_type (str, optional): The type of the code ('verify_email', 'pwd_reset', '2FA'). 
+        code_type (str, optional): The type of the code ('verify_email', 'pwd_reset', '2FA').
                                     Defaults to 'verify_email'.
+        username (str, optional): Pass it when known to save looking the user up.
 
     Returns:
-        None
+        bool: Whether the email was queued.
     """
-    Thread(target=send_code_async_email, args=(current_app._get_current_object(), user_email, six_digit_code, code_type)).start()
+    try:
+        email_type = EmailType.lookup(code_type)
+        subject, html = build_email(email_type if email_type in CODE_EMAIL_TYPES else EmailType.VERIFY_EMAIL, user_email,
+                                    username=username, verification_code=six_digit_code)
+        queue_email(subject, [user_email], html)
+        return True
+    except Exception as e:
+        log_exception(f'An error occurred while queueing the {code_type} code email', e)
+        return False
 
 
 # SEND OTHER EMAILS LIKE WELCOME MAIL, CREDIT ALERT, ETC
-def send_async_other_email(app, user_email, email_type, amount=None, admin_login_code=None):
+def send_other_emails(user_email, email_type='membership', amount=None, admin_login_code='', username=None) -> bool:
     """
-    Sends an email asynchronously.
-
-    This function runs in a separate thread and sends an email to the user. 
-    It uses the Flask application context to ensure the mail object works correctly.
+    Renders one of the non-code EMAIL_SPECS and queues it for the mail worker pool.
 
     Args:
-        app (Flask): The Flask application instance.
         user_email (str): The email address of the user.
-        email_type (str): The type of the email ('welcome', 'task_approved', 'task_rejected', 'credit', 'debit').
+        email_type (EmailType | str): e.g. 'welcome', 'credit', unknown types send 'membership'.
+        username (str, optional): Pass it when known to save looking the user up.
 
     Returns:
-        None
+        bool: Whether the email was queued.
     """
-    
-    with app.app_context():
-        user = AppUser.query.filter(AppUser.email == user_email).first()
-        username = user.username if user else ''
-        
-        subject = 'membership'
-        template = render_template("email/membership_paid2.html", redirect_link='https://app.trendit3.com/', user_email=user_email, username=username)
-        msg = Message(subject, sender=Config.MAIL_USERNAME, recipients=[user_email], html=template)
-        
-        if email_type == 'welcome':
-            subject = 'Welcome'
-            template = render_template("email/welcome.html", redirect_link='https://app.trendit3.com/', user_email=user_email, username=username)
-            msg = Message(subject, sender=Config.MAIL_USERNAME, recipients=[user_email], html=template)
-
-        elif email_type == 'task_approved':
-            subject = 'Task Approved'
-            template = render_template("email/task_approved.html", redirect_link='https://app.trendit3.com/', user_email=user_email, username=username)
-            msg = Message(subject, sender=Config.MAIL_USERNAME, recipients=[user_email], html=template)
-
-        elif email_type == 'task_rejected':
-            subject = 'Task Rejected'
-            template = render_template("email/task_declined.html", redirect_link='https://app.trendit3.com/', user_email=user_email, username=username)
-            msg = Message(subject, sender=Config.MAIL_USERNAME, recipients=[user_email], html=template)
-
-        elif email_type == 'credit':
-            subject = 'Account Credited'
-            template = render_template("email/credit_alert.html", redirect_link='https://app.trendit3.com/', user_email=user_email, username=username, amount=amount)
-            msg = Message(subject, sender=Config.MAIL_USERNAME, recipients=[user_email], html=template)
-
-        elif email_type == 'debit':
-            subject = 'Account Debited'
-            template = render_template("email/debit_alert.html", redirect_link='https://app.trendit3.com/', user_email=user_email, username=username, amount=amount)
-            msg = Message(subject, sender=Config.MAIL_USERNAME, recipients=[user_email], html=template)
-
-        elif email_type == 'new_admin':
-            subject = 'Admin Approved'
-            template = render_template("email/new_admin.html", redirect_link='https://admin.trendit3.com/', user_email=user_email, username=username, amount=amount)
-            msg = Message(subject, sender=Config.MAIL_USERNAME, recipients=[user_email], html=template)
-
-        elif email_type == 'admin_login':
-            subject = 'Admin Login'
-            template = render_template("email/admin_login.html", redirect_link=f'https://admin.trendit3.com/verify-login?token={admin_login_code}', user_email=user_email)
-            msg = Message(subject, sender="Config.MAIL_USERNAME", recipients=[user_email], html=template)
-
-        
-        try:
-            mail.send(msg)
-        except Exception as e:
-            console_log('EXCEPTION SENDING MAIL', f'An error occurred while sending the {email_type} email type: {str(e)}')
-
-
-def send_other_emails(user_email, email_type='membership', amount=None, admin_login_code=''):
-    Thread(target=send_async_other_email, args=(current_app._get_current_object(), user_email, email_type, amount, admin_login_code)).start()
\ No newline at end of file
+    try:
+        subject, html = build_email(EmailType.lookup(email_type, EmailType.MEMBERSHIP), user_email,
+                                    username=username, amount=amount, admin_login_code=admin_login_code)
+        queue_email(subject, [user_email], html)
+        return True
+    except Exception as e:
+        log_exception(f'An error occurred while queueing the {email_type} email', e)
+        return False
@@ -0,0 +1,154 @@
+"""
+This module defines helper functions for uploading media files in the BitnShop Flask application.
+
+Author: Emmanuel Olowu
+Link: https://github.com/zeddyemy
+Copyright: © 2024 Emmanuel Olowu <zeddyemy@gmail.com>
+License: MIT, see LICENSE for more details.
+Package: BitnShop
+"""
+import os, hashlib, mimetypes, tempfile
+from flask import current_app
+from sqlalchemy.exc import IntegrityError
+from werkzeug.utils import secure_filename
+
+from ...extensions import db
+from ...models import Media
+from ..unit_of_work import commit_session
+from ..storage import get_storage, content_key
+from ..images import schedule_media_variants
+
+try:
+    from PIL import Image
+except ImportError:
+    Image = None
+
+
+ALLOWED_MIME_TYPES = ('image/jpeg', 'image/png', 'image/gif', 'image/webp', 'image/avif', 'application/pdf')
+
+
+class UploadError(ValueError):
+    def __init__(self, message: str, status_code: int = 400):
+        super().__init__(message)
+        self.status_code = status_code
+
+
+def sniff_mime_type(head: bytes, filename: str = '') -> str:
+    """ Detects the mime type from the first bytes of a file, falling back on its name """
+    if head.startswith(b'\xff\xd8\xff'):
+        return 'image/jpeg'
+    if head.startswith(b'\x89PNG\r\n\x1a\n'):
+        return 'image/png'
+    if head[:6] in (b'GIF87a', b'GIF89a'):
+        return 'image/gif'
+    if head[:4] == b'RIFF' and head[8:12] == b'WEBP':
+        return 'image/webp'
+    if head[4:12] in (b'ftypavif', b'ftypavis'):
+        return 'image/avif'
+    if head.startswith(b'%PDF-'):
+        return 'application/pdf'
+    return mimetypes.guess_type(filename)[0] or 'application/octet-stream'
+
+
+def _image_size(path: str) -> tuple:
+    if Image is None:
+        return None, None
+    try:
+        with Image.open(path) as image: # only reads the header
+            return image.size
+    except Exception:
+        return None, None
+
+
+def display_filename(filename: str, fallback: str) -> str:
+    """ The client's file name made safe, and cut to fit Media.filename while keeping its extension """
+    name = secure_filename(filename) or fallback
+    max_length = Media.filename.type.length
+    if len(name) > max_length:
+        stem, extension = os.path.splitext(name)
+        extension = extension[:16]
+        name = stem[:max_length - len(extension)] + extension
+    return name
+
+
+def _temp_dir() -> str:
+    # inside the uploads dir so moving a local upload in place is a rename, not a copy
+    path = os.path.join(os.path.dirname(current_app.root_path), current_app.config['UPLOADS_DIR'], '.tmp')
+    os.makedirs(path, exist_ok=True)
+    return path
+
+
+def save_uploaded_stream(stream, filename: str = ''):
+    """
+    Saves an uploaded file read from a stream, e.g. `request.stream`.
+
+    The stream is copied to a temp file in UPLOAD_CHUNK_SIZE chunks and hashed on the
+    way, so memory use doesn't depend on the file size. When a Media with the same
+    sha256 already exists it is returned instead and nothing new is stored.
+
+    Args:
+        stream: A file-like object with a `read(size)` method.
+        filename (str): The client's file name, used for display and as a mime type hint.
+
+    Returns:
+        tuple: (Media, True when it was created or False for a duplicate)
+
+    Raises:
+        UploadError: For empty, too large or disallowed files.
+    """
+    config = current_app.config
+    max_size, chunk_size = config['MAX_UPLOAD_SIZE'], config['UPLOAD_CHUNK_SIZE']
+
+    sha256 = hashlib.sha256()
+    size, head = 0, b''
+    fd, temp_path = tempfile.mkstemp(dir=_temp_dir())
+    try:
+        with os.fdopen(fd, 'wb') as file:
+            while True:
+                chunk = stream.read(chunk_size)
+                if not chunk:
+                    break
+                size += len(chunk)
+                if size > max_size:
+                    raise UploadError(f'File is larger than {max_size} bytes', 413)
+                if len(head) < 32:
+                    head += chunk[:32 - len(head)]
+                sha256.update(chunk)
+                file.write(chunk)
+
+        if size == 0:
+            raise UploadError('Empty file')
+
+        digest = sha256.hexdigest()
+        existing = Media.query.filter_by(sha256=digest).first()
+        if existing:
+            os.remove(temp_path)
+            return existing, False
+
+        mime_type = sniff_mime_type(head, filename)
+        if mime_type not in ALLOWED_MIME_TYPES:
+            raise UploadError(f'Files of type {mime_type} are not allowed', 415)
+
+        width, height = _image_size(temp_path) if mime_type.startswith('image/') else (None, None)
+        extension = mimetypes.guess_extension(mime_type) or os.path.splitext(filename)[1]
+        key = content_key(digest, extension)
+        media_path = get_storage().save(temp_path, key, mime_type)
+    except Exception:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
+
+    media = Media(filename=display_filename(filename, os.path.basename(key)), media_path=media_path,
+                  sha256=digest, size=size, mime_type=mime_type, width=width, height=height)
+    db.session.add(media)
+    try:
+        commit_session()
+    except IntegrityError:
+        # the same file was uploaded concurrently, keep the other request's row (the stored file is shared)
+        db.session.rollback()
+        return Media.query.filter_by(sha256=digest).one(), False
+
+    if mime_type.startswith('image/'):
+        schedule_media_variants(media)
+
+    return media, True
@@ -5,10 +5,14 @@ Copyright: © 2024 Emmanuel Olowu <zeddyemy@gmail.com>
 License: MIT, see LICENSE for more details.
 Package: BitnShop
 """
+import time
+from dataclasses import dataclass
+from threading import Lock
+from flask import current_app
 from sqlalchemy import asc
 
 from ...extensions import db
-from ...models import NavigationBarItem
+from ...models import NavigationBarItem, nav_version
 from .basic_helpers import console_log
 
 def get_all_nav_items() -> object:
@@ -16,4 +20,85 @@ def get_all_nav_items() -> object:
     '''
     nav_items = NavigationBarItem.query.order_by(asc('order'))
     
-    return nav_items
\ No newline at end of file
+    return nav_items
+
+
+@dataclass(frozen=True)
+class NavNode:
+    """An immutable navigation item with its (already resolved) submenus"""
+    id: int
+    name: str
+    link: str
+    order: int
+    icon_class: str
+    icon_path: str
+    role_names: frozenset
+    children: tuple = ()
+    visible: bool = True
+    
+    def allowed_for(self, role_names: frozenset) -> bool:
+        return not self.role_names or bool(self.role_names & role_names)
+
+
+_tree_lock = Lock()
+_tree_cache = {'version': None, 'loaded_at': 0.0, 'tree': (), 'by_roles': {}}
+
+
+def _build_nav_tree() -> tuple:
+    """Loads every visible item in one query and links parents to children in O(n)"""
+    rows = NavigationBarItem.query \
+        .filter(NavigationBarItem.visible.is_(True)) \
+        .order_by(asc(NavigationBarItem.order), asc(NavigationBarItem.id)) \
+        .all()
+    
+    children_of = {}
+    for row in rows:
+        children_of.setdefault(row.parent_id, []).append(row)
+    
+    def build(row):
+        return NavNode(
+            id=row.id,
+            name=row.name,
+            link=row.link,
+            order=row.order,
+            icon_class=row.icon_class,
+            icon_path=row.icon_path,
+            role_names=row.role_names,
+            children=tuple(build(child) for child in children_of.get(row.id, ())),
+        )
+    
+    # items under a hidden (or missing) parent are dropped along with it
+    return tuple(build(row) for row in children_of.get(None, ()))
+
+
+def _filter_for_roles(nodes: tuple, role_names: frozenset) -> tuple:
+    return tuple(
+        NavNode(**{**node.__dict__, 'children': _filter_for_roles(node.children, role_names)})
+        for node in nodes if node.allowed_for(role_names)
+    )
+
+
+def get_nav_tree(role_names=None) -> tuple:
+    ''' Gets the navigation tree visible to a user with the given roles
+    
+    The tree is built from a single query and cached (per process) until a change to
+    a NavigationBarItem is committed (see models.nav.nav_version), and at most NAV_TREE_TTL
+    seconds for the workers which don't share the page cache backend, so rendering nested
+    menus costs no database queries at all.
+    
+    :param role_names: The user's role names, e.g. CURRENT_USER['roles']. Items with no
+        `visible_to` restriction are shown to everyone.
+    :return: A tuple of NavNode, each with its `children` already resolved.
+    '''
+    role_names = frozenset(role_names or ())
+    version = nav_version()
+    
+    with _tree_lock:
+        if _tree_cache['version'] != version or time.monotonic() - _tree_cache['loaded_at'] > current_app.config['NAV_TREE_TTL']:
+            _tree_cache.update(version=version, loaded_at=time.monotonic(), tree=_build_nav_tree(), by_roles={})
+        
+        tree = _tree_cache['by_roles'].get(role_names)
+        if tree is None:
+            tree = _tree_cache['by_roles'][role_names] = _filter_for_roles(_tree_cache['tree'], role_names)
+    
+    return tree
@@ -0,0 +1,435 @@
+"""
+This module defines helper functions for querying products in the BitnShop Flask application.
+
+Author: Emmanuel Olowu
+Link: https://github.com/zeddyemy
+Copyright: © 2024 Emmanuel Olowu <zeddyemy@gmail.com>
+License: MIT, see LICENSE for more details.
+Package: BitnShop
+"""
+from datetime import datetime
+from flask import current_app, g
+from markupsafe import Markup
+from sqlalchemy import select, insert, update, delete, exists, func, literal, case, true, tuple_, union_all, String
+from sqlalchemy.orm import selectinload, aliased
+
+from ...extensions import db
+from ..unit_of_work import commit_session
+from ..cache import fragment_cache
+from ..page_cache import get_page_cache, mark_catalog_changed
+from ...models import Category, adjust_category_counters, Product, ProductStatus, product_category, productVariations, ProductAttribute, AttributeValue, variation_attribute_value
+from ...config import Config
+
+
+def product_filter_clauses(category_ids=None, attribute_filters=None, min_price=None, max_price=None) -> list:
+    """
+    Builds the WHERE clauses for filtering published products.
+
+    Args:
+        category_ids (list[int], optional): Only keep products linked to one of these categories.
+        attribute_filters (dict, optional): Maps an attribute slug to a list of value slugs,
+            e.g. ``{'size': ['m'], 'color': ['red', 'blue']}``. Values of the same attribute
+            are OR'ed, different attributes are AND'ed.
+        min_price (int, optional): Minimum selling price.
+        max_price (int, optional): Maximum selling price.
+
+    Returns:
+        list: SQLAlchemy clauses to be passed to ``where()``.
+    """
+    clauses = [Product.pub_status == ProductStatus.PUBLISHED.value]
+    
+    if category_ids:
+        clauses.append(exists().where(
+            product_category.c.product_id == Product.id,
+            product_category.c.category_id.in_(category_ids)
+        ))
+    
+    for attribute_slug, value_slugs in (attribute_filters or {}).items():
+        if not value_slugs:
+            continue
+        clauses.append(exists().where(
+            productVariations.product_id == Product.id,
+            variation_attribute_value.c.variation_id == productVariations.id,
+            AttributeValue.id == variation_attribute_value.c.attribute_value_id,
+            ProductAttribute.id == AttributeValue.attribute_id,
+            ProductAttribute.slug == attribute_slug,
+            AttributeValue.slug.in_(value_slugs)
+        ))
+    
+    if min_price is not None:
+        clauses.append(Product.selling_price >= min_price)
+    if max_price is not None:
+        clauses.append(Product.selling_price <= max_price)
+    
+    return clauses
+
+
+def _price_bucket_label(price_column):
+    """Returns a CASE expression that labels a selling price with its bucket, e.g. '1000-5000'"""
+    bounds = Config.PRICE_FACET_BUCKETS
+    whens = []
+    lower = 0
+    for upper in bounds:
+        whens.append((price_column < upper, literal(f'{lower}-{upper}')))
+        lower = upper
+    
+    return case(*whens, else_=literal(f'{lower}+'))
+
+
+def get_product_facets(category_ids=None, attribute_filters=None, min_price=None, max_price=None) -> dict:
+    """
+    Counts the published products matching the current filter, grouped by every facet.
+
+    The counts for each attribute (size, color, ...), category and price bucket are computed
+    by a single UNION ALL statement over a CTE of the matching product ids, so the whole
+    facet sidebar costs one round trip no matter how many facets there are.
+
+    Args:
+        Same as ``product_filter_clauses``.
+
+    Returns:
+        dict: Maps a facet name to a list of ``{'value', 'label', 'count'}`` dicts, e.g.
+            ``{'size': [{'value': 'm', 'label': 'M', 'count': 12}], 'category': [...], 'price': [...]}``
+    """
+    clauses = product_filter_clauses(category_ids, attribute_filters, min_price, max_price)
+    matching = select(Product.id, Product.selling_price).where(*clauses).cte('matching')
+    
+    attribute_counts = select(
+            ProductAttribute.slug.label('facet'),
+            AttributeValue.slug.label('value'),
+            AttributeValue.value.label('label'),
+            func.count(matching.c.id.distinct()).label('count')
+        ) \
+        .select_from(matching) \
+        .join(productVariations, productVariations.product_id == matching.c.id) \
+        .join(variation_attribute_value, variation_attribute_value.c.variation_id == productVariations.id) \
+        .join(AttributeValue, AttributeValue.id == variation_attribute_value.c.attribute_value_id) \
+        .join(ProductAttribute, ProductAttribute.id == AttributeValue.attribute_id) \
+        .group_by(ProductAttribute.slug, AttributeValue.slug, AttributeValue.value)
+    
+    category_counts = select(
+            literal('category', String).label('facet'),
+            Category.slug.label('value'),
+            Category.name.label('label'),
+            func.count(matching.c.id).label('count')
+        ) \
+        .select_from(matching) \
+        .join(product_category, product_category.c.product_id == matching.c.id) \
+        .join(Category, Category.id == product_category.c.category_id) \
+        .group_by(Category.slug, Category.name)
+    
+    bucket = _price_bucket_label(matching.c.selling_price)
+    price_counts = select(
+            literal('price', String).label('facet'),
+            bucket.label('value'),
+            bucket.label('label'),
+            func.count(matching.c.id).label('count')
+        ) \
+        .select_from(matching) \
+        .where(matching.c.selling_price.isnot(None)) \
+        .group_by(bucket)
+    
+    facets = {}
+    for row in db.session.execute(union_all(attribute_counts, category_counts, price_counts)):
+        facets.setdefault(row.facet, []).append({'value': row.value, 'label': row.label, 'count': row.count})
+    
+    return facets
+
+
+def bulk_product_clauses(product_ids=None, category_id=None, pub_status=None) -> list:
+    """
+    Builds the WHERE clauses selecting the products a bulk operation applies to.
+
+    Args:
+        product_ids (list[int], optional): Explicit list of product IDs.
+        category_id (int, optional): Only products linked to this category.
+        pub_status (str, optional): Only products currently in this status.
+
+    Returns:
+        list: SQLAlchemy clauses to be passed to ``where()``.
+
+    Raises:
+        ValueError: If no criteria are given, to avoid touching every product by accident.
+    """
+    clauses = []
+    if product_ids is not None:
+        clauses.append(Product.id.in_(product_ids))
+    if category_id is not None:
+        clauses.append(exists().where(
+            product_category.c.product_id == Product.id,
+            product_category.c.category_id == category_id
+        ).correlate(Product))
+    if pub_status is not None:
+        clauses.append(Product.pub_status == pub_status)
+    
+    if not clauses:
+        raise ValueError("A bulk product operation needs product IDs or a filter")
+    
+    return clauses
+
+
+def _links_by_category(*clauses) -> dict:
+    """Counts the product_category rows of the products matching `clauses`, per category"""
+    rows = db.session.execute(
+        select(product_category.c.category_id, func.count())
+        .select_from(product_category.join(Product, Product.id == product_category.c.product_id))
+        .where(*clauses)
+        .group_by(product_category.c.category_id)
+    )
+    return dict(rows.all())
+
+
+def _subtree_products_by_category(*clauses) -> dict:
+    """Counts the distinct products matching `clauses` linked to each category or its descendants"""
+    linked, ancestor = aliased(Category), aliased(Category)
+    rows = db.session.execute(
+        select(ancestor.id, func.count(func.distinct(product_category.c.product_id)))
+        .select_from(product_category.join(Product, Product.id == product_category.c.product_id))
+        .join(linked, linked.id == product_category.c.category_id)
+        .join(ancestor, linked.path.like(ancestor.path + '%'))
+        .where(*clauses)
+        .group_by(ancestor.id)
+    )
+    return dict(rows.all())
+
+
+def bulk_set_status(status: ProductStatus, **filters) -> int:
+    """
+    Sets the pub_status of all matching products in a single UPDATE statement.
+
+    The categories' published product counters are adjusted from two grouped counts
+    of the products whose published state actually changes.
+
+    Args:
+        status (ProductStatus): The new status.
+        **filters: Passed to ``bulk_product_clauses`` (product_ids, category_id, pub_status).
+
+    Returns:
+        int: The number of products updated.
+    """
+    clauses = bulk_product_clauses(**filters)
+    published = Product.pub_status == ProductStatus.PUBLISHED.value
+    changing, sign = (~published, 1) if status == ProductStatus.PUBLISHED else (published, -1)
+    direct_deltas = {cat_id: sign * count for cat_id, count in _links_by_category(*clauses, changing).items()}
+    subtree_deltas = {cat_id: sign * count for cat_id, count in _subtree_products_by_category(*clauses, changing).items()}
+    
+    stmt = update(Product) \
+        .where(*clauses) \
+        .values(pub_status=status.value, updated_at=datetime.utcnow()) \
+        .execution_options(synchronize_session=False)
+    
+    result = db.session.execute(stmt)
+    mark_catalog_changed(db.session)
+    adjust_category_counters(db.session.connection(), direct_deltas, subtree_deltas)
+    commit_session()
+    
+    return result.rowcount
+
+
+def publish_products(**filters) -> int:
+    return bulk_set_status(ProductStatus.PUBLISHED, **filters)
+
+def unpublish_products(**filters) -> int:
+    return bulk_set_status(ProductStatus.DRAFT, **filters)
+
+def archive_products(**filters) -> int:
+    return bulk_set_status(ProductStatus.ARCHIVED, **filters)
+
+
+def bulk_delete_products(**filters) -> int:
+    """
+    Deletes all matching products in a single DELETE statement.
+
+    Rows in product_category, product_tag and product_variations are removed
+    by their ON DELETE CASCADE foreign keys.
+
+    Args:
+        **filters: Passed to ``bulk_product_clauses`` (product_ids, category_id, pub_status).
+
+    Returns:
+        int: The number of products deleted.
+    """
+    clauses = bulk_product_clauses(**filters)
+    published = Product.pub_status == ProductStatus.PUBLISHED.value
+    direct_deltas = {cat_id: -count for cat_id, count in _links_by_category(*clauses, published).items()}
+    subtree_deltas = {cat_id: -count for cat_id, count in _subtree_products_by_category(*clauses, published).items()}
+    
+    stmt = delete(Product) \
+        .where(*clauses) \
+        .execution_options(synchronize_session=False)
+    
+    result = db.session.execute(stmt)
+    mark_catalog_changed(db.session)
+    adjust_category_counters(db.session.connection(), direct_deltas, subtree_deltas)
+    commit_session()
+    
+    return result.rowcount
+
+
+def bulk_recategorize_products(category_ids: list, **filters) -> int:
+    """
+    Replaces the categories of all matching products.
+
+    Runs a fixed handful of statements regardless of how many products match: one SELECT
+    resolving the matching IDs (a category filter would stop matching once the old links
+    are gone), five small queries for the category counters, one DELETE of the old product_category
+    rows, one INSERT ... SELECT of the new ones and one UPDATE of the products' primary category.
+
+    Args:
+        category_ids (list[int]): The categories the products should belong to, the first
+            one becomes their primary category. Repeated IDs are ignored.
+        **filters: Passed to ``bulk_product_clauses`` (product_ids, category_id, pub_status).
+
+    Returns:
+        int: The number of products recategorized.
+
+    Raises:
+        ValueError: When a category doesn't exist.
+    """
+    category_ids = list(dict.fromkeys(int(id) for id in category_ids or ())) # deduped, in order
+    new_paths = dict(db.session.execute(select(Category.id, Category.path).where(Category.id.in_(category_ids))).all())
+    unknown = [id for id in category_ids if id not in new_paths]
+    if unknown:
+        raise ValueError(f'Unknown categories: {", ".join(map(str, unknown))}')
+    
+    matching_ids = db.session.scalars(select(Product.id).where(*bulk_product_clauses(**filters))).all()
+    if not matching_ids:
+        return 0
+    
+    published = [Product.id.in_(matching_ids), Product.pub_status == ProductStatus.PUBLISHED.value]
+    direct_deltas = {cat_id: -count for cat_id, count in _links_by_category(*published).items()}
+    subtree_deltas = {cat_id: -count for cat_id, count in _subtree_products_by_category(*published).items()}
+    published_count = db.session.scalar(select(func.count()).select_from(Product).where(*published))
+    if category_ids and published_count:
+        # every published product now lands once in each subtree holding any of the new categories
+        for cat_id in category_ids:
+            direct_deltas[cat_id] = direct_deltas.get(cat_id, 0) + published_count
+        for cat_id in {int(id) for path in new_paths.values() for id in path.strip('/').split('/') if id}:
+            subtree_deltas[cat_id] = subtree_deltas.get(cat_id, 0) + published_count
+    
+    db.session.execute(delete(product_category).where(product_category.c.product_id.in_(matching_ids)))
+    
+    if category_ids:
+        new_links = select(Product.id, Category.id) \
+            .join_from(Product, Category, true()) \
+            .where(Product.id.in_(matching_ids), Category.id.in_(category_ids))
+        db.session.execute(insert(product_category).from_select(['product_id', 'category_id'], new_links))
+    
+    result = db.session.execute(
+        update(Product)
+        .where(Product.id.in_(matching_ids))
+        .values(category_id=category_ids[0] if category_ids else None, updated_at=datetime.utcnow())
+        .execution_options(synchronize_session=False)
+    )
+    mark_catalog_changed(db.session)
+    adjust_category_counters(db.session.connection(), direct_deltas, subtree_deltas)
+    commit_session()
+    
+    return result.rowcount
+
+
+
+def latest_product_update():
+    """ The most recent `updated_at` of any product (an index lookup), used as a page validator """
+    return db.session.scalar(select(func.max(Product.updated_at)))
+
+
+def product_last_modified(product_uuid: str):
+    """ The `updated_at` of one product, None when it doesn't exist """
+    return db.session.scalar(select(Product.updated_at).where(Product.uuid == product_uuid.lower()))
+
+
+CATALOG_SORTS = ('newest', 'price_asc', 'price_desc')
+
+
+def _parse_catalog_cursor(after: str, sort: str):
+    """ Parses the `after` cursor of a catalog page, returns None when it's missing or malformed """
+    try:
+        parts = tuple(int(part) for part in after.split('_'))
+    except (AttributeError, ValueError):
+        return None
+    
+    expected = 1 if sort == 'newest' else 2
+    return parts if len(parts) == expected else None
+
+
+def get_catalog_page(query=None, sort: str = 'newest', after: str = None, per_page: int = None):
+    """
+    Gets one page of published products using keyset pagination.
+
+    Instead of OFFSET (which scans every skipped row), each page continues from the sort key
+    of the last product of the previous page, so deep pages cost the same as the first one.
+    Categories, tags and media are loaded with one extra SELECT each for the whole page.
+
+    Args:
+        query (Query, optional): Base product query, e.g. the products of a category tree.
+            Defaults to all published products.
+        sort (str): One of ``CATALOG_SORTS``. Unknown values fall back to 'newest'.
+        after (str, optional): The cursor returned for the previous page.
+        per_page (int, optional): Defaults to ``Config.CATALOG_PER_PAGE``.
+
+    Returns:
+        tuple: (list of products, cursor of the next page or None on the last page)
+    """
+    per_page = per_page or Config.CATALOG_PER_PAGE
+    if query is None:
+        query = Product.query.filter(Product.pub_status == ProductStatus.PUBLISHED.value)
+    if sort not in CATALOG_SORTS:
+        sort = 'newest'
+    
+    price = func.coalesce(Product.selling_price, 0)
+    cursor = _parse_catalog_cursor(after, sort)
+    
+    if sort == 'price_asc':
+        order_by = (price.asc(), Product.id.asc())
+        if cursor:
+            query = query.filter(tuple_(price, Product.id) > tuple_(*cursor))
+    elif sort == 'price_desc':
+        order_by = (price.desc(), Product.id.desc())
+        if cursor:
+            query = query.filter(tuple_(price, Product.id) < tuple_(*cursor))
+    else:
+        order_by = (Product.id.desc(),)
+        if cursor:
+            query = query.filter(Product.id < cursor[0])
+    
+    products = query.options(
+        selectinload(Product.categories),
+        selectinload(Product.tags),
+        selectinload(Product.media),
+    ).order_by(*order_by).limit(per_page + 1).all()
+    
+    next_cursor = None
+    if len(products) > per_page:
+        products = products[:per_page]
+        last = products[-1]
+        next_cursor = str(last.id) if sort == 'newest' else f'{last.selling_price or 0}_{last.id}'
+    
+    return products, next_cursor
+
+
+def render_product_card(product: Product) -> Markup:
+    """
+    Renders the catalog card of a product, reusing the cached HTML when the product hasn't changed.
+
+    The cache key holds the product's `updated_at`, how many image variants it has (they can
+    be generated after the product was saved) and the 'categories' and 'tags' versions (the
+    card shows the category and tag names), so an edited product, category or tag simply
+    misses the cache.
+    The template is rendered straight from the jinja env (not `render_template`) so the
+    context processors don't run once per card.
+    """
+    version = product.updated_at.timestamp() if product.updated_at else 0
+    image_variants = len(product.media.variants) if product.media else 0
+    if 'card_versions' not in g: # once per request, not per card
+        cache = get_page_cache()
+        g.card_versions = f"{cache.version('categories')}:{cache.version('tags')}"
+    key = f'product-card:{product.id}:{version}:{image_variants}:{g.card_versions}'
+    
+    html = fragment_cache.get(key)
+    if html is None:
+        template = current_app.jinja_env.get_template('front/components/product_card.html')
+        html = Markup(template.render(product=product))
+        fragment_cache.set(key, html)
+    
+    return html
@@ -7,53 +7,63 @@ Package: BitnShop
 """
 
 from slugify import slugify
-from sqlalchemy import desc, inspect
+from sqlalchemy import inspect, insert, select, literal
 from sqlalchemy.exc import DataError, DatabaseError
 from werkzeug.security import generate_password_hash
 
 from ...extensions import db
-from ...models.role import Role, RoleNames
+from ..unit_of_work import commit_session
+from ...models.role import Role, RoleNames, user_roles, role_registry, mark_roles_changed
 from ...models.user import AppUser, Profile, Address
-from .basic_helpers import console_log, log_exception
+from .basic_helpers import log_exception
 
 def get_role_names(as_enum=False):
-    """returns a list containing the names of all the roles"""
-    role_names = []
-    
-    all_roles = db.session.query(Role.name).order_by(desc('id')).all()
-    console_log('all_roles', all_roles)
-    
-    for role in all_roles:
-        if as_enum:
-            role_names.append(role.name)
-        else:
-            role_names.append(role.name.value)
-    
-    
-    return role_names
+    """returns a list containing the names of all the roles, newest first"""
+    role_names = list(reversed(role_registry.names()))
+    if as_enum:
+        return role_names
+    return [role.value for role in role_names]
 
 def get_role_id(role_name):
-    role_from_Db = Role.query.filter(Role.name.value == role_name).first()
-    customer_role = Role.query.filter(Role.name.value == 'customer').first()
-                    
-    if role_from_Db:
-        role_id = role_from_Db.id
-    else:
-        role_id = customer_role.id
-
+    """the id of a role from its name (e.g. 'Admin'), or of the Customer role if there's no such role"""
+    role_id = role_registry.id(RoleNames.get_member_by_value(role_name))
+    if role_id is None:
+        role_id = role_registry.id(RoleNames.CUSTOMER)
+    
     return role_id
 
+# every role but Customer, for decorators, which can't look the role table up
+ADMIN_ROLE_NAMES = tuple(role.value for role in RoleNames if role is not RoleNames.CUSTOMER)
+
 def admin_roles():
-    all_roles = Role.query.filter(Role.name != 'Customer').all()
-    admin_roles = [role.name.value for role in all_roles]
-    
-    return admin_roles
+    return [role.value for role in role_registry.names() if role != RoleNames.CUSTOMER]
 
 def admin_editor_roles():
-    all_roles = Role.query.filter(Role.name.in_(['Administrator', 'Editor'])).all()
-    admin_editor_roles = [role.name for role in all_roles]
-    
-    return admin_editor_roles
+    return [role for role in role_registry.names() if role in (RoleNames.Admin, RoleNames.MODERATOR)]
+
+def user_manager_roles():
+    """the role names allowed to create, import, deactivate and delete users"""
+    return [RoleNames.SUPER_ADMIN.value, RoleNames.Admin.value]
+
+def can_grant_role(role_names, role: RoleNames) -> bool:
+    """whether a user with the given role names (e.g. UserIdentity.roles) may give `role` to others:
+    only roles at or below their own highest one (RoleNames is ordered from the highest role)"""
+    ranks = list(RoleNames)
+    held = [RoleNames.get_member_by_value(name) for name in role_names]
+    return any(ranks.index(member) <= ranks.index(role) for member in held if member)
+
+
+def add_user_role(user_id: int, role_name: RoleNames) -> None:
+    """
+    Gives a role to a user with a plain user_roles INSERT, in the current
+    transaction: unlike `user.roles.append(role)`, it needs no separate Role query.
+    The role id is selected by name in the INSERT itself, so a stale role
+    registry can't insert a wrong id. `user_id` must be flushed already.
+    """
+    role_id = select(literal(user_id), Role.id).where(Role.name == role_name)
+    inserted = db.session.execute(insert(user_roles).from_select(['user_id', 'role_id'], role_id))
+    if inserted.rowcount == 0:
+        raise ValueError(f'The {role_name.value} role does not exist')
 
 
 def create_super_admin():
@@ -73,7 +83,7 @@ def create_super_admin():
             super_admin.roles.append(super_admin_role)
             
             db.session.add_all([super_admin, super_admin_profile, super_admin_address])
-            db.session.commit()
+            commit_session()
     except (DataError, DatabaseError) as e:
         db.session.rollback()
         log_exception('Database error occurred during registration', e)
@@ -90,15 +100,17 @@ def create_roles_and_super_admin(clear: bool = False) -> None:
         clear (bool, optional): If True, clears all existing roles before creating new ones. Defaults to False.
     """
     if inspect(db.engine).has_table('role'):
+        role_registry.invalidate() # e.g. another database, the ids may differ
         if clear:
             # Clear existing roles before creating new ones
             Role.query.delete()
-            db.session.commit()
+            mark_roles_changed(db.session) # bulk deletes skip the mapper events
+            commit_session()
         
         for role_name in RoleNames:
-            if not Role.query.filter_by(name=role_name).first():
+            if role_registry.get(role_name) is None:
                 new_role = Role(name=role_name, slug=slugify(role_name.value))
                 db.session.add(new_role)
-        db.session.commit()
+        commit_session()
         
         create_super_admin()
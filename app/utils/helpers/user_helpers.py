@@ -4,7 +4,8 @@ This module defines helper functions for managing users in the BitnShop Flask ap
 These functions assist with tasks such as:
     * fetching user info
     * checking if username or email exist
-    * generating referral code. e.t.c...
+    * generating referral codes and crediting referrals
+    * caching users' roles and running bulk user actions. e.t.c...
 
 Author: Emmanuel Olowu
 Link: https://github.com/zeddyemy
@@ -13,8 +14,18 @@ License: MIT, see LICENSE for more details.
 Package: BitnShop
 '''
 
-from ...models import Profile, AppUser
-from .basic_helpers import console_log, generate_random_string
+import csv, io, time
+from collections import namedtuple
+from flask import current_app
+from sqlalchemy import select, insert, update, delete, exists, func, literal
+from sqlalchemy.orm import aliased, joinedload, selectinload
+
+from ...extensions import db
+from ...models import Profile, Address, AppUser, RoleNames, user_roles, role_registry, Product
+from ..ids import referral_code
+from ..cache import identity_cache
+from ..unit_of_work import commit_session
+from .basic_helpers import console_log
 
 
 def get_app_user_info(userId):
@@ -107,16 +118,174 @@ def get_app_user(email_username):
 
 
 
-def generate_referral_code(length=6):
-    while True:
-        code = generate_random_string(length)
-        # Check if the code already exists in the database
-        if not referral_code_exists(code):
-            return code
+def generate_referral_code(user_id: int) -> str:
+    """
+    The referral code of a user, derived from its id (see utils.ids.referral_code).
+
+    Profile.referral_code is set to it automatically when a profile is inserted.
+    """
+    return referral_code(user_id)
+
+def referral_code_exists(code: str) -> bool:
+    return db.session.scalar(select(Profile.id).where(Profile.referral_code == code.strip().upper())) is not None
+
+
+def credit_referral(profile: Profile, code: str) -> bool:
+    """
+    Records that the new `profile` signed up with a referral `code`: sets its
+    referrer and adds one to the referrer's referral_count, in the caller's
+    transaction. Unknown codes are ignored.
+
+    Returns:
+        bool: Whether the code belonged to a user.
+    """
+    code = (code or '').strip().upper()
+    if not code:
+        return False
+    
+    referrer_id = db.session.scalar(select(Profile.user_id).where(Profile.referral_code == code))
+    if referrer_id is None:
+        return False
+    
+    profile.referrer_id = referrer_id
+    db.session.execute(
+        update(Profile).where(Profile.user_id == referrer_id).values(referral_count=Profile.referral_count + 1)
+    )
+    return True
+
+
+def recount_referral_counters() -> None:
+    ''' Recomputes every Profile.referral_count from the referrer_id column
+    
+    Repairs drift in the denormalized counter (e.g. referred users deleted since)
+    with one set-based UPDATE, each count using the referrer_id index.
+    '''
+    referred = aliased(Profile)
+    referral_total = select(func.count(referred.id)) \
+        .where(referred.referrer_id == Profile.user_id) \
+        .scalar_subquery()
+    db.session.execute(update(Profile).values(referral_count=referral_total).execution_options(synchronize_session=False))
+    commit_session()
+
+
+UserIdentity = namedtuple('UserIdentity', ['is_active', 'roles']) # roles: frozenset of RoleNames values
+
+def get_user_identity(user_id: int):
+    """
+    Whether a user is active and the names of its roles, for permission checks.
+
+    Cached per process for IDENTITY_CACHE_TTL seconds, and dropped by
+    `invalidate_user_identities` when this process changes the user's roles.
+
+    Returns:
+        UserIdentity: or None if the user doesn't exist.
+    """
+    now = time.monotonic()
+    cached = identity_cache.get(user_id)
+    if cached is not None and cached[0] > now:
+        return cached[1]
+    
+    is_active = db.session.scalar(select(AppUser.is_active).where(AppUser.id == user_id))
+    identity = None
+    if is_active is not None:
+        role_ids = db.session.scalars(select(user_roles.c.role_id).where(user_roles.c.user_id == user_id))
+        names = (role_registry.name(role_id) for role_id in role_ids)
+        identity = UserIdentity(is_active, frozenset(name.value for name in names if name))
+    identity_cache.set(user_id, (now + current_app.config['IDENTITY_CACHE_TTL'], identity))
+    return identity
+
+def invalidate_user_identities(user_ids) -> None:
+    for user_id in user_ids:
+        identity_cache.delete(int(user_id))
+
+
+def _role_id(role_name: RoleNames) -> int:
+    role_id = role_registry.id(role_name)
+    if role_id is None:
+        raise ValueError(f'The {role_name.value} role does not exist')
+    return role_id
+
+def bulk_assign_role(user_ids: list, role_name: RoleNames) -> int:
+    """
+    Gives a role to the users who don't have it yet, in one INSERT ... SELECT.
+
+    Returns:
+        int: The number of users who got the role.
+    """
+    role_id = _role_id(role_name)
+    has_role = exists().where(user_roles.c.user_id == AppUser.id, user_roles.c.role_id == role_id)
+    stmt = insert(user_roles).from_select(
+        ['user_id', 'role_id'],
+        select(AppUser.id, literal(role_id)).where(AppUser.id.in_(user_ids), ~has_role)
+    )
+    result = db.session.execute(stmt)
+    commit_session()
+    invalidate_user_identities(user_ids)
+    return result.rowcount
+
+def bulk_remove_role(user_ids: list, role_name: RoleNames) -> int:
+    role_id = _role_id(role_name)
+    result = db.session.execute(
+        delete(user_roles).where(user_roles.c.user_id.in_(user_ids), user_roles.c.role_id == role_id)
+    )
+    commit_session()
+    invalidate_user_identities(user_ids)
+    return result.rowcount
+
+def bulk_deactivate_users(user_ids: list) -> int:
+    result = db.session.execute(
+        update(AppUser).where(AppUser.id.in_(user_ids), AppUser.is_active.is_(True))
+        .values(is_active=False).execution_options(synchronize_session=False)
+    )
+    commit_session()
+    invalidate_user_identities(user_ids)
+    return result.rowcount
+
+def bulk_delete_users(user_ids: list) -> int:
+    """
+    Deletes users with a fixed handful of statements, whatever their number: one
+    DELETE each for their user_roles, profile and address rows, one UPDATE
+    detaching their products and the profiles they referred, and the app_user DELETE.
 
-def referral_code_exists(code):
-    profile = Profile.query.filter(Profile.referral_code == code).first()
-    if profile:
-        return True
-    return False
+    Returns:
+        int: The number of users deleted.
+    """
+    db.session.execute(delete(user_roles).where(user_roles.c.user_id.in_(user_ids)))
+    db.session.execute(delete(Profile).where(Profile.user_id.in_(user_ids)).execution_options(synchronize_session=False))
+    db.session.execute(delete(Address).where(Address.user_id.in_(user_ids)).execution_options(synchronize_session=False))
+    db.session.execute(update(Profile).where(Profile.referrer_id.in_(user_ids)).values(referrer_id=None).execution_options(synchronize_session=False))
+    db.session.execute(update(Product).where(Product.user_id.in_(user_ids)).values(user_id=None).execution_options(synchronize_session=False))
+    result = db.session.execute(delete(AppUser).where(AppUser.id.in_(user_ids)).execution_options(synchronize_session=False))
+    commit_session()
+    invalidate_user_identities(user_ids)
+    return result.rowcount
 
+
+USER_EXPORT_FIELDS = ('id', 'username', 'email', 'firstname', 'lastname', 'phone', 'roles', 'is_active', 'date_joined', 'referral_code', 'referral_count')
+
+def export_users_csv(user_ids: list):
+    """
+    Yields the users as CSV lines, header first. Profiles are joined and roles
+    loaded with one IN query, so the export is two queries.
+    """
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    def line(row):
+        writer.writerow(row)
+        value = buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+        return value
+    
+    yield line(USER_EXPORT_FIELDS)
+    users = db.session.scalars(
+        select(AppUser).where(AppUser.id.in_(user_ids)).order_by(AppUser.id)
+        .options(joinedload(AppUser.profile), selectinload(AppUser.roles))
+    )
+    for user in users:
+        profile = user.profile or Profile()
+        yield line((
+            user.id, user.username, user.email, profile.firstname, profile.lastname, profile.phone,
+            ';'.join(user.role_names), user.is_active, user.date_joined.isoformat(sep=' ', timespec='seconds'),
+            profile.referral_code, profile.referral_count,
+        ))
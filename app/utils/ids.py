@@ -0,0 +1,98 @@
+"""
+This module generates the public identifiers used by the BitnShop Flask application.
+
+Author: Emmanuel Olowu
+Link: https://github.com/zeddyemy
+Copyright: © 2024 Emmanuel Olowu <zeddyemy@gmail.com>
+License: MIT, see LICENSE for more details.
+Package: BitnShop
+"""
+import os, string, time, uuid
+from threading import Lock
+
+_REFERRAL_ALPHABET = string.digits + string.ascii_uppercase
+_REFERRAL_MULTIPLIER = 1_500_450_271 # odd and not a multiple of 3, so coprime with every power of 36
+_REFERRAL_OFFSET = 714_201_929
+
+_lock = Lock()
+_last_ms = 0
+_counter = 0
+
+
+def uuid7(timestamp_ms: int = None) -> uuid.UUID:
+    """
+    Generates a UUIDv7 (RFC 9562): a 48-bit unix timestamp in milliseconds followed by random bits.
+
+    Ids generated by the same process are strictly increasing: within one millisecond the
+    12-bit ``rand_a`` field is used as a counter, so consecutive inserts land next to each
+    other in a B-tree index instead of scattering like random v4 UUIDs do.
+
+    Args:
+        timestamp_ms (int, optional): Unix time in milliseconds to embed. Defaults to now.
+            Passing it bypasses the monotonic counter (used when backfilling old rows).
+
+    Returns:
+        uuid.UUID: The generated UUID.
+    """
+    global _last_ms, _counter
+    
+    if timestamp_ms is None:
+        with _lock:
+            timestamp_ms = time.time_ns() // 1_000_000
+            if timestamp_ms > _last_ms:
+                _last_ms = timestamp_ms
+                _counter = int.from_bytes(os.urandom(2), 'big') & 0x7FF # leave headroom for the counter
+            else:
+                _counter += 1
+                if _counter > 0xFFF:
+                    # counter exhausted within this millisecond, borrow the next one
+                    _last_ms += 1
+                    _counter = 0
+                timestamp_ms = _last_ms
+            rand_a = _counter
+    else:
+        rand_a = int.from_bytes(os.urandom(2), 'big') & 0xFFF
+    
+    rand_b = int.from_bytes(os.urandom(8), 'big') & 0x3FFFFFFFFFFFFFFF
+    value = (timestamp_ms & 0xFFFFFFFFFFFF) << 80
+    value |= 0x7 << 76 | rand_a << 64
+    value |= 0b10 << 62 | rand_b
+    
+    return uuid.UUID(int=value)
+
+
+def generate_uuid7() -> str:
+    """Column default for public identifiers: a new UUIDv7 as a 36 character string"""
+    return str(uuid7())
+
+
+def referral_code(user_id: int, length: int = 6) -> str:
+    """
+    The referral code of a user: its id through an affine permutation of [0, 36**length),
+    ``(id * a + b) mod 36**length``, written in base 36.
+
+    Being a bijection, two ids never get the same code, so no lookup or retry is needed,
+    and consecutive ids get unrelated looking codes. Ids beyond 36**6 (about 2.2 billion)
+    get longer codes, which can't collide with the shorter ones.
+
+    Args:
+        user_id (int): The AppUser id.
+        length (int): The minimum code length.
+
+    Returns:
+        str: e.g. '4KZ0QD'
+    """
+    while user_id >= 36 ** length:
+        length += 1
+    value = (user_id * _REFERRAL_MULTIPLIER + _REFERRAL_OFFSET) % 36 ** length
+    
+    code = []
+    for _ in range(length):
+        value, digit = divmod(value, 36)
+        code.append(_REFERRAL_ALPHABET[digit])
+    return ''.join(reversed(code))
+
+
+def referral_code_default(context) -> str:
+    """Column default for Profile.referral_code, derived from the row's user_id"""
+    return referral_code(context.get_current_parameters()['user_id'])
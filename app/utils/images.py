@@ -0,0 +1,272 @@
+"""
+Responsive image derivatives for the BitnShop Flask application.
+
+Every raster image (uploaded `Media` or a file under the static folder) gets
+width-bounded AVIF/WebP/JPEG copies, rendered in a process pool with Pillow.
+Media derivatives are stored as `MediaVariant` rows, either right after upload
+or lazily the first time the image is rendered; static ones are written by
+`flask images build` into `static/variants/` with a manifest, for
+`flask assets build` to fingerprint like any static file (and to use in the
+stylesheets' background images, see `assets._add_image_sets`). The
+`responsive_image` template global turns either into a `<picture>` with srcsets.
+
+Pillow is optional: without it images are rendered as plain `<img>` tags.
+
+Author: Emmanuel Olowu
+Link: https://github.com/zeddyemy
+Copyright: © 2024 Emmanuel Olowu <zeddyemy@gmail.com>
+License: MIT, see LICENSE for more details.
+Package: BitnShop
+"""
+import os, json
+from threading import Lock
+from concurrent.futures import ProcessPoolExecutor
+from flask import current_app, url_for
+from markupsafe import Markup, escape
+
+from ..extensions import db
+from ..models import Media, MediaVariant
+from .unit_of_work import commit_session
+from .assets import BUILD_DIR, IMAGE_MANIFEST_NAME, STATIC_VARIANTS_DIR, load_image_manifest
+
+try:
+    from PIL import Image, ImageOps, features
+except ImportError:
+    Image = None
+
+
+RASTER_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.webp')
+MEDIA_VARIANTS_DIR = 'uploads/variants'
+
+_PIL_FORMATS = {'avif': 'AVIF', 'webp': 'WEBP', 'jpeg': 'JPEG'}
+_EXTENSIONS = {'avif': 'avif', 'webp': 'webp', 'jpeg': 'jpg'}
+_MIMETYPES = {'avif': 'image/avif', 'webp': 'image/webp', 'jpeg': 'image/jpeg'}
+
+
+def render_variants(source: str, out_dir: str, stem: str, widths: list, formats: list, quality: int) -> list:
+    """
+    Writes the derivatives of one image, runs inside the process pool.
+
+    Widths larger than the image are capped to its own width, so a small image
+    gets a single size per format instead of upscaled copies.
+
+    Returns:
+        list[dict]: One dict (format, width, height, size, path) per file written,
+            `path` being the absolute file path.
+    """
+    os.makedirs(out_dir, exist_ok=True)
+    formats = [fmt for fmt in formats if fmt == 'jpeg' or features.check(fmt)]
+    results = []
+
+    with Image.open(source) as image:
+        image = ImageOps.exif_transpose(image)
+        if image.mode not in ('RGB', 'RGBA'):
+            image = image.convert('RGBA' if 'transparency' in image.info else 'RGB')
+
+        for width in sorted({min(width, image.width) for width in widths}):
+            height = max(1, round(image.height * width / image.width))
+            resized = image if width == image.width else image.resize((width, height), Image.LANCZOS)
+
+            for fmt in formats:
+                frame = resized.convert('RGB') if fmt == 'jpeg' and resized.mode == 'RGBA' else resized
+                path = os.path.join(out_dir, f'{stem}-{width}w.{_EXTENSIONS[fmt]}')
+                frame.save(path, _PIL_FORMATS[fmt], quality=quality, optimize=(fmt == 'jpeg'), progressive=(fmt == 'jpeg'))
+                results.append({'format': fmt, 'width': width, 'height': height, 'size': os.path.getsize(path), 'path': path})
+
+    return results
+
+
+def _pool_args(config) -> tuple:
+    return config['IMAGE_VARIANT_WIDTHS'], config['IMAGE_VARIANT_FORMATS'], config['IMAGE_QUALITY']
+
+
+def _static_relative(path: str, static_folder: str) -> str:
+    return os.path.relpath(path, static_folder).replace(os.sep, '/')
+
+
+def _media_source(media: Media, static_folder: str):
+    """ The local file of a Media row, None for remote (e.g. Cloudinary) or non-raster files """
+    path = media.media_path or ''
+    if path.startswith(('http://', 'https://', '//')) or not path.lower().endswith(RASTER_EXTENSIONS):
+        return None
+    if path.startswith('/static/'):
+        path = path[len('/static/'):]
+
+    source = os.path.join(static_folder, path.lstrip('/'))
+    return source if os.path.isfile(source) else None
+
+
+def _media_jobs(media_list, static_folder: str) -> dict:
+    jobs = {}
+    for media in media_list:
+        source = _media_source(media, static_folder)
+        if source:
+            jobs[media.id] = (source, os.path.join(static_folder, MEDIA_VARIANTS_DIR, str(media.id)), 'image')
+    return jobs
+
+
+def _save_media_variants(results_by_media: dict, static_folder: str) -> int:
+    count = 0
+    for media_id, results in results_by_media.items():
+        MediaVariant.query.filter_by(media_id=media_id).delete(synchronize_session=False)
+        for result in results:
+            db.session.add(MediaVariant(media_id=media_id, **{**result, 'path': _static_relative(result['path'], static_folder)}))
+            count += 1
+    commit_session()
+    return count
+
+
+def create_media_variants(media_list) -> int:
+    """
+    Renders the derivatives of Media images in a process pool and stores them as
+    MediaVariant rows (replacing existing ones). Blocks until done, use it on
+    upload or from the CLI.
+
+    Returns:
+        int: The number of variants written.
+    """
+    if Image is None:
+        return 0
+
+    static_folder = current_app.static_folder
+    jobs = _media_jobs(media_list, static_folder)
+    if not jobs:
+        return 0
+
+    widths, formats, quality = _pool_args(current_app.config)
+    with ProcessPoolExecutor(max_workers=current_app.config['IMAGE_WORKERS']) as pool:
+        futures = {media_id: pool.submit(render_variants, source, out_dir, stem, widths, formats, quality)
+                   for media_id, (source, out_dir, stem) in jobs.items()}
+        results = {media_id: future.result() for media_id, future in futures.items()}
+
+    return _save_media_variants(results, static_folder)
+
+
+_background_pool = None
+_pending = set()
+_pending_lock = Lock()
+
+def schedule_media_variants(media: Media) -> None:
+    """
+    Renders a Media's derivatives in the background, for images uploaded before the
+    pipeline existed. The page that triggered it still gets the original image.
+    """
+    global _background_pool
+    if Image is None:
+        return
+
+    app = current_app._get_current_object()
+    jobs = _media_jobs([media], app.static_folder)
+    if not jobs:
+        return
+
+    with _pending_lock:
+        if media.id in _pending:
+            return
+        _pending.add(media.id)
+        if _background_pool is None:
+            _background_pool = ProcessPoolExecutor(max_workers=app.config['IMAGE_WORKERS'])
+
+    media_id = media.id
+    source, out_dir, stem = jobs[media_id]
+    future = _background_pool.submit(render_variants, source, out_dir, stem, *_pool_args(app.config))
+
+    def save(future):
+        try:
+            with app.app_context():
+                _save_media_variants({media_id: future.result()}, app.static_folder)
+        except Exception as e:
+            app.logger.exception(f'Could not create the variants of media {media_id}: {e}')
+        finally:
+            with _pending_lock:
+                _pending.discard(media_id)
+
+    future.add_done_callback(save)
+
+
+def build_static_images(static_folder: str, config) -> dict:
+    """
+    Renders the derivatives of the raster images under the static folder into
+    `variants/` and writes their manifest. Run `flask assets build` afterwards.
+
+    Returns:
+        dict: The manifest, mapping each image (relative to the static folder)
+            to its variants.
+    """
+    if Image is None:
+        raise RuntimeError('Pillow is required to build image variants')
+
+    out_root = os.path.join(static_folder, STATIC_VARIANTS_DIR)
+    jobs = {}
+    for dirpath, dirnames, filenames in os.walk(static_folder):
+        if os.path.relpath(dirpath, static_folder) == '.':
+            dirnames[:] = [name for name in dirnames if name not in (BUILD_DIR, STATIC_VARIANTS_DIR, 'uploads', 'src')]
+        for filename in filenames:
+            if filename.lower().endswith(RASTER_EXTENSIONS):
+                source = os.path.join(dirpath, filename)
+                relative = _static_relative(source, static_folder)
+                stem, _ = os.path.splitext(relative)
+                jobs[relative] = (source, os.path.join(out_root, os.path.dirname(stem)), os.path.basename(stem))
+
+    with ProcessPoolExecutor(max_workers=config['IMAGE_WORKERS']) as pool:
+        futures = {relative: pool.submit(render_variants, *job, *_pool_args(config)) for relative, job in jobs.items()}
+        manifest = {
+            relative: [{**result, 'path': _static_relative(result['path'], static_folder)} for result in future.result()]
+            for relative, future in futures.items()
+        }
+
+    os.makedirs(out_root, exist_ok=True)
+    with open(os.path.join(out_root, IMAGE_MANIFEST_NAME), 'w') as file:
+        json.dump(manifest, file, indent=2, sort_keys=True)
+
+    return manifest
+
+
+def init_images(app) -> None:
+    """ Loads the static image manifest and registers the `responsive_image` template global """
+    app.extensions['image_manifest'] = load_image_manifest(app.static_folder)
+    app.add_template_global(responsive_image)
+
+
+def _srcset(variants, fmt: str) -> str:
+    return ', '.join(f"{url_for('static', filename=variant['path'])} {variant['width']}w" for variant in variants if variant['format'] == fmt)
+
+
+def responsive_image(image, alt: str = '', sizes: str = '100vw', **attrs) -> Markup:
+    """
+    Renders a `<picture>` with AVIF/WebP/JPEG srcsets for a Media row or a static
+    image path (e.g. 'dist/img/img-1.jpg'), falling back to a plain `<img>` when no
+    variants exist yet.
+
+    Usage:
+        {{ responsive_image(product.media, alt=product.name, sizes='(min-width: 768px) 25vw, 50vw') }}
+    """
+    if image is None:
+        return Markup('')
+
+    if isinstance(image, Media):
+        src = image.get_path()
+        variants = [variant.to_dict() for variant in image.variants]
+        if not variants:
+            schedule_media_variants(image)
+    else:
+        src = url_for('static', filename=image)
+        variants = current_app.extensions.get('image_manifest', {}).get(image, [])
+
+    extra = ''.join(f' {name.replace("_", "-")}="{escape(value)}"' for name, value in attrs.items())
+    if not variants:
+        return Markup(f'<img src="{escape(src)}" alt="{escape(alt)}" loading="lazy"{extra}>')
+
+    formats = [fmt for fmt in current_app.config['IMAGE_VARIANT_FORMATS'] if any(variant['format'] == fmt for variant in variants)]
+    fallback_format = formats[-1]
+    fallback = max((variant for variant in variants if variant['format'] == fallback_format), key=lambda variant: variant['width'])
+
+    sources = ''.join(
+        f'<source type="{_MIMETYPES[fmt]}" srcset="{escape(_srcset(variants, fmt))}" sizes="{escape(sizes)}">'
+        for fmt in formats[:-1]
+    )
+    img = (
+        f'<img src="{escape(url_for("static", filename=fallback["path"]))}" srcset="{escape(_srcset(variants, fallback_format))}" '
+        f'sizes="{escape(sizes)}" width="{fallback["width"]}" height="{fallback["height"]}" alt="{escape(alt)}" loading="lazy"{extra}>'
+    )
+    return Markup(f'<picture>{sources}{img}</picture>')
@@ -0,0 +1,132 @@
+"""
+Sends the emails waiting in the `email_outbox` table (see models.mail).
+
+`drain_outbox_batch` claims a batch of due rows with `SELECT ... FOR UPDATE SKIP
+LOCKED` and marks them 'sending' in a short transaction, so several
+`flask mail drain` workers can run side by side without sending an email twice.
+The batch is then rendered and sent over one reused SMTP connection, and the
+results are written back with one bulk UPDATE. Failed emails are retried with
+exponential backoff until MAIL_OUTBOX_MAX_ATTEMPTS, and rows left 'sending' by a
+worker that died are claimed again after MAIL_OUTBOX_CLAIM_TIMEOUT seconds.
+
+SQLite ignores FOR UPDATE, run a single drain worker there.
+
+Author: Emmanuel Olowu
+Link: https://github.com/zeddyemy
+Copyright: © 2024 Emmanuel Olowu <zeddyemy@gmail.com>
+License: MIT, see LICENSE for more details.
+Package: BitnShop
+"""
+import logging, random, smtplib
+from datetime import datetime, timedelta
+from flask import current_app
+from sqlalchemy import and_, or_, select, update
+
+from ..extensions import db
+from ..models.mail import EmailOutbox, OutboxStatus
+from ..models.user import AppUser
+from .mail_pool import SMTPConnection, smtp_settings
+from .helpers.mail_helpers import build_email, build_message
+
+
+logger = logging.getLogger(__name__)
+
+
+def open_outbox_connection() -> SMTPConnection:
+    ''' An SMTPConnection with the app's mail settings, connected on first send '''
+    return SMTPConnection(**smtp_settings(current_app.config))
+
+
+def retry_delay(attempts: int) -> timedelta:
+    ''' Exponential backoff from MAIL_OUTBOX_BACKOFF seconds, with jitter so failed batches spread out '''
+    seconds = current_app.config['MAIL_OUTBOX_BACKOFF'] * 2 ** (attempts - 1)
+    return timedelta(seconds=seconds * random.uniform(0.75, 1.25))
+
+
+def claim_outbox_batch(batch_size: int) -> list:
+    """
+    Marks up to `batch_size` due emails as 'sending' and commits.
+
+    Returns:
+        list: (id, email_type, recipient, context, attempts) tuples of the claimed rows.
+    """
+    now = datetime.utcnow()
+    stale = now - timedelta(seconds=current_app.config['MAIL_OUTBOX_CLAIM_TIMEOUT'])
+    due = or_(
+        and_(EmailOutbox.status == OutboxStatus.PENDING.value, EmailOutbox.next_attempt_at <= now),
+        and_(EmailOutbox.status == OutboxStatus.SENDING.value, EmailOutbox.claimed_at < stale),
+    )
+    try:
+        rows = (EmailOutbox.query.filter(due)
+                .order_by(EmailOutbox.next_attempt_at, EmailOutbox.id)
+                .limit(batch_size)
+                .with_for_update(skip_locked=True)
+                .all())
+        claimed = [(row.id, row.email_type, row.recipient, row.context or {}, row.attempts) for row in rows]
+        for row in rows:
+            row.status = OutboxStatus.SENDING.value
+            row.claimed_at = now
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        raise
+    return claimed
+
+
+def drain_outbox_batch(connection: SMTPConnection, batch_size: int = None) -> tuple:
+    """
+    Claims, sends and records one batch of outbox emails.
+
+    Args:
+        connection (SMTPConnection): Reused across batches, see `open_outbox_connection`.
+        batch_size (int, optional): Defaults to MAIL_OUTBOX_BATCH_SIZE.
+
+    Returns:
+        tuple: (sent, failed) counts; (0, 0) when nothing was due.
+    """
+    config = current_app.config
+    claimed = claim_outbox_batch(batch_size or config['MAIL_OUTBOX_BATCH_SIZE'])
+    if not claimed:
+        return 0, 0
+
+    # deactivated in the meantime, e.g. a welcome email of an account closed before the drain ran
+    deactivated = set(db.session.scalars(
+        select(AppUser.email).where(AppUser.email.in_([row[2] for row in claimed]), AppUser.is_active.is_(False))
+    ))
+    
+    results = []
+    for email_id, email_type, recipient, context, attempts in claimed:
+        if recipient in deactivated:
+            results.append({'id': email_id, 'status': OutboxStatus.FAILED.value, 'attempts': attempts,
+                            'next_attempt_at': datetime.utcnow(), 'last_error': 'The recipient account is deactivated'})
+            continue
+        try:
+            subject, html = build_email(email_type, recipient, **context)
+            connection.send(build_message(subject, [recipient], html))
+            results.append({'id': email_id, 'status': OutboxStatus.SENT.value, 'attempts': attempts + 1,
+                            'sent_at': datetime.utcnow(), 'last_error': None})
+        except Exception as e:
+            attempts += 1
+            # a refused recipient will be refused again, and an unknown email type stays unknown
+            give_up = attempts >= config['MAIL_OUTBOX_MAX_ATTEMPTS'] or isinstance(e, (smtplib.SMTPRecipientsRefused, ValueError))
+            logger.warning(f'Outbox email {email_id} ({email_type}) to {recipient} failed, attempt {attempts}: {e}')
+            results.append({
+                'id': email_id,
+                'status': OutboxStatus.FAILED.value if give_up else OutboxStatus.PENDING.value,
+                'attempts': attempts,
+                'next_attempt_at': datetime.utcnow() + retry_delay(attempts),
+                'last_error': f'{type(e).__name__}: {e}'[:1000],
+            })
+
+    sent = [result for result in results if result['status'] == OutboxStatus.SENT.value]
+    failed = [result for result in results if result['status'] != OutboxStatus.SENT.value]
+    try:
+        # bulk UPDATE ... WHERE id = :id, grouped by the columns each set has
+        for group in (sent, failed):
+            if group:
+                db.session.execute(update(EmailOutbox), group)
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        raise
+    return len(sent), len(failed)
@@ -0,0 +1,205 @@
+"""
+A bounded pool of SMTP delivery workers for the BitnShop Flask application.
+
+Each worker thread keeps its own SMTP connection open and reuses it for every
+message it sends (one TLS handshake and login per connection instead of per
+email). Messages are serialized by the caller and put on a bounded queue:
+when it is full, `submit` blocks for up to MAIL_SUBMIT_TIMEOUT seconds and then
+raises `MailQueueFull`, so a burst slows its producers down instead of growing
+memory or spawning threads.
+
+`SMTPConnection` is the reusable connection the workers (and `flask mail drain`,
+see utils.mail_outbox) send through.
+
+Author: Emmanuel Olowu
+Link: https://github.com/zeddyemy
+Copyright: © 2024 Emmanuel Olowu <zeddyemy@gmail.com>
+License: MIT, see LICENSE for more details.
+Package: BitnShop
+"""
+import atexit, logging, queue, re, smtplib, ssl
+from collections import namedtuple
+from threading import Thread, Lock
+
+
+logger = logging.getLogger(__name__)
+
+OutgoingMail = namedtuple('OutgoingMail', ['sender', 'recipients', 'body']) # body: the serialized message bytes
+
+_STOP = object()
+
+
+class MailQueueFull(Exception):
+    pass
+
+
+class MailWorkerPool:
+    """
+    Args:
+        host, port, username, password, use_tls, use_ssl: SMTP settings.
+        workers (int): Number of threads, each with one persistent connection.
+        queue_size (int): Messages that may wait for a worker.
+        batch_size (int): Messages a worker takes off the queue at once.
+        idle_timeout (float): Seconds without mail after which a worker closes its connection.
+        submit_timeout (float): Seconds `submit` waits for room in a full queue.
+    """
+
+    def __init__(self, host, port, username=None, password=None, use_tls=False, use_ssl=False,
+                 workers=4, queue_size=1000, batch_size=20, idle_timeout=30, submit_timeout=2):
+        self.smtp_settings = dict(host=host, port=port, username=username, password=password, use_tls=use_tls, use_ssl=use_ssl)
+        self.batch_size = batch_size
+        self.idle_timeout = idle_timeout
+        self.submit_timeout = submit_timeout
+
+        self.sent = self.failed = self.connections_opened = 0
+        self._counters_lock = Lock()
+        self._queue = queue.Queue(maxsize=queue_size)
+        self._threads = [Thread(target=self._work, name=f'mail-worker-{i}', daemon=True) for i in range(workers)]
+        for thread in self._threads:
+            thread.start()
+
+    def submit(self, mail: OutgoingMail, timeout: float = None) -> None:
+        ''' Queues a message, raises MailQueueFull when no room frees up within `timeout` seconds '''
+        try:
+            self._queue.put(mail, timeout=self.submit_timeout if timeout is None else timeout)
+        except queue.Full:
+            raise MailQueueFull(f'{self._queue.maxsize} emails are already waiting to be sent')
+
+    def shutdown(self, wait: bool = True) -> None:
+        ''' Sends what is queued, then stops the workers '''
+        for _ in self._threads:
+            self._queue.put(_STOP)
+        if wait:
+            for thread in self._threads:
+                thread.join()
+
+    def stats(self) -> dict:
+        return {'queued': self._queue.qsize(), 'sent': self.sent, 'failed': self.failed, 'connections_opened': self.connections_opened}
+
+    def _count(self, sent=0, failed=0):
+        with self._counters_lock:
+            self.sent += sent
+            self.failed += failed
+
+    def _on_connect(self):
+        with self._counters_lock:
+            self.connections_opened += 1
+
+    def _send(self, connection, mail: OutgoingMail):
+        try:
+            connection.send(mail)
+            self._count(sent=1)
+        except smtplib.SMTPServerDisconnected as e:
+            logger.error(f'Could not send email to {mail.recipients}: {e}')
+            self._count(failed=1)
+        except smtplib.SMTPException as e:
+            logger.error(f'Email to {mail.recipients} was rejected: {e}')
+            self._count(failed=1)
+        except OSError as e: # SMTPException subclasses OSError, hence the order
+            logger.error(f'Could not send email to {mail.recipients}: {e}')
+            self._count(failed=1)
+
+    def _work(self):
+        connection = SMTPConnection(**self.smtp_settings, on_connect=self._on_connect)
+        while True:
+            try:
+                first = self._queue.get(timeout=self.idle_timeout)
+            except queue.Empty:
+                connection.close() # idle, don't hold the server's connection slot
+                continue
+
+            batch = [first]
+            while len(batch) < self.batch_size and batch[-1] is not _STOP:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+
+            for mail in batch:
+                if mail is _STOP:
+                    connection.close()
+                    return
+                self._send(connection, mail)
+
+
+class SMTPConnection:
+    """
+    One SMTP connection, opened on the first `send` and reused for the next ones.
+
+    `send` reconnects once when the server dropped the connection (e.g. after its
+    idle timeout) and raises the smtplib/socket error when it still can't send.
+    A refused sender or recipient raises an SMTPException but keeps the connection.
+    """
+
+    def __init__(self, host, port, username=None, password=None, use_tls=False, use_ssl=False, on_connect=None):
+        self.host, self.port = host, port
+        self.username, self.password = username, password
+        self.use_tls, self.use_ssl = use_tls, use_ssl
+        self.on_connect = on_connect
+        self._connection = None
+
+    def _connect(self):
+        if self.use_ssl:
+            connection = smtplib.SMTP_SSL(self.host, self.port, context=ssl.create_default_context(), timeout=30)
+        else:
+            connection = smtplib.SMTP(self.host, self.port, timeout=30)
+            if self.use_tls:
+                connection.starttls(context=ssl.create_default_context())
+        if self.username and self.password:
+            connection.login(self.username, self.password)
+        if self.on_connect:
+            self.on_connect()
+        return connection
+
+    def send(self, mail: OutgoingMail) -> None:
+        # smtplib sends bytes as-is, and as_bytes() ends lines with a bare \n
+        body = re.sub(rb'\r?\n', b'\r\n', mail.body)
+        for attempt in (1, 2):
+            try:
+                self._connection = self._connection or self._connect()
+                self._connection.sendmail(mail.sender, mail.recipients, body)
+                return
+            except smtplib.SMTPServerDisconnected:
+                self.close()
+                if attempt == 2:
+                    raise
+            except smtplib.SMTPException: # refused sender/recipients, the connection is still usable
+                raise
+            except OSError: # network errors; SMTPException subclasses OSError, hence the order
+                self.close()
+                if attempt == 2:
+                    raise
+
+    def close(self) -> None:
+        if self._connection is not None:
+            try:
+                self._connection.quit()
+            except smtplib.SMTPException:
+                self._connection.close()
+            except OSError:
+                pass
+            self._connection = None
+
+
+def smtp_settings(config) -> dict:
+    """ The SMTPConnection/MailWorkerPool connection arguments from the app config """
+    return dict(host=config['MAIL_SERVER'], port=config['MAIL_PORT'], username=config.get('MAIL_USERNAME'), password=config.get('MAIL_PASSWORD'),
+                use_tls=config.get('MAIL_USE_TLS', False), use_ssl=config.get('MAIL_USE_SSL', False))
+
+
+_pools = {}
+_pools_lock = Lock()
+
+def get_mail_pool(app) -> MailWorkerPool:
+    ''' The app's pool, started on first use and drained at interpreter exit '''
+    with _pools_lock:
+        if app not in _pools:
+            config = app.config
+            pool = MailWorkerPool(
+                **smtp_settings(config),
+                workers=config['MAIL_WORKERS'], queue_size=config['MAIL_QUEUE_SIZE'], batch_size=config['MAIL_BATCH_SIZE'],
+                idle_timeout=config['MAIL_IDLE_TIMEOUT'], submit_timeout=config['MAIL_SUBMIT_TIMEOUT'],
+            )
+            atexit.register(pool.shutdown)
+            _pools[app] = pool
+        return _pools[app]
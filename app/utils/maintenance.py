@@ -0,0 +1,99 @@
+"""
+Maintenance jobs run by `flask worker` (see utils.scheduler).
+
+Deletes run in batches of MAINTENANCE_BATCH_SIZE rows, each batch in its own
+short transaction, and stop after MAINTENANCE_MAX_BATCHES so one run never
+holds locks or the worker for long; whatever is left goes in the next run.
+
+Author: Emmanuel Olowu
+Link: https://github.com/zeddyemy
+Copyright: © 2024 Emmanuel Olowu <zeddyemy@gmail.com>
+License: MIT, see LICENSE for more details.
+Package: BitnShop
+"""
+from datetime import datetime, timedelta
+from flask import current_app
+from sqlalchemy import select, delete
+
+from ..extensions import db
+from ..models import TempUser, Category, EmailOutbox, OutboxStatus
+from .scheduler import scheduler
+from .otp import purge_expired_codes
+from .page_cache import MemoryPageCache, get_page_cache
+from .helpers.category_helpers import recount_category_counters
+from .helpers.user_helpers import recount_referral_counters
+
+
+def delete_in_batches(model, *criteria) -> int:
+    """
+    Deletes the rows of `model` matching `criteria`, MAINTENANCE_BATCH_SIZE at a
+    time and at most MAINTENANCE_MAX_BATCHES batches.
+
+    Returns:
+        int: The number of rows deleted.
+    """
+    config = current_app.config
+    deleted = 0
+    for _ in range(config['MAINTENANCE_MAX_BATCHES']):
+        batch = select(model.id).where(*criteria).order_by(model.id).limit(config['MAINTENANCE_BATCH_SIZE'])
+        count = db.session.execute(
+            delete(model).where(model.id.in_(batch)).execution_options(synchronize_session=False)
+        ).rowcount
+        db.session.commit()
+        deleted += count
+        if count < config['MAINTENANCE_BATCH_SIZE']:
+            break
+    return deleted
+
+
+@scheduler.job('purge-temp-users', cron='15 3 * * *')
+def purge_temp_users():
+    cutoff = datetime.utcnow() - timedelta(days=current_app.config['TEMP_USER_TTL_DAYS'])
+    return f'{delete_in_batches(TempUser, TempUser.date_joined < cutoff)} stale temp users deleted'
+
+
+@scheduler.job('purge-one-time-codes', every=15 * 60)
+def purge_one_time_codes():
+    return f'{purge_expired_codes()} expired codes deleted'
+
+
+@scheduler.job('purge-email-outbox', cron='45 3 * * *')
+def purge_email_outbox():
+    cutoff = datetime.utcnow() - timedelta(days=current_app.config['MAIL_OUTBOX_RETENTION_DAYS'])
+    finished = (OutboxStatus.SENT.value, OutboxStatus.FAILED.value)
+    return f'{delete_in_batches(EmailOutbox, EmailOutbox.status.in_(finished), EmailOutbox.created_at < cutoff)} old outbox emails deleted'
+
+
+@scheduler.job('recount-category-counters', cron='30 4 * * *')
+def refresh_category_counters():
+    recount_category_counters()
+    return 'category product counters recomputed'
+
+
+@scheduler.job('recount-referral-counters', cron='40 4 * * *')
+def refresh_referral_counters():
+    recount_referral_counters()
+    return 'referral counters recomputed'
+
+
+@scheduler.job('warm-page-cache', every=6 * 60 * 60, run_at_start=True)
+def warm_page_cache():
+    """
+    Renders the home, shop and busiest category pages into the page cache, so the
+    first visitors after a deploy (or a catalog change) don't all hit a cold cache.
+    Only useful with a page cache shared with the web workers (PAGE_CACHE_BACKEND=sqlite).
+    """
+    if isinstance(get_page_cache(), MemoryPageCache):
+        return 'skipped, the memory page cache is private to this process'
+
+    app = current_app._get_current_object()
+    categories = db.session.scalars(
+        select(Category.slug).where(Category.subtree_product_count > 0)
+        .order_by(Category.subtree_product_count.desc()).limit(app.config['WARM_CATEGORY_PAGES'])
+    ).all()
+    db.session.remove()
+
+    paths = ['/', '/shop', '/shop?sort=price_asc', '/shop?sort=price_desc'] + [f'/category/{slug}' for slug in categories]
+    client = app.test_client()
+    warmed = sum(client.get(path).status_code == 200 for path in paths)
+    return f'{warmed}/{len(paths)} pages warmed'
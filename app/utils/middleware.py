@@ -0,0 +1,160 @@
+"""
+WSGI middleware for the BitnShop Flask application.
+
+`CompressionMiddleware` gzip/brotli-compresses eligible responses on the fly.
+Streamed responses are compressed chunk by chunk (each chunk is flushed so the
+client still receives it right away) instead of being buffered whole.
+
+Author: Emmanuel Olowu
+Link: https://github.com/zeddyemy
+Copyright: © 2024 Emmanuel Olowu <zeddyemy@gmail.com>
+License: MIT, see LICENSE for more details.
+Package: BitnShop
+"""
+import zlib
+from werkzeug.datastructures import Headers
+from werkzeug.http import parse_accept_header, parse_options_header, parse_set_header
+
+try:
+    import brotli
+except ImportError: # only gzip is offered without the `brotli` package
+    brotli = None
+
+
+class _GzipCompressor:
+    def __init__(self, level: int):
+        self._compressor = zlib.compressobj(level, zlib.DEFLATED, 31) # 31: gzip container
+
+    def compress(self, data: bytes) -> bytes:
+        return self._compressor.compress(data)
+
+    def flush(self) -> bytes:
+        return self._compressor.flush(zlib.Z_SYNC_FLUSH)
+
+    def finish(self) -> bytes:
+        return self._compressor.flush(zlib.Z_FINISH)
+
+
+class _BrotliCompressor:
+    def __init__(self, quality: int):
+        self._compressor = brotli.Compressor(quality=quality)
+
+    def compress(self, data: bytes) -> bytes:
+        return self._compressor.process(data)
+
+    def flush(self) -> bytes:
+        return self._compressor.flush()
+
+    def finish(self) -> bytes:
+        return self._compressor.finish()
+
+
+class CompressionMiddleware:
+    """
+    Compresses responses whose content type is in `mimetypes` and whose body is at
+    least `min_size` bytes, with brotli when the client accepts it (and the package
+    is installed) or gzip. Responses that already have a Content-Encoding (e.g. the
+    precompressed static files), partial responses and `Cache-Control: no-transform`
+    responses are passed through untouched.
+
+    Usage:
+        app.wsgi_app = CompressionMiddleware(app.wsgi_app, min_size=500)
+    """
+
+    def __init__(self, app, min_size: int = 500, mimetypes=None, level: int = 6, brotli_quality: int = 4):
+        self.app = app
+        self.min_size = min_size
+        self.mimetypes = set(mimetypes or ('text/html', 'text/css', 'text/plain', 'text/javascript', 'application/javascript', 'application/json', 'image/svg+xml'))
+        self.level = level
+        self.brotli_quality = brotli_quality
+
+    def _negotiate(self, environ):
+        accepted = parse_accept_header(environ.get('HTTP_ACCEPT_ENCODING', ''))
+        if brotli is not None and accepted.quality('br') > 0:
+            return 'br'
+        if accepted.quality('gzip') > 0:
+            return 'gzip'
+        return None
+
+    def _compressor(self, encoding):
+        return _BrotliCompressor(self.brotli_quality) if encoding == 'br' else _GzipCompressor(self.level)
+
+    def _is_eligible(self, environ, status: str, headers: Headers) -> bool:
+        code = int(status.split(' ', 1)[0])
+        if environ['REQUEST_METHOD'] == 'HEAD' or code < 200 or code in (204, 206, 304):
+            return False
+        if 'Content-Encoding' in headers or 'no-transform' in headers.get('Cache-Control', ''):
+            return False
+        if parse_options_header(headers.get('Content-Type', ''))[0] not in self.mimetypes:
+            return False
+        length = headers.get('Content-Length', type=int)
+        return length is None or length >= self.min_size
+
+    def __call__(self, environ, start_response):
+        response = {}
+
+        def capture_start_response(status, headers, exc_info=None):
+            response.update(status=status, headers=headers, exc_info=exc_info)
+            return response.setdefault('written', []).append
+
+        app_iter = self.app(environ, capture_start_response)
+        return self._respond(environ, start_response, app_iter, response)
+
+    def _respond(self, environ, start_response, app_iter, response):
+        try:
+            chunks = iter(app_iter)
+            # the app may only call start_response when its first chunk is pulled
+            first = [] if 'status' in response else [next(chunks, b'')]
+            first = response.get('written', []) + first
+
+            status, headers = response['status'], Headers(response['headers'])
+            if not self._is_eligible(environ, status, headers):
+                start_response(status, headers.to_wsgi_list(), response['exc_info'])
+                yield from first
+                yield from chunks
+                return
+
+            vary = parse_set_header(headers.get('Vary'))
+            vary.add('Accept-Encoding')
+            headers['Vary'] = vary.to_header()
+            encoding = self._negotiate(environ)
+            streamed = 'Content-Length' not in headers
+
+            # buffer until min_size is reached, a short body isn't worth compressing
+            buffered, size = list(first), sum(len(chunk) for chunk in first)
+            if size < self.min_size:
+                for chunk in chunks:
+                    buffered.append(chunk)
+                    size += len(chunk)
+                    if size >= self.min_size:
+                        break
+
+            if encoding is None or size < self.min_size:
+                start_response(status, headers.to_wsgi_list(), response['exc_info'])
+                yield from buffered
+                yield from chunks
+                return
+
+            compressor = self._compressor(encoding)
+            headers.remove('Content-Length')
+            headers['Content-Encoding'] = encoding
+            etag = headers.get('ETag')
+            if etag and not etag.startswith('W/'):
+                headers['ETag'] = f'W/{etag}' # the encoded body is not byte-identical anymore
+            start_response(status, headers.to_wsgi_list(), response['exc_info'])
+
+            data = compressor.compress(b''.join(buffered))
+            if streamed:
+                data += compressor.flush()
+            if data:
+                yield data
+            for chunk in chunks:
+                data = compressor.compress(chunk)
+                if streamed:
+                    data += compressor.flush()
+                if data:
+                    yield data
+            yield compressor.finish()
+        finally:
+            if hasattr(app_iter, 'close'):
+                app_iter.close()
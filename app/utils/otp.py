@@ -0,0 +1,329 @@
+"""
+One-time codes (email verification, password reset, 2FA) for the BitnShop Flask application.
+
+Codes are stored as an HMAC of (purpose, identifier, code) keyed with the app's
+SECRET_KEY, never in clear, with an expiry and a count of failed attempts. A
+code is cleared when it is used, when it expires or after OTP_MAX_ATTEMPTS wrong
+guesses, and issuing a new code replaces the previous one.
+
+Issuing is rate limited per (purpose, identifier): a new code can be issued
+OTP_RESEND_INTERVAL seconds after the previous one at the earliest, and at most
+OTP_MAX_ISSUES times per OTP_ISSUE_WINDOW, so reissuing can't be used to get more
+than OTP_MAX_ISSUES * OTP_MAX_ATTEMPTS guesses per window. The entry of an
+identifier is kept until both its code and its window have expired.
+
+Two backends, set by `OTP_BACKEND`:
+    'memory': a dict keyed by (purpose, identifier) plus a heap ordered by expiry,
+        for a single process. Expired entries are popped off the heap on every issue.
+    'database': the `one_time_code` table (see models.otp), shared by every worker
+        and node. Expired rows are removed by `purge_expired_codes`, one DELETE.
+Both look a code up by its (purpose, identifier) key, so verifying is O(1).
+
+Usage:
+    code = issue_code('pwd_reset', email) # raises OTPRateLimited
+    send_code_to_email(email, code, 'pwd_reset')
+    ...
+    if verify_code('pwd_reset', email, submitted_code) is OTPResult.VALID: ...
+
+Author: Emmanuel Olowu
+Link: https://github.com/zeddyemy
+Copyright: © 2024 Emmanuel Olowu <zeddyemy@gmail.com>
+License: MIT, see LICENSE for more details.
+Package: BitnShop
+"""
+import hashlib, heapq, hmac, secrets, time
+from abc import ABC, abstractmethod
+from enum import Enum
+from collections import namedtuple
+from datetime import datetime, timedelta
+from threading import Lock
+from flask import current_app
+from sqlalchemy import select, update, delete, and_, or_, case
+from sqlalchemy.exc import IntegrityError
+
+from ..extensions import db
+from ..models.otp import OneTimeCode
+
+
+OTP_PURPOSES = ('verify_email', 'pwd_reset', '2FA')
+
+
+class OTPResult(Enum):
+    VALID = 'valid'
+    INVALID = 'invalid' # wrong code, attempts left
+    EXPIRED = 'expired'
+    TOO_MANY_ATTEMPTS = 'too_many_attempts' # wrong code, and it was the last attempt
+    NOT_FOUND = 'not_found' # never issued, already used or purged
+
+
+class OTPRateLimited(Exception):
+    ''' A code was requested too soon after the previous ones '''
+
+    def __init__(self, retry_after: float):
+        super().__init__(f'Too many codes requested, retry in {retry_after:.0f}s')
+        self.retry_after = retry_after
+
+
+# seconds between two codes, and codes per window of `issue_window` seconds
+OTPLimits = namedtuple('OTPLimits', ['resend_interval', 'max_issues', 'issue_window'])
+
+
+def _wait_time(limits: OTPLimits, since_issue: float, since_window: float, issue_count: int) -> float:
+    ''' Seconds before a new code may be issued, 0 if it may be now '''
+    wait = limits.resend_interval - since_issue
+    if since_window < limits.issue_window and issue_count >= limits.max_issues:
+        wait = max(wait, limits.issue_window - since_window)
+    return max(wait, 0.0)
+
+
+class OTPStore(ABC):
+    """
+    Base class of the OTP backends. Times are epoch seconds.
+    """
+
+    @abstractmethod
+    def issue(self, purpose: str, identifier: str, code_hash: str, expires_at: float, limits: OTPLimits) -> float:
+        ''' Replaces the pending code unless `limits` forbid it, returns the seconds to wait then (0 if issued) '''
+
+    @abstractmethod
+    def verify(self, purpose: str, identifier: str, code_hash: str, max_attempts: int) -> OTPResult:
+        ...
+
+    @abstractmethod
+    def purge_expired(self, limits: OTPLimits) -> int:
+        ''' Deletes the entries whose code and rate limit window have expired and returns how many there were '''
+
+
+class _MemoryCode:
+    __slots__ = ('code_hash', 'expires_at', 'attempts', 'issued_at', 'issue_count', 'window_start', 'keep_until')
+
+
+class MemoryOTPStore(OTPStore):
+    ''' Per-process store, codes issued by one worker can't be verified by another '''
+
+    def __init__(self):
+        self._codes = {} # (purpose, identifier): _MemoryCode, its code_hash is None once used
+        self._expiry_heap = [] # (keep_until, key), entries kept longer by a newer code are skipped when popped
+        self._lock = Lock()
+
+    def issue(self, purpose, identifier, code_hash, expires_at, limits):
+        key = (purpose, identifier)
+        now = time.time()
+        with self._lock:
+            self._purge_expired(now)
+            entry = self._codes.get(key)
+            if entry is None:
+                entry = self._codes[key] = _MemoryCode()
+                entry.issue_count, entry.window_start = 0, now
+            else:
+                wait = _wait_time(limits, now - entry.issued_at, now - entry.window_start, entry.issue_count)
+                if wait:
+                    return wait
+                if now - entry.window_start >= limits.issue_window:
+                    entry.issue_count, entry.window_start = 0, now
+            entry.code_hash, entry.expires_at, entry.attempts, entry.issued_at = code_hash, expires_at, 0, now
+            entry.issue_count += 1
+            entry.keep_until = max(expires_at, now + limits.resend_interval, entry.window_start + limits.issue_window)
+            heapq.heappush(self._expiry_heap, (entry.keep_until, key))
+            return 0.0
+
+    def verify(self, purpose, identifier, code_hash, max_attempts):
+        key = (purpose, identifier)
+        with self._lock:
+            entry = self._codes.get(key)
+            if entry is None or entry.code_hash is None:
+                return OTPResult.NOT_FOUND
+            if entry.expires_at <= time.time():
+                entry.code_hash = None
+                return OTPResult.EXPIRED
+            if hmac.compare_digest(entry.code_hash, code_hash):
+                entry.code_hash = None
+                return OTPResult.VALID
+            entry.attempts += 1
+            if entry.attempts >= max_attempts:
+                entry.code_hash = None
+                return OTPResult.TOO_MANY_ATTEMPTS
+            return OTPResult.INVALID
+
+    def purge_expired(self, limits):
+        with self._lock:
+            return self._purge_expired(time.time())
+
+    def _purge_expired(self, now):
+        purged = 0
+        while self._expiry_heap and self._expiry_heap[0][0] <= now:
+            keep_until, key = heapq.heappop(self._expiry_heap)
+            entry = self._codes.get(key)
+            if entry is not None and entry.keep_until <= now: # not kept longer by a newer code
+                del self._codes[key]
+                purged += 1
+        return purged
+
+    def __len__(self):
+        return len(self._codes)
+
+
+class DatabaseOTPStore(OTPStore):
+    ''' Stores the codes in the `one_time_code` table, each call commits its own transaction '''
+
+    def issue(self, purpose, identifier, code_hash, expires_at, limits):
+        expires_at = datetime.utcfromtimestamp(expires_at)
+        now = datetime.utcnow()
+        key = (OneTimeCode.purpose == purpose, OneTimeCode.identifier == identifier)
+        window_open = OneTimeCode.window_started_at > now - timedelta(seconds=limits.issue_window)
+        # the limits are in the WHERE, so concurrent requests can't issue more codes than they allow
+        allowed = and_(
+            OneTimeCode.created_at <= now - timedelta(seconds=limits.resend_interval),
+            or_(~window_open, OneTimeCode.issue_count < limits.max_issues),
+        )
+        try:
+            while True:
+                replaced = db.session.execute(
+                    update(OneTimeCode).where(*key, allowed).values(
+                        code_hash=code_hash, expires_at=expires_at, attempts=0, created_at=now,
+                        issue_count=case((window_open, OneTimeCode.issue_count + 1), else_=1),
+                        window_started_at=case((window_open, OneTimeCode.window_started_at), else_=now),
+                    )
+                ).rowcount
+                if replaced:
+                    db.session.commit()
+                    return 0.0
+                
+                row = db.session.execute(
+                    select(OneTimeCode.created_at, OneTimeCode.issue_count, OneTimeCode.window_started_at).where(*key)
+                ).first()
+                if row is not None:
+                    db.session.rollback()
+                    return _wait_time(limits, (now - row.created_at).total_seconds(),
+                                      (now - row.window_started_at).total_seconds(), row.issue_count) or 1.0 # 0 if a concurrent request just issued one
+                
+                db.session.add(OneTimeCode(purpose=purpose, identifier=identifier, code_hash=code_hash, expires_at=expires_at,
+                                           created_at=now, issue_count=1, window_started_at=now))
+                try:
+                    db.session.commit()
+                    return 0.0
+                except IntegrityError: # a concurrent request inserted it first, go through the limits again
+                    db.session.rollback()
+        except Exception:
+            db.session.rollback()
+            raise
+
+    def verify(self, purpose, identifier, code_hash, max_attempts):
+        try:
+            row = db.session.execute(
+                select(OneTimeCode.id, OneTimeCode.code_hash, OneTimeCode.attempts, OneTimeCode.expires_at)
+                .where(OneTimeCode.purpose == purpose, OneTimeCode.identifier == identifier)
+            ).first()
+            if row is None or not row.code_hash:
+                return OTPResult.NOT_FOUND
+
+            if row.expires_at <= datetime.utcnow():
+                result = OTPResult.EXPIRED
+            elif hmac.compare_digest(row.code_hash, code_hash):
+                result = OTPResult.VALID
+            elif row.attempts + 1 >= max_attempts:
+                result = OTPResult.TOO_MANY_ATTEMPTS
+            else:
+                result = OTPResult.INVALID
+
+            if result is OTPResult.INVALID:
+                # conditional, so concurrent wrong guesses can't go past max_attempts
+                counted = db.session.execute(
+                    update(OneTimeCode).where(OneTimeCode.id == row.id, OneTimeCode.attempts < max_attempts - 1)
+                    .values(attempts=OneTimeCode.attempts + 1)
+                ).rowcount
+                if not counted:
+                    result = OTPResult.TOO_MANY_ATTEMPTS
+            if result is not OTPResult.INVALID:
+                # the code is cleared, the row keeps the rate limit of the identifier. The code hash
+                # in the WHERE makes a concurrent verify of the same code (or one that was just
+                # replaced) clear nothing, so each code is accepted once
+                cleared = db.session.execute(
+                    update(OneTimeCode).where(OneTimeCode.id == row.id, OneTimeCode.code_hash == row.code_hash).values(code_hash='')
+                ).rowcount
+                if result is OTPResult.VALID and not cleared:
+                    result = OTPResult.NOT_FOUND
+            db.session.commit()
+            return result
+        except Exception:
+            db.session.rollback()
+            raise
+
+    def purge_expired(self, limits):
+        now = datetime.utcnow()
+        try:
+            purged = db.session.execute(delete(OneTimeCode).where(
+                OneTimeCode.expires_at <= now,
+                OneTimeCode.created_at <= now - timedelta(seconds=limits.resend_interval),
+                OneTimeCode.window_started_at <= now - timedelta(seconds=limits.issue_window),
+            )).rowcount
+            db.session.commit()
+            return purged
+        except Exception:
+            db.session.rollback()
+            raise
+
+
+_otp_store = None
+_otp_store_lock = Lock()
+
+def get_otp_store() -> OTPStore:
+    ''' Returns the OTP store set by `OTP_BACKEND` ('database' or 'memory') '''
+    global _otp_store
+    if _otp_store is None:
+        with _otp_store_lock:
+            if _otp_store is None:
+                _otp_store = MemoryOTPStore() if current_app.config['OTP_BACKEND'] == 'memory' else DatabaseOTPStore()
+    return _otp_store
+
+
+def _normalize(identifier: str) -> str:
+    return identifier.strip().lower()
+
+
+def hash_code(purpose: str, identifier: str, code: str) -> str:
+    message = f'{purpose}:{_normalize(identifier)}:{code.strip()}'.encode()
+    return hmac.new(str(current_app.config['SECRET_KEY']).encode(), message, hashlib.sha256).hexdigest()
+
+
+def generate_code(digits: int = 6) -> str:
+    return f'{secrets.randbelow(10 ** digits):0{digits}d}'
+
+
+def _limits() -> OTPLimits:
+    config = current_app.config
+    return OTPLimits(config['OTP_RESEND_INTERVAL'], config['OTP_MAX_ISSUES'], config['OTP_ISSUE_WINDOW'])
+
+
+def issue_code(purpose: str, identifier: str) -> str:
+    """
+    Creates a code for `identifier` (an email address), replacing any pending one.
+
+    Returns:
+        str: The code, to be sent to the user. Only its hash is stored.
+
+    Raises:
+        OTPRateLimited: When the previous code was issued less than OTP_RESEND_INTERVAL
+            seconds ago, or OTP_MAX_ISSUES codes were issued in the current window.
+    """
+    if purpose not in OTP_PURPOSES:
+        raise ValueError(f'Unknown OTP purpose {purpose!r}, expected one of {OTP_PURPOSES}')
+    config = current_app.config
+    code = generate_code(config['OTP_DIGITS'])
+    wait = get_otp_store().issue(purpose, _normalize(identifier), hash_code(purpose, identifier, code),
+                                 time.time() + config['OTP_TTL'], _limits())
+    if wait:
+        raise OTPRateLimited(wait)
+    return code
+
+
+def verify_code(purpose: str, identifier: str, code: str) -> OTPResult:
+    ''' Checks a submitted code, a valid code is consumed '''
+    if purpose not in OTP_PURPOSES:
+        raise ValueError(f'Unknown OTP purpose {purpose!r}, expected one of {OTP_PURPOSES}')
+    return get_otp_store().verify(purpose, _normalize(identifier), hash_code(purpose, identifier, code), current_app.config['OTP_MAX_ATTEMPTS'])
+
+
+def purge_expired_codes() -> int:
+    return get_otp_store().purge_expired(_limits())
+
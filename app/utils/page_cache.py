@@ -0,0 +1,223 @@
+"""
+Backends for the full-page cache of anonymous storefront pages (see `decorators.cache_page`).
+
+Cached pages are keyed by a catalog version which is bumped after any commit
+that changed a Product or Category, so invalidation never has to find and
+delete individual pages. The backends keep other named versions the same way
+(e.g. 'nav', see models.nav). The in-memory backend is per process; the SQLite
+backend can be shared by all the workers of a host.
+
+Author: Emmanuel Olowu
+Link: https://github.com/zeddyemy
+Copyright: © 2024 Emmanuel Olowu <zeddyemy@gmail.com>
+License: MIT, see LICENSE for more details.
+Package: BitnShop
+"""
+import math, os, sqlite3, time
+from abc import ABC, abstractmethod
+from collections import Counter, namedtuple
+from datetime import datetime, timezone
+from threading import Lock, local
+
+from flask import current_app, has_app_context
+from sqlalchemy import event
+
+from ..extensions import db
+from ..config import Config
+from .cache import LRUCache
+
+
+CachedPage = namedtuple('CachedPage', ['body', 'content_type', 'stored_at'])
+
+
+class PageCacheBackend(ABC):
+    ''' Base class of the page cache backends, keeps this process's hit/miss counters '''
+
+    shared = False # whether every worker sees the same pages and versions
+
+    def __init__(self):
+        self._counters = Counter()
+        self._counters_lock = Lock()
+
+    @abstractmethod
+    def get(self, key: str):
+        ...
+
+    @abstractmethod
+    def set(self, key: str, page: CachedPage) -> None:
+        ...
+
+    @abstractmethod
+    def claim_refresh(self, key: str, lease: float) -> bool:
+        ''' Returns True for exactly one caller until `lease` seconds pass or the page is set again '''
+
+    @abstractmethod
+    def version(self, name: str = 'catalog') -> int:
+        ...
+
+    @abstractmethod
+    def bump_version(self, name: str = 'catalog') -> None:
+        ''' Also records when, in whole seconds rounded up like HTTP dates, see `changed_at` '''
+
+    @abstractmethod
+    def changed_at(self, name: str = 'catalog'):
+        ''' The (naive UTC) datetime of the last bump of the `name` version, None if it never changed '''
+
+    def record(self, outcome: str) -> None:
+        with self._counters_lock:
+            self._counters[outcome] += 1
+
+    def stats(self) -> dict:
+        hits = self._counters['hit'] + self._counters['stale']
+        lookups = hits + self._counters['miss']
+        return {
+            'backend': type(self).__name__,
+            'version': self.version(),
+            **{outcome: self._counters[outcome] for outcome in ('hit', 'stale', 'miss', 'bypass')},
+            'hit_ratio': round(hits / lookups, 4) if lookups else None,
+        }
+
+
+class MemoryPageCache(PageCacheBackend):
+    ''' In-process LRU, the default '''
+
+    def __init__(self, maxsize: int = 512):
+        super().__init__()
+        self._pages = LRUCache(maxsize)
+        self._refreshing = {}
+        self._versions = Counter()
+        self._changed_at = {}
+        self._lock = Lock()
+
+    def get(self, key):
+        return self._pages.get(key)
+
+    def set(self, key, page):
+        self._pages.set(key, page)
+        with self._lock:
+            self._refreshing.pop(key, None)
+
+    def claim_refresh(self, key, lease):
+        now = time.time()
+        with self._lock:
+            if self._refreshing.get(key, 0) > now:
+                return False
+            self._refreshing[key] = now + lease
+            return True
+
+    def version(self, name='catalog'):
+        return self._versions[name]
+
+    def bump_version(self, name='catalog'):
+        with self._lock:
+            self._versions[name] += 1
+            self._changed_at[name] = math.ceil(time.time())
+            self._refreshing.clear()
+
+    def changed_at(self, name='catalog'):
+        return _utc_datetime(self._changed_at.get(name))
+
+
+class SQLitePageCache(PageCacheBackend):
+    ''' A SQLite file shared by all the workers on a host '''
+
+    shared = True
+    PRUNE_EVERY = 100 # sets between two size checks
+
+    def __init__(self, path: str, maxsize: int = 512):
+        super().__init__()
+        self.path = path
+        self.maxsize = maxsize
+        self._local = local()
+        self._sets = 0
+
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        conn = self._conn()
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.execute('''CREATE TABLE IF NOT EXISTS page_cache (
+            key TEXT PRIMARY KEY, body BLOB, content_type TEXT, stored_at REAL, refreshing_until REAL NOT NULL DEFAULT 0
+        )''')
+        conn.execute('CREATE TABLE IF NOT EXISTS page_cache_meta (name TEXT PRIMARY KEY, value INTEGER NOT NULL)')
+
+    def _conn(self):
+        # sqlite3 connections can't be shared across threads, keep one per thread
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = self._local.conn = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+        return conn
+
+    def get(self, key):
+        row = self._conn().execute('SELECT body, content_type, stored_at FROM page_cache WHERE key = ?', (key,)).fetchone()
+        return CachedPage(*row) if row else None
+
+    def set(self, key, page):
+        conn = self._conn()
+        conn.execute(
+            'INSERT OR REPLACE INTO page_cache (key, body, content_type, stored_at, refreshing_until) VALUES (?, ?, ?, ?, 0)',
+            (key, page.body, page.content_type, page.stored_at)
+        )
+        self._sets += 1
+        if self._sets % self.PRUNE_EVERY == 0:
+            conn.execute('DELETE FROM page_cache WHERE key IN (SELECT key FROM page_cache ORDER BY stored_at DESC LIMIT -1 OFFSET ?)', (self.maxsize,))
+
+    def claim_refresh(self, key, lease):
+        now = time.time()
+        cursor = self._conn().execute(
+            'UPDATE page_cache SET refreshing_until = ? WHERE key = ? AND refreshing_until <= ?',
+            (now + lease, key, now)
+        )
+        return cursor.rowcount == 1
+
+    def version(self, name='catalog'):
+        row = self._conn().execute('SELECT value FROM page_cache_meta WHERE name = ?', (f'{name}_version',)).fetchone()
+        return row[0] if row else 0
+
+    def bump_version(self, name='catalog'):
+        conn = self._conn()
+        conn.execute(
+            'INSERT INTO page_cache_meta (name, value) VALUES (?, 1) '
+            'ON CONFLICT(name) DO UPDATE SET value = value + 1',
+            (f'{name}_version',)
+        )
+        conn.execute('INSERT OR REPLACE INTO page_cache_meta (name, value) VALUES (?, ?)', (f'{name}_changed_at', math.ceil(time.time())))
+
+    def changed_at(self, name='catalog'):
+        row = self._conn().execute('SELECT value FROM page_cache_meta WHERE name = ?', (f'{name}_changed_at',)).fetchone()
+        return _utc_datetime(row[0] if row else None)
+
+
+def _utc_datetime(timestamp):
+    return datetime.fromtimestamp(timestamp, timezone.utc).replace(tzinfo=None) if timestamp else None
+
+
+_page_cache = None
+_page_cache_lock = Lock()
+
+def get_page_cache() -> PageCacheBackend:
+    ''' Returns the page cache backend set by `PAGE_CACHE_BACKEND` ('memory' or 'sqlite') '''
+    global _page_cache
+    if _page_cache is None:
+        config = current_app.config if has_app_context() else vars(Config)
+        with _page_cache_lock:
+            if _page_cache is None:
+                if config.get('PAGE_CACHE_BACKEND') == 'sqlite':
+                    _page_cache = SQLitePageCache(config['PAGE_CACHE_PATH'], config['PAGE_CACHE_SIZE'])
+                else:
+                    _page_cache = MemoryPageCache(config['PAGE_CACHE_SIZE'])
+    return _page_cache
+
+
+def mark_changed(session, name: str) -> None:
+    ''' Flags the session so the `name` version is bumped once its transaction commits '''
+    session.info.setdefault('changed_versions', set()).add(name)
+
+
+def mark_catalog_changed(session) -> None:
+    mark_changed(session, 'catalog')
+
+
+@event.listens_for(db.session, 'after_commit')
+def bump_changed_versions(session):
+    # after the commit, so no request can cache what it read before the change under the new version
+    for name in session.info.pop('changed_versions', ()):
+        get_page_cache().bump_version(name)
@@ -0,0 +1,207 @@
+"""
+A small periodic job scheduler for the BitnShop Flask application, run by `flask worker`.
+
+Jobs are registered on the module's `scheduler` with either an interval or a
+5-field cron expression (evaluated in UTC):
+
+    @scheduler.job('purge-temp-users', cron='15 3 * * *')
+    def purge_temp_users():
+        ...
+        return f'{deleted} deleted'  # logged with the job's timing
+
+Any number of workers, on any number of nodes, can run at once: each job has a
+row in the `job_lease` table (see models.job) holding its next run time and a
+lease. A worker runs a due job only if its conditional UPDATE takes the lease,
+so each run happens on one node, and a crashed worker's lease simply expires.
+
+Author: Emmanuel Olowu
+Link: https://github.com/zeddyemy
+Copyright: © 2024 Emmanuel Olowu <zeddyemy@gmail.com>
+License: MIT, see LICENSE for more details.
+Package: BitnShop
+"""
+import logging, os, socket, time
+from datetime import datetime, timedelta
+from sqlalchemy import select, update, or_
+from sqlalchemy.exc import IntegrityError
+
+from ..extensions import db
+from ..models.job import JobLease
+
+
+logger = logging.getLogger(__name__)
+
+
+class CronSchedule:
+    """
+    A 5-field cron expression: minute hour day-of-month month day-of-week.
+
+    Fields accept `*`, `*/n`, `a`, `a-b`, `a-b/n` and comma-separated lists of those.
+    Day of week is 0-6 from Sunday (7 is Sunday too). As in cron, when both day
+    fields are restricted a day matches if either does.
+    """
+
+    RANGES = ((0, 59), (0, 23), (1, 31), (1, 12), (0, 7))
+
+    def __init__(self, expression: str):
+        fields = expression.split()
+        if len(fields) != 5:
+            raise ValueError(f'A cron expression has 5 fields, got {expression!r}')
+        self.expression = expression
+        self.minutes, self.hours, self.days, self.months, weekdays = (
+            self._parse(field, low, high) for field, (low, high) in zip(fields, self.RANGES)
+        )
+        self.weekdays = {day % 7 for day in weekdays}
+        self.any_day, self.any_weekday = fields[2] == '*', fields[4] == '*'
+
+    @staticmethod
+    def _parse(field: str, low: int, high: int) -> set:
+        values = set()
+        for part in field.split(','):
+            span, _, step = part.partition('/')
+            if span == '*':
+                start, end = low, high
+            elif '-' in span:
+                start, end = (int(value) for value in span.split('-', 1))
+            else:
+                start = end = int(span)
+            if not low <= start <= end <= high:
+                raise ValueError(f'{part!r} is out of range {low}-{high}')
+            values.update(range(start, end + 1, int(step) if step else 1))
+        return values
+
+    def _day_matches(self, dt: datetime) -> bool:
+        day, weekday = dt.day in self.days, (dt.weekday() + 1) % 7 in self.weekdays
+        if self.any_day or self.any_weekday:
+            return day and weekday
+        return day or weekday
+
+    def next_after(self, dt: datetime) -> datetime:
+        ''' The first matching minute after `dt` '''
+        dt = dt.replace(second=0, microsecond=0) + timedelta(minutes=1)
+        limit = dt + timedelta(days=366 * 5)
+        while dt < limit:
+            if dt.month not in self.months:
+                dt = (dt.replace(day=1, hour=0, minute=0) + timedelta(days=32)).replace(day=1)
+            elif not self._day_matches(dt):
+                dt = dt.replace(hour=0, minute=0) + timedelta(days=1)
+            elif dt.hour not in self.hours:
+                dt = dt.replace(minute=0) + timedelta(hours=1)
+            elif dt.minute not in self.minutes:
+                dt += timedelta(minutes=1)
+            else:
+                return dt
+        raise ValueError(f'{self.expression!r} never matches')
+
+
+class Job:
+    """
+    Args:
+        name (str): Unique, the job's `job_lease` row.
+        fn (callable): Takes no arguments, runs in an app context. Its return value is logged.
+        every (float): Seconds between runs, or
+        cron (str): A cron expression, see CronSchedule.
+        run_at_start (bool): Also run when a worker starts, e.g. to warm caches after a deploy.
+        lease (float): Seconds the job may run before another worker may take it over.
+    """
+
+    def __init__(self, name, fn, every=None, cron=None, run_at_start=False, lease=600):
+        if (every is None) == (cron is None):
+            raise ValueError(f'Job {name!r} needs either `every` or `cron`')
+        self.name, self.fn = name, fn
+        self.every = every
+        self.cron = CronSchedule(cron) if cron else None
+        self.run_at_start = run_at_start
+        self.lease = lease
+
+    def next_run_after(self, dt: datetime) -> datetime:
+        return self.cron.next_after(dt) if self.cron else dt + timedelta(seconds=self.every)
+
+
+class Scheduler:
+    def __init__(self):
+        self.jobs = {}
+        self.owner = f'{socket.gethostname()}:{os.getpid()}'
+        self._next_runs = {} # this worker's view of each job's next_run_at
+
+    def job(self, name: str, **options):
+        ''' Decorator registering a function as a job, see Job for the options '''
+        def decorator(fn):
+            self.add_job(Job(name, fn, **options))
+            return fn
+        return decorator
+
+    def add_job(self, job: Job) -> None:
+        if job.name in self.jobs:
+            raise ValueError(f'A job named {job.name!r} is already registered')
+        self.jobs[job.name] = job
+
+    def sync(self) -> None:
+        ''' Creates the missing job_lease rows and schedules the run_at_start jobs now '''
+        now = datetime.utcnow()
+        for job in self.jobs.values():
+            try:
+                db.session.add(JobLease(name=job.name, next_run_at=now if job.run_at_start else job.next_run_after(now)))
+                db.session.commit()
+            except IntegrityError: # another worker created it
+                db.session.rollback()
+                if job.run_at_start:
+                    db.session.execute(update(JobLease).where(JobLease.name == job.name).values(next_run_at=now))
+                    db.session.commit()
+        self._next_runs = dict(db.session.execute(select(JobLease.name, JobLease.next_run_at).where(JobLease.name.in_(self.jobs))).all())
+
+    def _acquire(self, job: Job, now: datetime) -> bool:
+        taken = db.session.execute(
+            update(JobLease)
+            .where(JobLease.name == job.name, JobLease.next_run_at <= now,
+                   or_(JobLease.locked_until.is_(None), JobLease.locked_until < now))
+            .values(owner=self.owner, locked_until=now + timedelta(seconds=job.lease), last_started_at=now)
+        ).rowcount
+        db.session.commit()
+        if not taken: # someone else ran it or is running it, see when it's due next
+            self._next_runs[job.name] = db.session.scalar(select(JobLease.next_run_at).where(JobLease.name == job.name)) or now
+        return bool(taken)
+
+    def run_job(self, job: Job) -> None:
+        ''' Runs a job whose lease this worker holds, logs its timing and releases the lease '''
+        start = time.perf_counter()
+        status, error, result = 'ok', None, None
+        try:
+            result = job.fn()
+        except Exception as e:
+            db.session.rollback()
+            status, error = 'failed', f'{type(e).__name__}: {e}'[:1000]
+            logger.exception(f'Job {job.name} failed')
+        duration = time.perf_counter() - start
+
+        finished = datetime.utcnow()
+        next_run = job.next_run_after(finished)
+        db.session.execute(
+            update(JobLease).where(JobLease.name == job.name, JobLease.owner == self.owner).values(
+                owner=None, locked_until=None, next_run_at=next_run, last_finished_at=finished,
+                last_duration=duration, last_status=status, last_error=error,
+            )
+        )
+        db.session.commit()
+        self._next_runs[job.name] = next_run
+        logger.info(f'Job {job.name} {status} in {duration * 1000:.0f} ms' + (f': {result}' if result is not None else ''))
+
+    def run_pending(self) -> int:
+        ''' Runs the jobs that are due and whose lease this worker gets, returns how many ran '''
+        ran = 0
+        for job in self.jobs.values():
+            now = datetime.utcnow()
+            if self._next_runs.get(job.name, now) <= now and self._acquire(job, now):
+                self.run_job(job)
+                ran += 1
+            db.session.remove()
+        return ran
+
+    def run_forever(self, tick: float = 5, should_stop=lambda: False) -> None:
+        self.sync()
+        while not should_stop():
+            self.run_pending()
+            time.sleep(tick)
+
+
+scheduler = Scheduler()
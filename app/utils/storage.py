@@ -0,0 +1,108 @@
+"""
+Storage backends for uploaded media files.
+
+Files are stored content-addressed: the key of a file is derived from its
+sha256 (e.g. `3f/9c/3f9c2a...d1.jpg`), so identical uploads map to the same
+object and storing one twice is a no-op.
+
+`MEDIA_STORAGE` selects the backend: 'local' (the default, files under
+UPLOADS_DIR served as static files) or 'cloudinary' (needs the optional
+`cloudinary` package).
+
+Author: Emmanuel Olowu
+Link: https://github.com/zeddyemy
+Copyright: © 2024 Emmanuel Olowu <zeddyemy@gmail.com>
+License: MIT, see LICENSE for more details.
+Package: BitnShop
+"""
+import os, shutil
+from abc import ABC, abstractmethod
+from flask import current_app
+
+try:
+    import cloudinary, cloudinary.uploader
+except ImportError:
+    cloudinary = None
+
+
+def content_key(sha256: str, extension: str = '') -> str:
+    ''' The content-addressed key of a file, two levels of fan-out keep directories small '''
+    return f'{sha256[:2]}/{sha256[2:4]}/{sha256}{extension.lower()}'
+
+
+class StorageBackend(ABC):
+    ''' Interface of the media storage backends '''
+
+    @abstractmethod
+    def save(self, temp_path: str, key: str, mime_type: str = None) -> str:
+        ''' Moves the (fully written) temp file to `key`, returns the URL stored in `Media.media_path` '''
+
+    @abstractmethod
+    def delete(self, key: str) -> None:
+        ...
+
+
+class LocalStorage(StorageBackend):
+    ''' Files under a local directory, e.g. `app/static/uploads`, served as static files '''
+
+    def __init__(self, root: str, url_prefix: str):
+        self.root = root
+        self.url_prefix = url_prefix.rstrip('/')
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.root, *key.split('/'))
+
+    def save(self, temp_path, key, mime_type=None):
+        path = self._path(key)
+        if os.path.exists(path):
+            os.remove(temp_path) # same content is already stored
+        else:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            shutil.move(temp_path, path) # a rename when the temp dir is on the same filesystem
+        return f'{self.url_prefix}/{key}'
+
+    def delete(self, key):
+        try:
+            os.remove(self._path(key))
+        except FileNotFoundError:
+            pass
+
+
+class CloudinaryStorage(StorageBackend):
+    ''' Cloudinary, using the CLOUDINARY_* settings '''
+
+    def __init__(self, cloud_name: str, api_key: str, api_secret: str, folder: str = 'bitnshop'):
+        if cloudinary is None:
+            raise RuntimeError("MEDIA_STORAGE is 'cloudinary' but the cloudinary package is not installed")
+        cloudinary.config(cloud_name=cloud_name, api_key=api_key, api_secret=api_secret, secure=True)
+        self.folder = folder
+
+    def _public_id(self, key: str) -> str:
+        return f'{self.folder}/{os.path.splitext(key)[0]}'
+
+    def save(self, temp_path, key, mime_type=None):
+        try:
+            # overwrite=False makes re-uploading existing content a cheap no-op on their side
+            result = cloudinary.uploader.upload(temp_path, public_id=self._public_id(key), overwrite=False, resource_type='auto')
+        finally:
+            os.remove(temp_path)
+        return result['secure_url']
+
+    def delete(self, key):
+        cloudinary.uploader.destroy(self._public_id(key))
+
+
+_storage = {}
+
+def get_storage() -> StorageBackend:
+    ''' Returns the backend set by `MEDIA_STORAGE`, one instance per app '''
+    app = current_app._get_current_object()
+    if app not in _storage:
+        config = app.config
+        if config['MEDIA_STORAGE'] == 'cloudinary':
+            _storage[app] = CloudinaryStorage(config['CLOUDINARY_CLOUD_NAME'], config['CLOUDINARY_API_KEY'], config['CLOUDINARY_API_SECRET'])
+        else:
+            # UPLOADS_DIR is relative to the project root, like STATIC_DIR
+            root = os.path.join(os.path.dirname(app.root_path), config['UPLOADS_DIR'])
+            _storage[app] = LocalStorage(root, config['UPLOADS_URL'])
+    return _storage[app]
@@ -0,0 +1,81 @@
+"""
+This module defines the unit-of-work helpers for the BitnShop Flask application.
+
+The models' ``insert``/``update``/``delete`` helpers commit through ``commit_session``,
+which commits straight away unless it runs inside a ``db_batch()`` block. Inside a batch
+it only flushes, and the whole block is committed once when it exits:
+
+    with db_batch():
+        for data in rows:
+            Category(**data).insert()  # flushed, not committed
+    # one COMMIT here
+
+Author: Emmanuel Olowu
+Link: https://github.com/zeddyemy
+Copyright: © 2024 Emmanuel Olowu <zeddyemy@gmail.com>
+License: MIT, see LICENSE for more details.
+Package: BitnShop
+"""
+from contextlib import contextmanager
+
+from ..extensions import db
+
+_BATCH_DEPTH = 'db_batch_depth'
+
+
+def in_batch() -> bool:
+    """Returns True if the current session is inside a ``db_batch()`` block"""
+    return db.session().info.get(_BATCH_DEPTH, 0) > 0
+
+
+def commit_session() -> None:
+    """
+    Commits the current session, or only flushes it inside a ``db_batch()`` block.
+
+    Flushing keeps generated primary keys available to the caller while the
+    actual COMMIT is deferred to the end of the outermost batch.
+    """
+    session = db.session()
+    if session.info.get(_BATCH_DEPTH, 0) > 0:
+        session.flush()
+    else:
+        session.commit()
+
+
+@contextmanager
+def db_batch():
+    """
+    Groups every model ``insert``/``update``/``delete`` in the block into a single transaction.
+
+    The outermost block commits when it exits and rolls back if it raises. Nested blocks
+    run inside a SAVEPOINT, so an exception caught around an inner block only undoes
+    that block's changes and the outer batch can carry on.
+
+    Yields:
+        sqlalchemy.orm.Session: The current session.
+    """
+    session = db.session()
+    depth = session.info.get(_BATCH_DEPTH, 0)
+    session.info[_BATCH_DEPTH] = depth + 1
+    
+    try:
+        if depth:
+            savepoint = session.begin_nested()
+            try:
+                yield session
+            except Exception:
+                if savepoint.is_active:
+                    savepoint.rollback()
+                raise
+            else:
+                if savepoint.is_active:
+                    savepoint.commit()
+        else:
+            try:
+                yield session
+                session.commit()
+            except Exception:
+                session.rollback()
+                raise
+    finally:
+        session.info[_BATCH_DEPTH] = depth
@@ -0,0 +1,372 @@
+"""
+Bulk user import for the BitnShop Flask application, used by `flask users import`
+and the cpanel's import page.
+
+The file (CSV with a header row, or JSON lines) is read in chunks of
+USER_IMPORT_CHUNK_SIZE rows. For each chunk:
+    * the rows are validated, and checked against the users already in the
+      database with one query and against the rest of the file with two sets;
+    * the passwords are hashed by a process pool, one worker per core, while
+      the previous chunk is being inserted (the cpanel's imports use a few
+      threads instead, see `start_import`);
+    * the users, their profiles, addresses, roles (and welcome emails) are
+      inserted with one executemany INSERT per table, and the chunk is committed.
+
+Rows may have: email (required), username (required), firstname, lastname,
+phone, country, state, role (a RoleNames value, defaults to `default_role`),
+and either `password` or `password_hash` (a werkzeug hash, e.g. when moving
+customers from another shop). Users imported without either have no password
+and have to reset it before they can log in. Imports started from the cpanel
+skip the rows with a role above the importer's own.
+
+Author: Emmanuel Olowu
+Link: https://github.com/zeddyemy
+Copyright: © 2024 Emmanuel Olowu <zeddyemy@gmail.com>
+License: MIT, see LICENSE for more details.
+Package: BitnShop
+"""
+import csv, json, os, re, uuid
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from threading import Thread
+from flask import current_app
+from sqlalchemy import select, insert, or_, func
+from sqlalchemy.exc import IntegrityError
+from werkzeug.security import generate_password_hash
+
+from ..extensions import db
+from ..models import AppUser, Profile, Address, RoleNames, user_roles, role_registry, EmailOutbox
+from .helpers.mail_helpers import EmailType
+from .helpers.user_helpers import invalidate_user_identities
+from .helpers.role_helpers import can_grant_role
+from .helpers.basic_helpers import log_exception
+
+
+PASSWORD_METHOD = 'pbkdf2:sha256' # same as signup
+
+_EMAIL_RE = re.compile(r'^[^@\s]+@[^@\s]+\.[^@\s]+$')
+_HASH_RE = re.compile(r'^(pbkdf2:sha256|pbkdf2:sha512|scrypt)(:[\d:]+)?\$[^$]+\$[0-9a-f]+$')
+
+
+class ImportReport:
+    ''' What an import did: created users, and the rows it skipped with the reason '''
+
+    MAX_ERRORS = 1000 # kept in the report, the count goes on
+
+    def __init__(self):
+        self.created = 0
+        self.skipped = 0
+        self.errors = [] # (line, message)
+
+    def skip(self, line: int, message: str) -> None:
+        self.skipped += 1
+        if len(self.errors) < self.MAX_ERRORS:
+            self.errors.append((line, message))
+
+    def __repr__(self):
+        return f'<ImportReport created: {self.created}, skipped: {self.skipped}>'
+
+
+def read_rows(stream, fmt: str):
+    """
+    Yields (line number, row dict) from a text stream.
+
+    Args:
+        stream: A text file object.
+        fmt (str): 'csv' or 'jsonl'.
+    """
+    if fmt == 'csv':
+        reader = csv.DictReader(stream)
+        for row in reader:
+            yield reader.line_num, row
+    elif fmt == 'jsonl':
+        for line_no, line in enumerate(stream, 1):
+            if not line.strip():
+                continue
+            try:
+                row = json.loads(line)
+            except ValueError:
+                row = None
+            yield line_no, row if isinstance(row, dict) else {'_invalid': 'not a JSON object'}
+    else:
+        raise ValueError(f'Unknown import format {fmt!r}, expected csv or jsonl')
+
+
+def _chunks(rows, size):
+    chunk = []
+    for row in rows:
+        chunk.append(row)
+        if len(chunk) >= size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def _hash_password(password: str) -> str:
+    # runs in the pool's worker processes
+    return generate_password_hash(password, PASSWORD_METHOD)
+
+
+def _clean(value) -> str:
+    return str(value).strip() if value is not None else ''
+
+
+class UserImporter:
+    """
+    Args:
+        default_role (RoleNames): For rows without a role.
+        notify (bool): Queue a welcome (or new admin) email for every imported user.
+        dry_run (bool): Validate and hash, but roll every chunk back.
+        workers (int): Hashing processes, defaults to USER_IMPORT_WORKERS or the number of cores.
+        chunk_size (int): Rows per chunk, defaults to USER_IMPORT_CHUNK_SIZE.
+        importer_roles (iterable): The role names of the user importing, rows with a role
+            above theirs are skipped. None (e.g. from the command line) allows every role.
+        executor_class: ProcessPoolExecutor, or ThreadPoolExecutor where forking isn't
+            welcome (PBKDF2 releases the GIL, so threads hash in parallel too).
+    """
+
+    def __init__(self, default_role: RoleNames = RoleNames.CUSTOMER, notify: bool = False, dry_run: bool = False, workers: int = None, chunk_size: int = None,
+                 importer_roles=None, executor_class=ProcessPoolExecutor):
+        config = current_app.config
+        self.default_role = default_role
+        self.notify = notify
+        self.dry_run = dry_run
+        self.workers = workers or config['USER_IMPORT_WORKERS'] or os.cpu_count() or 1
+        self.chunk_size = chunk_size or config['USER_IMPORT_CHUNK_SIZE']
+        self.importer_roles = frozenset(importer_roles) if importer_roles is not None else None
+        self.executor_class = executor_class
+        self.report = ImportReport()
+        self._seen_emails = set()
+        self._seen_usernames = set()
+
+    def validate(self, chunk: list) -> list:
+        """
+        The valid rows of a chunk, normalized, as (line, user dict, role id, password) tuples.
+        """
+        candidates = []
+        for line, row in chunk:
+            if '_invalid' in row:
+                self.report.skip(line, row['_invalid'])
+                continue
+            email = _clean(row.get('email'))
+            username = _clean(row.get('username'))
+            role_value = _clean(row.get('role')) or self.default_role.value
+            role = RoleNames.get_member_by_value(role_value)
+            password, password_hash = _clean(row.get('password')), _clean(row.get('password_hash'))
+
+            if not _EMAIL_RE.match(email) or len(email) > 255:
+                self.report.skip(line, f'invalid email {email!r}')
+            elif not 2 <= len(username) <= 50:
+                self.report.skip(line, f'invalid username {username!r}')
+            elif role is None or role_registry.id(role) is None:
+                self.report.skip(line, f'unknown role {role_value!r}')
+            elif self.importer_roles is not None and not can_grant_role(self.importer_roles, role):
+                self.report.skip(line, f'role {role_value!r} is above your own')
+            elif password_hash and not _HASH_RE.match(password_hash):
+                self.report.skip(line, 'password_hash is not a werkzeug password hash')
+            elif email.lower() in self._seen_emails:
+                self.report.skip(line, f'duplicate email {email} in the file')
+            elif username in self._seen_usernames:
+                self.report.skip(line, f'duplicate username {username} in the file')
+            else:
+                self._seen_emails.add(email.lower())
+                self._seen_usernames.add(username)
+                user = {
+                    'email': email, 'username': username, 'thePassword': password_hash or None,
+                    'firstname': _clean(row.get('firstname')) or None, 'lastname': _clean(row.get('lastname')) or None,
+                    'phone': _clean(row.get('phone')) or None,
+                    'country': _clean(row.get('country')) or None, 'state': _clean(row.get('state')) or None,
+                    'role': role,
+                }
+                candidates.append((line, user, role_registry.id(role), password if not password_hash else None))
+
+        return self._drop_taken(candidates)
+
+    def _drop_taken(self, candidates: list) -> list:
+        # the candidates whose email (case-insensitive, like the in-file check) and username are free, one query for the whole chunk
+        if not candidates:
+            return []
+        emails = [user['email'].lower() for _, user, _, _ in candidates]
+        usernames = [user['username'] for _, user, _, _ in candidates]
+        taken = db.session.execute(
+            select(func.lower(AppUser.email), AppUser.username).where(or_(func.lower(AppUser.email).in_(emails), AppUser.username.in_(usernames)))
+        ).all()
+        db.session.rollback() # don't hold the read transaction while the chunk is hashed
+        taken_emails = {email for email, _ in taken}
+        taken_usernames = {username for _, username in taken}
+
+        valid = []
+        for candidate in candidates:
+            line, user = candidate[0], candidate[1]
+            if user['email'].lower() in taken_emails:
+                self.report.skip(line, f"email {user['email']} already registered")
+            elif user['username'] in taken_usernames:
+                self.report.skip(line, f"username {user['username']} already taken")
+            else:
+                valid.append(candidate)
+        return valid
+
+    def insert(self, valid: list, hashes) -> None:
+        ''' Inserts a validated chunk, `hashes` are the hashes of its passwords in order '''
+        for (line, user, role_id, password), password_hash in zip(valid, hashes):
+            if password_hash is not None:
+                user['thePassword'] = password_hash
+
+        while valid:
+            try:
+                return self._insert(valid)
+            except IntegrityError:
+                # a user signed up with one of the emails or usernames since the chunk was validated,
+                # validate it again instead of giving up on the rest of the import
+                still_valid = self._drop_taken(valid)
+                if len(still_valid) == len(valid): # not a taken email or username
+                    raise
+                valid = still_valid
+
+    def _insert(self, valid: list) -> None:
+        users = [user for _, user, _, _ in valid]
+        try:
+            user_ids = db.session.scalars(
+                insert(AppUser).returning(AppUser.id, sort_by_parameter_order=True),
+                [{'email': user['email'], 'username': user['username'], 'thePassword': user['thePassword']} for user in users],
+            ).all()
+            db.session.execute(insert(Profile), [
+                {'user_id': user_id, 'firstname': user['firstname'], 'lastname': user['lastname'], 'phone': user['phone']}
+                for user_id, user in zip(user_ids, users)
+            ])
+            db.session.execute(insert(Address), [
+                {'user_id': user_id, 'country': user['country'], 'state': user['state']}
+                for user_id, user in zip(user_ids, users)
+            ])
+            db.session.execute(insert(user_roles), [
+                {'user_id': user_id, 'role_id': role_id} for user_id, (_, _, role_id, _) in zip(user_ids, valid)
+            ])
+            if self.notify:
+                db.session.execute(insert(EmailOutbox), [
+                    {
+                        'email_type': (EmailType.WELCOME if user['role'] is RoleNames.CUSTOMER else EmailType.NEW_ADMIN).value,
+                        'recipient': user['email'],
+                        'context': {'username': user['username']},
+                    }
+                    for user in users
+                ])
+            if self.dry_run:
+                db.session.rollback()
+            else:
+                db.session.commit()
+                invalidate_user_identities(user_ids) # ids of deleted users may be reused
+        except Exception:
+            db.session.rollback()
+            raise
+        self.report.created += len(users)
+
+    def run(self, rows) -> ImportReport:
+        """
+        Imports the (line, row) pairs of `read_rows`.
+
+        The passwords of a chunk are submitted to the pool as soon as it is
+        validated, and the chunk is inserted after the next one is validated
+        and submitted, so the workers keep hashing while the database inserts.
+        """
+        pending = None # (valid rows, hash results iterator) of the chunk waiting to be inserted
+        with self.executor_class(max_workers=self.workers) as pool:
+            for chunk in _chunks(rows, self.chunk_size):
+                valid = self.validate(chunk)
+                passwords = [password for _, _, _, password in valid if password]
+                chunksize = max(1, len(passwords) // (self.workers * 4))
+                results = pool.map(_hash_password, passwords, chunksize=chunksize)
+
+                if pending:
+                    self.insert(*pending)
+                pending = (valid, self._hashes(valid, results)) if valid else None
+            if pending:
+                self.insert(*pending)
+        return self.report
+
+    @staticmethod
+    def _hashes(valid, results):
+        # one hash per row, None for rows without a password to hash
+        for _, _, _, password in valid:
+            yield next(results) if password else None
+
+
+def import_users(stream, fmt: str, **options) -> ImportReport:
+    """
+    Imports users from a text stream, see UserImporter for the options.
+
+    Returns:
+        ImportReport: The number of users created and the rows skipped.
+    """
+    return UserImporter(**options).run(read_rows(stream, fmt))
+
+
+def import_format(filename: str) -> str:
+    ''' The import format of a file from its extension '''
+    return 'jsonl' if filename.lower().endswith(('.jsonl', '.ndjson', '.json')) else 'csv'
+
+
+_IMPORT_ID_RE = re.compile(r'^[0-9a-f]{32}$')
+
+def _status_path(import_id: str) -> str:
+    return os.path.join(current_app.config['USER_IMPORT_DIR'], f'{import_id}.json')
+
+def _write_status(import_id: str, status: dict) -> None:
+    path = _status_path(import_id)
+    with open(f'{path}.tmp', 'w') as file:
+        json.dump(status, file)
+    os.replace(f'{path}.tmp', path) # readers never see a half written file
+
+
+def start_import(upload, fmt: str, **options) -> str:
+    """
+    Saves an uploaded file and imports it in a background thread of this process,
+    hashing with USER_IMPORT_WEB_WORKERS threads, so the request returns at once.
+
+    Chunks are committed as they go: if the process stops, the users of the
+    chunks before are kept and the status stays 'running'.
+
+    Args:
+        upload (FileStorage): The uploaded file.
+        fmt (str): 'csv' or 'jsonl'.
+        **options: See UserImporter.
+
+    Returns:
+        str: The import id, for `import_status`.
+    """
+    import_id = uuid.uuid4().hex
+    os.makedirs(current_app.config['USER_IMPORT_DIR'], exist_ok=True)
+    path = os.path.join(current_app.config['USER_IMPORT_DIR'], f'{import_id}.{fmt}')
+    upload.save(path)
+    _write_status(import_id, {'state': 'running'})
+
+    options.update(workers=current_app.config['USER_IMPORT_WEB_WORKERS'], executor_class=ThreadPoolExecutor)
+    Thread(target=_run_import, args=(current_app._get_current_object(), import_id, path, fmt, options), daemon=True).start()
+    return import_id
+
+
+def _run_import(app, import_id: str, path: str, fmt: str, options: dict) -> None:
+    with app.app_context():
+        try:
+            with open(path, encoding='utf-8-sig') as stream:
+                report = import_users(stream, fmt, **options)
+            status = {'state': 'done', 'created': report.created, 'skipped': report.skipped, 'errors': sorted(report.errors)}
+        except UnicodeDecodeError:
+            status = {'state': 'failed', 'message': 'The file must be UTF-8 encoded.'}
+        except Exception as e:
+            log_exception('An exception occurred while importing users', e)
+            status = {'state': 'failed', 'message': 'The import failed, the chunks before the error were imported.'}
+        finally:
+            os.remove(path)
+            db.session.remove()
+        _write_status(import_id, status)
+
+
+def import_status(import_id: str):
+    ''' The status of an import started by `start_import`: its state, and once done its report. None for unknown ids '''
+    if not _IMPORT_ID_RE.match(import_id):
+        return None
+    try:
+        with open(_status_path(import_id)) as file:
+            return json.load(file)
+    except FileNotFoundError:
+        return None
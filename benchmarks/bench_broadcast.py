@@ -0,0 +1,83 @@
+"""
+Benchmark: memory and throughput of `run_broadcast` as the segment grows.
+
+Seeds N users (a third of them customers in Nigeria) into a temporary SQLite
+database, then runs a broadcast to the 'Customer' + 'Nigeria' segment with the
+rate limit off, through a connection that discards the messages, for growing
+prefixes of the users. Reports the recipients, the emails selected, rendered and
+serialized per second, and the peak Python memory (tracemalloc) of the run.
+
+Usage:
+    python benchmarks/bench_broadcast.py [N]
+
+Author: Emmanuel Olowu
+Link: https://github.com/zeddyemy
+Copyright: © 2024 Emmanuel Olowu <zeddyemy@gmail.com>
+License: MIT, see LICENSE for more details.
+Package: BitnShop
+"""
+import os, sys, tempfile, time, tracemalloc
+from datetime import datetime
+
+os.environ['DATABASE_URL'] = f'sqlite:///{os.path.join(tempfile.mkdtemp(), "bench.db")}'
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app import create_app
+from app.extensions import db
+from app.models import AppUser, Address, Role, RoleNames, Broadcast, user_roles
+from app.utils.broadcast import run_broadcast
+from app.utils.helpers.role_helpers import create_roles_and_super_admin
+
+
+class NullConnection:
+    def __init__(self):
+        self.sent = 0
+
+    def send(self, mail):
+        self.sent += 1
+
+    def close(self):
+        pass
+
+
+def seed(first_id, last_id):
+    customer = Role.query.filter_by(name=RoleNames.CUSTOMER).first()
+    now = datetime.utcnow()
+    for start in range(first_id, last_id + 1, 10000):
+        ids = range(start, min(start + 10000, last_id + 1))
+        db.session.execute(AppUser.__table__.insert(), [{'id': i, 'email': f'user{i}@example.com', 'username': f'user{i}', 'date_joined': now} for i in ids])
+        db.session.execute(Address.__table__.insert(), [{'user_id': i, 'country': 'Nigeria' if i % 3 == 0 else 'Ghana'} for i in ids])
+        db.session.execute(user_roles.insert(), [{'user_id': i, 'role_id': customer.id} for i in ids])
+    db.session.commit()
+
+
+def main():
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 300000
+    app = create_app()
+    with app.app_context():
+        db.create_all()
+        create_roles_and_super_admin()
+        offset = db.session.scalar(db.select(db.func.max(AppUser.id))) or 0
+        seeded = 0
+
+        print(f'{"users":>8} {"recipients":>11} {"seconds":>8} {"emails/s":>9} {"peak memory":>12}')
+        for users in (n // 30, n // 3, n):
+            seed(offset + seeded + 1, offset + users)
+            seeded = users
+            broadcast = Broadcast(subject='Weekend sale', message='Everything is 20% off.\n\nThis weekend only.',
+                                  segment={'roles': ['Customer'], 'countries': ['nigeria']})
+            db.session.add(broadcast)
+            db.session.commit()
+
+            connection = NullConnection()
+            tracemalloc.start()
+            start = time.perf_counter()
+            run_broadcast(broadcast, connection, batch_size=1000, rate=0)
+            elapsed = time.perf_counter() - start
+            peak = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+            print(f'{users:>8} {connection.sent:>11} {elapsed:>8.2f} {connection.sent / elapsed:>9.0f} {peak / 1e6:>9.1f} MB')
+
+
+if __name__ == '__main__':
+    main()
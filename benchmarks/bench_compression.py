@@ -0,0 +1,89 @@
+"""
+Benchmark: bytes saved and CPU cost of ``CompressionMiddleware``.
+
+Renders a few real responses (the /shop page with a seeded catalog, the login page
+and a JSON list of products) through the app, then replays each body through the
+middleware N times per encoding, as one buffered body and as a stream of 4 KB
+chunks, and reports the compressed size and the CPU time per request.
+
+Usage:
+    python benchmarks/bench_compression.py [N]
+
+Author: Emmanuel Olowu
+Link: https://github.com/zeddyemy
+Copyright: © 2024 Emmanuel Olowu <zeddyemy@gmail.com>
+License: MIT, see LICENSE for more details.
+Package: BitnShop
+"""
+import os, sys, json, tempfile, time
+
+DB_FILE = os.path.join(tempfile.mkdtemp(), 'bench.db')
+os.environ['DATABASE_URL'] = f'sqlite:///{DB_FILE}'
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app import create_app
+from app.extensions import db
+from app.models import Category, Product, ProductStatus
+from app.utils.middleware import CompressionMiddleware, brotli
+
+
+def seed(n_products=60):
+    categories = [Category(name=f'Category {i}', slug=f'category-{i}') for i in range(8)]
+    db.session.add_all(categories)
+    for i in range(n_products):
+        product = Product(name=f'Product {i}', slug=f'product-{i}', selling_price=1000 + i * 75, actual_price=1500 + i * 75,
+                          description='A sturdy, everyday product with a longer description. ' * 3, pub_status=ProductStatus.PUBLISHED.value)
+        product.categories = [categories[i % len(categories)]]
+        db.session.add(product)
+    db.session.commit()
+
+
+def replay(body: bytes, content_type: str, encoding: str, chunked: bool, n: int):
+    chunks = [body[i:i + 4096] for i in range(0, len(body), 4096)] if chunked else [body]
+
+    def app(environ, start_response):
+        headers = [('Content-Type', content_type)]
+        if not chunked:
+            headers.append(('Content-Length', str(len(body))))
+        start_response('200 OK', headers)
+        return iter(chunks)
+
+    middleware = CompressionMiddleware(app)
+    environ = {'REQUEST_METHOD': 'GET', 'HTTP_ACCEPT_ENCODING': encoding}
+    start_response = lambda status, headers, exc_info=None: None
+
+    start = time.process_time()
+    for _ in range(n):
+        size = sum(len(chunk) for chunk in middleware(environ, start_response))
+    return size, (time.process_time() - start) / n
+
+
+def main():
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    app = create_app()
+    with app.app_context():
+        db.create_all()
+        seed()
+        products_json = json.dumps([product.to_dict() for product in Product.query.all()]).encode()
+
+    client = app.test_client()
+    samples = [
+        ('/shop', client.get('/shop').data, 'text/html; charset=utf-8'),
+        ('/login', client.get('/login').data, 'text/html; charset=utf-8'),
+        ('products json', products_json, 'application/json'),
+    ]
+    encodings = ['gzip'] + (['br'] if brotli is not None else [])
+
+    print(f'{"response":<14} {"mode":<9} {"enc":<5} {"bytes":>8} {"sent":>8} {"saved":>7} {"cpu/request":>12}')
+    for label, body, content_type in samples:
+        for chunked in (False, True):
+            for encoding in encodings:
+                size, cpu = replay(body, content_type, encoding, chunked, n)
+                mode = 'streamed' if chunked else 'buffered'
+                print(f'{label:<14} {mode:<9} {encoding:<5} {len(body):>8} {size:>8} {1 - size / len(body):>6.1%} {cpu * 1e6:>9.0f} us')
+    if brotli is None:
+        print('brotli is not installed, only gzip was measured.')
+
+
+if __name__ == '__main__':
+    main()
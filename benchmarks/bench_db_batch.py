@@ -0,0 +1,60 @@
+"""
+Benchmark: transactions issued by the model helpers with and without ``db_batch()``.
+
+Inserts N categories through ``Category.insert()`` against a throwaway SQLite file,
+once committing per object (the default) and once inside a single ``db_batch()``,
+and reports the number of COMMITs and the wall time of each run.
+
+Usage:
+    python benchmarks/bench_db_batch.py [N]
+
+Author: Emmanuel Olowu
+Link: https://github.com/zeddyemy
+Copyright: © 2024 Emmanuel Olowu <zeddyemy@gmail.com>
+License: MIT, see LICENSE for more details.
+Package: BitnShop
+"""
+import os, sys, tempfile, time
+
+DB_FILE = os.path.join(tempfile.mkdtemp(), 'bench.db')
+os.environ['DATABASE_URL'] = f'sqlite:///{DB_FILE}'
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import event
+
+from app import create_app
+from app.extensions import db
+from app.models import Category
+from app.utils.unit_of_work import db_batch
+
+
+def run(label, n, batched):
+    commits = []
+    listener = lambda conn: commits.append(1)
+    event.listen(db.engine, 'commit', listener)
+    
+    start = time.perf_counter()
+    if batched:
+        with db_batch():
+            for i in range(n):
+                Category(name=f'{label} {i}', slug=f'{label}-{i}').insert()
+    else:
+        for i in range(n):
+            Category(name=f'{label} {i}', slug=f'{label}-{i}').insert()
+    elapsed = time.perf_counter() - start
+    
+    event.remove(db.engine, 'commit', listener)
+    print(f'{label:<10} {n:>6} inserts  {len(commits):>6} commits  {elapsed * 1000:>9.1f} ms')
+
+
+def main():
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 1000
+    app = create_app()
+    with app.app_context():
+        db.create_all()
+        run('per-object', n, batched=False)
+        run('db_batch', n, batched=True)
+
+
+if __name__ == '__main__':
+    main()
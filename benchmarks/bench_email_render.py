@@ -0,0 +1,49 @@
+"""
+Benchmark: full Jinja render per email vs the precompiled render plans.
+
+Renders N personalized credit alerts with `render_email` (the whole template
+through Jinja each time) and with `build_emails` (one Jinja render, then a join
+of the static parts with each recipient's values), checks that both produce the
+same html and reports the messages rendered per second.
+
+Usage:
+    python benchmarks/bench_email_render.py [N]
+
+Author: Emmanuel Olowu
+Link: https://github.com/zeddyemy
+Copyright: © 2024 Emmanuel Olowu <zeddyemy@gmail.com>
+License: MIT, see LICENSE for more details.
+Package: BitnShop
+"""
+import os, sys, tempfile, time
+
+os.environ['DATABASE_URL'] = f'sqlite:///{os.path.join(tempfile.mkdtemp(), "bench.db")}'
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app import create_app
+from app.utils.helpers.mail_helpers import render_email, build_emails, EMAIL_SPECS, EmailType
+
+
+def main():
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+    app = create_app()
+    spec = EMAIL_SPECS[EmailType.CREDIT]
+    recipients = [{'user_email': f'user{i}@example.com', 'username': f'user<{i}>', 'amount': f'N{i * 25:,}'} for i in range(n)]
+
+    with app.app_context():
+        start = time.perf_counter()
+        jinja = [render_email(spec.template, redirect_link=spec.redirect_link, **recipient) for recipient in recipients]
+        jinja_seconds = time.perf_counter() - start
+
+        start = time.perf_counter()
+        planned = [html for _, _, html in build_emails(EmailType.CREDIT, recipients)]
+        plan_seconds = time.perf_counter() - start
+
+    assert jinja == planned, 'the render plan output differs from Jinja'
+    print(f'{"renderer":<16} {"emails":>7} {"seconds":>8} {"emails/s":>10}')
+    print(f'{"jinja per email":<16} {n:>7} {jinja_seconds:>8.3f} {n / jinja_seconds:>10.0f}')
+    print(f'{"render plan":<16} {n:>7} {plan_seconds:>8.3f} {n / plan_seconds:>10.0f}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,109 @@
+"""
+Benchmark: one thread and SMTP connection per email vs ``MailWorkerPool``.
+
+Starts a local aiosmtpd server (``pip install aiosmtpd``) that accepts and counts
+messages, then sends N emails with each strategy and reports the time until the
+server received all of them, the throughput, the SMTP connections opened and the
+peak number of sending threads.
+
+Usage:
+    python benchmarks/bench_mail_pool.py [N]
+
+Author: Emmanuel Olowu
+Link: https://github.com/zeddyemy
+Copyright: © 2024 Emmanuel Olowu <zeddyemy@gmail.com>
+License: MIT, see LICENSE for more details.
+Package: BitnShop
+"""
+import os, sys, socket, smtplib, threading, time
+from email.message import EmailMessage
+from email.policy import SMTP
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+try:
+    from aiosmtpd.controller import Controller
+except ImportError:
+    sys.exit('aiosmtpd is required: pip install aiosmtpd')
+
+from app.utils.mail_pool import MailWorkerPool, OutgoingMail
+
+
+class CountingHandler:
+    def __init__(self):
+        self.messages = 0
+        self.connections = 0
+
+    async def handle_EHLO(self, server, session, envelope, hostname, responses):
+        self.connections += 1
+        session.host_name = hostname # required when overriding EHLO
+        return responses
+
+    async def handle_DATA(self, server, session, envelope):
+        self.messages += 1
+        return '250 OK'
+
+
+def make_mail(i):
+    msg = EmailMessage()
+    msg['Subject'], msg['From'], msg['To'] = f'Verify your email #{i}', 'shop@example.com', f'user{i}@example.com'
+    msg.set_content('<p>Your code is 123456.</p>\n' * 40, subtype='html')
+    return OutgoingMail('shop@example.com', [f'user{i}@example.com'], msg.as_bytes(policy=SMTP))
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def wait_for(handler, expected, timeout=60):
+    deadline = time.time() + timeout
+    while handler.messages < expected and time.time() < deadline:
+        time.sleep(0.005)
+
+
+def thread_per_email(host, port, mails):
+    peak = 0
+    def send(mail):
+        with smtplib.SMTP(host, port) as connection:
+            connection.sendmail(mail.sender, mail.recipients, mail.body)
+    for mail in mails:
+        threading.Thread(target=send, args=(mail,)).start()
+        peak = max(peak, threading.active_count() - 1)
+    return peak
+
+
+def worker_pool(host, port, mails, workers):
+    pool = MailWorkerPool(host, port, workers=workers, queue_size=200, submit_timeout=30)
+    for mail in mails:
+        pool.submit(mail)
+    pool.shutdown()
+    return workers
+
+
+def main():
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 500
+    mails = [make_mail(i) for i in range(n)]
+
+    print(f'{"strategy":<22} {"emails":>7} {"seconds":>8} {"emails/s":>9} {"connections":>12} {"peak threads":>13}')
+    for label, run in [
+        ('thread per email', lambda host, port: thread_per_email(host, port, mails)),
+        ('pool, 4 workers', lambda host, port: worker_pool(host, port, mails, 4)),
+        ('pool, 8 workers', lambda host, port: worker_pool(host, port, mails, 8)),
+    ]:
+        handler = CountingHandler()
+        controller = Controller(handler, hostname='127.0.0.1', port=free_port())
+        controller.start()
+        try:
+            start = time.perf_counter()
+            peak = run(controller.hostname, controller.port)
+            wait_for(handler, n)
+            elapsed = time.perf_counter() - start
+        finally:
+            controller.stop()
+        print(f'{label:<22} {handler.messages:>7} {elapsed:>8.2f} {handler.messages / elapsed:>9.0f} {handler.connections:>12} {peak:>13}')
+
+
+if __name__ == '__main__':
+    main()
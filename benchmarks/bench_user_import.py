@@ -0,0 +1,66 @@
+"""
+Benchmark: throughput of `flask users import` (utils.user_import).
+
+Imports N generated users without passwords into a temporary SQLite database,
+which measures the validation queries and bulk inserts alone, then hashes a
+sample of passwords with 1 worker and with one worker per core, and projects
+the time to import N users with passwords (hashing dominates, ~0.5s of
+PBKDF2 per password per core).
+
+Usage:
+    python benchmarks/bench_user_import.py [N] [PASSWORDS]
+
+Author: Emmanuel Olowu
+Link: https://github.com/zeddyemy
+Copyright: © 2024 Emmanuel Olowu <zeddyemy@gmail.com>
+License: MIT, see LICENSE for more details.
+Package: BitnShop
+"""
+import os, sys, tempfile, time
+
+os.environ['DATABASE_URL'] = f'sqlite:///{os.path.join(tempfile.mkdtemp(), "bench.db")}'
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app import create_app
+from app.extensions import db
+from app.models import AppUser
+from app.utils.user_import import UserImporter
+from app.utils.helpers.role_helpers import create_roles_and_super_admin
+
+
+def rows(n, start=0, password=None):
+    for i in range(start, start + n):
+        row = {'email': f'user{i}@example.com', 'username': f'user{i}', 'firstname': 'Ada', 'lastname': 'Obi', 'country': 'Nigeria'}
+        if password:
+            row['password'] = f'{password}{i}'
+        yield i + 2, row
+
+
+def main():
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    passwords = int(sys.argv[2]) if len(sys.argv) > 2 else 4 * (os.cpu_count() or 1)
+    app = create_app()
+    with app.app_context():
+        db.create_all()
+        create_roles_and_super_admin()
+
+        start = time.perf_counter()
+        report = UserImporter().run(rows(n))
+        elapsed = time.perf_counter() - start
+        print(f'{report.created} users without passwords imported in {elapsed:.2f}s ({report.created / elapsed:.0f} users/s)')
+
+        cores = os.cpu_count() or 1
+        hashes_per_second = {}
+        for workers in sorted({1, cores}):
+            start = time.perf_counter()
+            report = UserImporter(workers=workers, dry_run=True).run(rows(passwords, start=n, password='pass'))
+            hashes_per_second[workers] = report.created / (time.perf_counter() - start)
+            print(f'{passwords} passwords hashed with {workers} worker(s): {hashes_per_second[workers]:.1f} users/s')
+
+        best = hashes_per_second[max(hashes_per_second)]
+        print(f'projected time for {n} users with passwords on {cores} core(s): {n / best / 60:.0f} min')
+        print(f'users in the database: {db.session.scalar(db.select(db.func.count(AppUser.id)))}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,24 @@
+"""app user date joined index
+
+Revision ID: 0d6f3a8e5b21
+Revises: e8c4b2d6a1f5
+Create Date: 2024-05-10 08:36:11.592046
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '0d6f3a8e5b21'
+down_revision = 'e8c4b2d6a1f5'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_index(op.f('ix_app_user_date_joined'), 'app_user', ['date_joined'], unique=False)
+
+
+def downgrade():
+    op.drop_index(op.f('ix_app_user_date_joined'), table_name='app_user')
@@ -0,0 +1,30 @@
+"""category updated_at and updated_at indexes for conditional GET
+
+Revision ID: 1c7d4e9b2a36
+Revises: f5a91c3d7e08
+Create Date: 2024-04-28 16:42:09.187254
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '1c7d4e9b2a36'
+down_revision = 'f5a91c3d7e08'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column('category', sa.Column('updated_at', sa.DateTime(), nullable=True))
+    op.execute("UPDATE category SET updated_at = date_created")
+    
+    op.create_index(op.f('ix_category_updated_at'), 'category', ['updated_at'], unique=False)
+    op.create_index(op.f('ix_product_updated_at'), 'product', ['updated_at'], unique=False)
+
+
+def downgrade():
+    op.drop_index(op.f('ix_product_updated_at'), table_name='product')
+    op.drop_index(op.f('ix_category_updated_at'), table_name='category')
+    op.drop_column('category', 'updated_at')
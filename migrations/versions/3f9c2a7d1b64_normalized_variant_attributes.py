@@ -0,0 +1,135 @@
+"""normalized variant attributes
+
+Revision ID: 3f9c2a7d1b64
+Revises: 0566074979be
+Create Date: 2024-04-20 10:12:31.402117
+
+"""
+from itertools import product as cartesian_product
+
+from alembic import op
+import sqlalchemy as sa
+from slugify import slugify
+
+
+# revision identifiers, used by Alembic.
+revision = '3f9c2a7d1b64'
+down_revision = '0566074979be'
+branch_labels = None
+depends_on = None
+
+
+def _split_values(raw):
+    """Splits the free-form 'S, M, L' strings stored on product.sizes / product.colors"""
+    if not raw:
+        return []
+    
+    values = []
+    for value in raw.split(','):
+        value = value.strip()
+        if value and value not in values:
+            values.append(value)
+    return values
+
+
+def upgrade():
+    op.create_table('product_attribute',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('name', sa.String(length=50), nullable=False),
+    sa.Column('slug', sa.String(length=50), nullable=False),
+    sa.PrimaryKeyConstraint('id'),
+    sa.UniqueConstraint('name'),
+    sa.UniqueConstraint('slug')
+    )
+    op.create_table('attribute_value',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('attribute_id', sa.Integer(), nullable=False),
+    sa.Column('value', sa.String(length=100), nullable=False),
+    sa.Column('slug', sa.String(length=100), nullable=False),
+    sa.ForeignKeyConstraint(['attribute_id'], ['product_attribute.id'], ),
+    sa.PrimaryKeyConstraint('id'),
+    sa.UniqueConstraint('attribute_id', 'slug', name='uq_attribute_value_attribute_id_slug')
+    )
+    op.create_table('variation_attribute_value',
+    sa.Column('variation_id', sa.Integer(), nullable=False),
+    sa.Column('attribute_value_id', sa.Integer(), nullable=False),
+    sa.ForeignKeyConstraint(['attribute_value_id'], ['attribute_value.id'], ),
+    sa.ForeignKeyConstraint(['variation_id'], ['product_variations.id'], ),
+    sa.PrimaryKeyConstraint('variation_id', 'attribute_value_id')
+    )
+    op.create_index('ix_variation_attribute_value_value_id', 'variation_attribute_value', ['attribute_value_id', 'variation_id'], unique=False)
+    
+    op.add_column('product_variations', sa.Column('stock', sa.Integer(), nullable=True))
+    op.create_index(op.f('ix_product_variations_product_id'), 'product_variations', ['product_id'], unique=False)
+    op.create_index('ix_product_category_category_id', 'product_category', ['category_id', 'product_id'], unique=False)
+    op.create_index('ix_product_pub_status_selling_price', 'product', ['pub_status', 'selling_price'], unique=False)
+    
+    # Backfill the normalized tables from the free-form product.sizes / product.colors strings
+    conn = op.get_bind()
+    product = sa.table('product',
+        sa.column('id', sa.Integer), sa.column('selling_price', sa.Integer),
+        sa.column('sizes', sa.String), sa.column('colors', sa.String))
+    variations = sa.table('product_variations',
+        sa.column('id', sa.Integer), sa.column('product_id', sa.Integer),
+        sa.column('name', sa.String), sa.column('selling_price', sa.Integer))
+    attribute = sa.table('product_attribute',
+        sa.column('id', sa.Integer), sa.column('name', sa.String), sa.column('slug', sa.String))
+    attribute_value = sa.table('attribute_value',
+        sa.column('id', sa.Integer), sa.column('attribute_id', sa.Integer),
+        sa.column('value', sa.String), sa.column('slug', sa.String))
+    variation_attribute_value = sa.table('variation_attribute_value',
+        sa.column('variation_id', sa.Integer), sa.column('attribute_value_id', sa.Integer))
+    
+    attribute_ids = {}
+    for name in ('Size', 'Color'):
+        attribute_ids[name] = conn.execute(
+            attribute.insert().values(name=name, slug=slugify(name)).returning(attribute.c.id)
+        ).scalar_one()
+    
+    value_ids = {}
+    def get_value_id(attribute_name, value):
+        key = (attribute_name, slugify(value))
+        if key not in value_ids:
+            value_ids[key] = conn.execute(
+                attribute_value.insert()
+                .values(attribute_id=attribute_ids[attribute_name], value=value, slug=key[1])
+                .returning(attribute_value.c.id)
+            ).scalar_one()
+        return value_ids[key]
+    
+    products_with_variations = {row.product_id for row in conn.execute(sa.select(variations.c.product_id).distinct())}
+    rows = conn.execute(
+        sa.select(product.c.id, product.c.selling_price, product.c.sizes, product.c.colors)
+        .where(sa.or_(product.c.sizes.isnot(None), product.c.colors.isnot(None)))
+    )
+    for row in rows:
+        if row.id in products_with_variations:
+            continue
+        
+        sizes = [('Size', value) for value in _split_values(row.sizes)] or [None]
+        colors = [('Color', value) for value in _split_values(row.colors)] or [None]
+        for combination in cartesian_product(sizes, colors):
+            pairs = [pair for pair in combination if pair]
+            if not pairs:
+                continue
+            
+            variation_id = conn.execute(
+                variations.insert()
+                .values(product_id=row.id, name=' / '.join(value for _, value in pairs), selling_price=row.selling_price)
+                .returning(variations.c.id)
+            ).scalar_one()
+            conn.execute(variation_attribute_value.insert(), [
+                {'variation_id': variation_id, 'attribute_value_id': get_value_id(attribute_name, value)}
+                for attribute_name, value in pairs
+            ])
+
+
+def downgrade():
+    op.drop_index('ix_product_pub_status_selling_price', table_name='product')
+    op.drop_index('ix_product_category_category_id', table_name='product_category')
+    op.drop_index(op.f('ix_product_variations_product_id'), table_name='product_variations')
+    op.drop_column('product_variations', 'stock')
+    op.drop_index('ix_variation_attribute_value_value_id', table_name='variation_attribute_value')
+    op.drop_table('variation_attribute_value')
+    op.drop_table('attribute_value')
+    op.drop_table('product_attribute')
@@ -0,0 +1,34 @@
+"""media content hash and metadata
+
+Revision ID: 4a0f8d2c6b73
+Revises: 9e4b2f6a0d15
+Create Date: 2024-04-29 17:03:28.441907
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '4a0f8d2c6b73'
+down_revision = '9e4b2f6a0d15'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column('media', sa.Column('sha256', sa.String(length=64), nullable=True))
+    op.add_column('media', sa.Column('size', sa.BigInteger(), nullable=True))
+    op.add_column('media', sa.Column('mime_type', sa.String(length=100), nullable=True))
+    op.add_column('media', sa.Column('width', sa.Integer(), nullable=True))
+    op.add_column('media', sa.Column('height', sa.Integer(), nullable=True))
+    op.create_unique_constraint('uq_media_sha256', 'media', ['sha256'])
+
+
+def downgrade():
+    op.drop_constraint('uq_media_sha256', 'media', type_='unique')
+    op.drop_column('media', 'height')
+    op.drop_column('media', 'width')
+    op.drop_column('media', 'mime_type')
+    op.drop_column('media', 'size')
+    op.drop_column('media', 'sha256')
@@ -0,0 +1,24 @@
+"""app user is active
+
+Revision ID: 5c9e1f4a7d30
+Revises: 0d6f3a8e5b21
+Create Date: 2024-05-11 14:05:38.217460
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '5c9e1f4a7d30'
+down_revision = '0d6f3a8e5b21'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column('app_user', sa.Column('is_active', sa.Boolean(), nullable=False, server_default=sa.true()))
+
+
+def downgrade():
+    op.drop_column('app_user', 'is_active')
@@ -0,0 +1,59 @@
+"""category materialized path
+
+Revision ID: 5d8a0b3e7c21
+Revises: c41d7e2a9f03
+Create Date: 2024-04-24 11:37:19.504286
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '5d8a0b3e7c21'
+down_revision = 'c41d7e2a9f03'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column('category', sa.Column('path', sa.String(length=255), nullable=True))
+    op.add_column('category', sa.Column('depth', sa.Integer(), nullable=False, server_default='0'))
+    
+    # Backfill the paths from the existing parent_id adjacency list
+    conn = op.get_bind()
+    category = sa.table('category',
+        sa.column('id', sa.Integer), sa.column('parent_id', sa.Integer),
+        sa.column('path', sa.String), sa.column('depth', sa.Integer))
+    
+    parents = dict(conn.execute(sa.select(category.c.id, category.c.parent_id)).all())
+    paths = {}
+    def build_path(cat_id, seen=()):
+        if cat_id not in paths:
+            parent_id = parents.get(cat_id)
+            if parent_id is None or parent_id in seen or parent_id not in parents:
+                paths[cat_id] = f'/{cat_id}/'
+            else:
+                paths[cat_id] = f'{build_path(parent_id, seen + (cat_id,))}{cat_id}/'
+        return paths[cat_id]
+    
+    updates = []
+    for cat_id in parents:
+        path = build_path(cat_id)
+        updates.append({'row_id': cat_id, 'new_path': path, 'new_depth': path.count('/') - 2})
+    
+    if updates:
+        conn.execute(
+            category.update().where(category.c.id == sa.bindparam('row_id'))
+            .values(path=sa.bindparam('new_path'), depth=sa.bindparam('new_depth')),
+            updates
+        )
+    
+    op.alter_column('category', 'depth', server_default=None)
+    op.create_index('ix_category_path', 'category', ['path'], unique=False, postgresql_ops={'path': 'varchar_pattern_ops'})
+
+
+def downgrade():
+    op.drop_index('ix_category_path', table_name='category', postgresql_ops={'path': 'varchar_pattern_ops'})
+    op.drop_column('category', 'depth')
+    op.drop_column('category', 'path')
@@ -0,0 +1,36 @@
+"""one time codes
+
+Revision ID: 7f3c0a9e2d14
+Revises: d3a8f1c5e9b2
+Create Date: 2024-05-06 09:21:45.660132
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '7f3c0a9e2d14'
+down_revision = 'd3a8f1c5e9b2'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('one_time_code',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('purpose', sa.String(length=20), nullable=False),
+    sa.Column('identifier', sa.String(length=255), nullable=False),
+    sa.Column('code_hash', sa.String(length=64), nullable=False),
+    sa.Column('attempts', sa.Integer(), nullable=False),
+    sa.Column('expires_at', sa.DateTime(), nullable=False),
+    sa.Column('created_at', sa.DateTime(), nullable=False),
+    sa.PrimaryKeyConstraint('id'),
+    sa.UniqueConstraint('purpose', 'identifier', name='uq_one_time_code_purpose_identifier')
+    )
+    op.create_index(op.f('ix_one_time_code_expires_at'), 'one_time_code', ['expires_at'], unique=False)
+
+
+def downgrade():
+    op.drop_index(op.f('ix_one_time_code_expires_at'), table_name='one_time_code')
+    op.drop_table('one_time_code')
@@ -0,0 +1,47 @@
+"""time ordered product uuids
+
+Revision ID: 8b1e4c0f5a92
+Revises: 3f9c2a7d1b64
+Create Date: 2024-04-21 09:41:07.118530
+
+"""
+from datetime import timezone
+from alembic import op
+import sqlalchemy as sa
+
+from app.utils.ids import uuid7
+
+
+# revision identifiers, used by Alembic.
+revision = '8b1e4c0f5a92'
+down_revision = '3f9c2a7d1b64'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Every existing product got the same import-time uuid4 default, so give each row
+    # its own time-ordered UUIDv7 derived from when the product was created.
+    conn = op.get_bind()
+    product = sa.table('product',
+        sa.column('id', sa.Integer), sa.column('uuid', sa.String), sa.column('date_created', sa.DateTime))
+    
+    rows = conn.execute(sa.select(product.c.id, product.c.date_created).order_by(product.c.id)).all()
+    updates = []
+    last_ms = 0
+    for row in rows:
+        # date_created is naive UTC, .timestamp() alone would read it as local time
+        created_ms = int(row.date_created.replace(tzinfo=timezone.utc).timestamp() * 1000) if row.date_created else 0
+        last_ms = max(last_ms + 1, created_ms) # keep the ids in insertion order
+        updates.append({'row_id': row.id, 'new_uuid': str(uuid7(last_ms))})
+    
+    if updates:
+        conn.execute(
+            product.update().where(product.c.id == sa.bindparam('row_id')).values(uuid=sa.bindparam('new_uuid')),
+            updates
+        )
+
+
+def downgrade():
+    # the backfilled identifiers stay valid uuids, nothing to undo
+    pass
@@ -0,0 +1,36 @@
+"""media variants
+
+Revision ID: 9e4b2f6a0d15
+Revises: 1c7d4e9b2a36
+Create Date: 2024-04-29 11:20:51.803642
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '9e4b2f6a0d15'
+down_revision = '1c7d4e9b2a36'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('media_variant',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('media_id', sa.Integer(), nullable=False),
+    sa.Column('format', sa.String(length=10), nullable=False),
+    sa.Column('width', sa.Integer(), nullable=False),
+    sa.Column('height', sa.Integer(), nullable=False),
+    sa.Column('size', sa.Integer(), nullable=False),
+    sa.Column('path', sa.String(length=256), nullable=False),
+    sa.Column('created_at', sa.DateTime(), nullable=False),
+    sa.ForeignKeyConstraint(['media_id'], ['media.id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('id'),
+    sa.UniqueConstraint('media_id', 'format', 'width', name='uq_media_variant_media_format_width')
+    )
+
+
+def downgrade():
+    op.drop_table('media_variant')
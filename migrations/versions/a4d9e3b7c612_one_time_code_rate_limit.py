@@ -0,0 +1,32 @@
+"""one time code rate limit
+
+Revision ID: a4d9e3b7c612
+Revises: 5c9e1f4a7d30
+Create Date: 2024-05-12 09:47:21.534806
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'a4d9e3b7c612'
+down_revision = '5c9e1f4a7d30'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column('one_time_code', sa.Column('issue_count', sa.Integer(), nullable=False, server_default='1'))
+    op.add_column('one_time_code', sa.Column('window_started_at', sa.DateTime(), nullable=True))
+
+    # The window of the existing codes starts when they were issued
+    code = sa.table('one_time_code', sa.column('created_at', sa.DateTime), sa.column('window_started_at', sa.DateTime))
+    op.get_bind().execute(code.update().values(window_started_at=code.c.created_at))
+
+    op.alter_column('one_time_code', 'window_started_at', existing_type=sa.DateTime(), nullable=False)
+
+
+def downgrade():
+    op.drop_column('one_time_code', 'window_started_at')
+    op.drop_column('one_time_code', 'issue_count')
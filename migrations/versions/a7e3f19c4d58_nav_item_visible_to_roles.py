@@ -0,0 +1,24 @@
+"""nav item visible_to roles
+
+Revision ID: a7e3f19c4d58
+Revises: 5d8a0b3e7c21
+Create Date: 2024-04-25 16:20:44.871302
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'a7e3f19c4d58'
+down_revision = '5d8a0b3e7c21'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column('navigation_bar_item', sa.Column('visible_to', sa.String(length=255), nullable=True))
+
+
+def downgrade():
+    op.drop_column('navigation_bar_item', 'visible_to')
@@ -0,0 +1,43 @@
+"""cascade product association deletes
+
+Revision ID: c41d7e2a9f03
+Revises: 8b1e4c0f5a92
+Create Date: 2024-04-22 14:05:52.630981
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c41d7e2a9f03'
+down_revision = '8b1e4c0f5a92'
+branch_labels = None
+depends_on = None
+
+
+# (table, column, referred table) of every foreign key that should follow its parent row
+CASCADED_FKS = [
+    ('product_category', 'product_id', 'product'),
+    ('product_category', 'category_id', 'category'),
+    ('product_tag', 'product_id', 'product'),
+    ('product_tag', 'tag_id', 'tag'),
+    ('product_variations', 'product_id', 'product'),
+    ('variation_attribute_value', 'variation_id', 'product_variations'),
+    ('variation_attribute_value', 'attribute_value_id', 'attribute_value'),
+]
+
+
+def _recreate_fks(ondelete):
+    for table, column, referred_table in CASCADED_FKS:
+        name = f'{table}_{column}_fkey' # PostgreSQL's default name for the unnamed constraints
+        op.drop_constraint(name, table, type_='foreignkey')
+        op.create_foreign_key(name, table, referred_table, [column], ['id'], ondelete=ondelete)
+
+
+def upgrade():
+    _recreate_fks('CASCADE')
+
+
+def downgrade():
+    _recreate_fks(None)
@@ -0,0 +1,43 @@
+"""broadcast emails and user segment indexes
+
+Revision ID: d3a8f1c5e9b2
+Revises: 6b2e9d4a1f80
+Create Date: 2024-05-04 14:36:02.918254
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'd3a8f1c5e9b2'
+down_revision = '6b2e9d4a1f80'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('broadcast',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('subject', sa.String(length=200), nullable=False),
+    sa.Column('message', sa.Text(), nullable=False),
+    sa.Column('email_type', sa.String(length=50), nullable=False),
+    sa.Column('segment', sa.JSON(), nullable=False),
+    sa.Column('status', sa.String(length=20), nullable=False),
+    sa.Column('total', sa.Integer(), nullable=True),
+    sa.Column('sent_count', sa.Integer(), nullable=False),
+    sa.Column('failed_count', sa.Integer(), nullable=False),
+    sa.Column('last_user_id', sa.Integer(), nullable=False),
+    sa.Column('created_at', sa.DateTime(), nullable=False),
+    sa.Column('started_at', sa.DateTime(), nullable=True),
+    sa.Column('finished_at', sa.DateTime(), nullable=True),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index('ix_user_roles_user_id_role_id', 'user_roles', ['user_id', 'role_id'], unique=False)
+    op.create_index(op.f('ix_address_user_id'), 'address', ['user_id'], unique=False)
+
+
+def downgrade():
+    op.drop_index(op.f('ix_address_user_id'), table_name='address')
+    op.drop_index('ix_user_roles_user_id_role_id', table_name='user_roles')
+    op.drop_table('broadcast')
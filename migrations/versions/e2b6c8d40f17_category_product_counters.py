@@ -0,0 +1,41 @@
+"""category product counters
+
+Revision ID: e2b6c8d40f17
+Revises: a7e3f19c4d58
+Create Date: 2024-04-27 12:58:03.265419
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'e2b6c8d40f17'
+down_revision = 'a7e3f19c4d58'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column('category', sa.Column('product_count', sa.Integer(), nullable=False, server_default='0'))
+    op.add_column('category', sa.Column('subtree_product_count', sa.Integer(), nullable=False, server_default='0'))
+    
+    # Backfill, same statements as `flask recount`
+    op.execute("""
+        UPDATE category SET product_count = (
+            SELECT count(*) FROM product_category
+            JOIN product ON product.id = product_category.product_id
+            WHERE product_category.category_id = category.id AND product.pub_status = 'published'
+        )
+    """)
+    op.execute("""
+        UPDATE category SET subtree_product_count = (
+            SELECT coalesce(sum(descendant.product_count), 0) FROM category AS descendant
+            WHERE descendant.path LIKE category.path || '%'
+        )
+    """)
+
+
+def downgrade():
+    op.drop_column('category', 'subtree_product_count')
+    op.drop_column('category', 'product_count')
@@ -0,0 +1,48 @@
+"""profile referral codes and counters
+
+Revision ID: e8c4b2d6a1f5
+Revises: b5e1d7a3c962
+Create Date: 2024-05-09 10:12:54.803417
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+from app.utils.ids import referral_code
+
+
+# revision identifiers, used by Alembic.
+revision = 'e8c4b2d6a1f5'
+down_revision = 'b5e1d7a3c962'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column('profile', sa.Column('referral_code', sa.String(length=12), nullable=True))
+    op.add_column('profile', sa.Column('referrer_id', sa.Integer(), nullable=True))
+    op.add_column('profile', sa.Column('referral_count', sa.Integer(), nullable=False, server_default='0'))
+
+    # Backfill the codes of the existing profiles from their user ids
+    conn = op.get_bind()
+    profile = sa.table('profile', sa.column('id', sa.Integer), sa.column('user_id', sa.Integer), sa.column('referral_code', sa.String))
+    rows = conn.execute(sa.select(profile.c.id, profile.c.user_id)).all()
+    if rows:
+        conn.execute(
+            profile.update().where(profile.c.id == sa.bindparam('row_id')).values(referral_code=sa.bindparam('code')),
+            [{'row_id': row.id, 'code': referral_code(row.user_id)} for row in rows]
+        )
+
+    op.alter_column('profile', 'referral_code', existing_type=sa.String(length=12), nullable=False)
+    op.create_index(op.f('ix_profile_referral_code'), 'profile', ['referral_code'], unique=True)
+    op.create_index(op.f('ix_profile_referrer_id'), 'profile', ['referrer_id'], unique=False)
+    op.create_foreign_key('profile_referrer_id_fkey', 'profile', 'app_user', ['referrer_id'], ['id'], ondelete='SET NULL')
+
+
+def downgrade():
+    op.drop_constraint('profile_referrer_id_fkey', 'profile', type_='foreignkey')
+    op.drop_index(op.f('ix_profile_referrer_id'), table_name='profile')
+    op.drop_index(op.f('ix_profile_referral_code'), table_name='profile')
+    op.drop_column('profile', 'referral_count')
+    op.drop_column('profile', 'referrer_id')
+    op.drop_column('profile', 'referral_code')
@@ -0,0 +1,30 @@
+"""catalog browse indexes and product updated_at
+
+Revision ID: f5a91c3d7e08
+Revises: e2b6c8d40f17
+Create Date: 2024-04-28 10:14:37.512093
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'f5a91c3d7e08'
+down_revision = 'e2b6c8d40f17'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column('product', sa.Column('updated_at', sa.DateTime(), nullable=True))
+    op.execute("UPDATE product SET updated_at = date_created")
+    
+    op.create_index('ix_product_pub_status_id', 'product', ['pub_status', 'id'], unique=False)
+    op.create_index('ix_product_catalog_price', 'product', ['pub_status', sa.text('coalesce(selling_price, 0)'), 'id'], unique=False)
+
+
+def downgrade():
+    op.drop_index('ix_product_catalog_price', table_name='product')
+    op.drop_index('ix_product_pub_status_id', table_name='product')
+    op.drop_column('product', 'updated_at')